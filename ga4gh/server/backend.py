@@ -6,10 +6,16 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import functools
+import json
+import math
+
 import ga4gh.server.datamodel as datamodel
+import ga4gh.server.datamodel.continuous as continuous
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.paging as paging
 import ga4gh.server.response_builder as response_builder
+import ga4gh.server.response_cache as response_cache
 
 import ga4gh.schemas.protocol as protocol
 
@@ -24,6 +30,11 @@ class Backend(object):
         self._defaultPageSize = 100
         self._maxResponseLength = 2**20  # 1 MiB
         self._dataRepository = dataRepository
+        # The metadata served is immutable for the lifetime of the data
+        # repository, and so of this backend
+        self._responseCache = response_cache.ResponseCache()
+        self._exportCheckpointInterval = 1000
+        self._exportChunkSize = 2**16  # 64 KiB
 
     def getDataRepository(self):
         """
@@ -50,6 +61,26 @@ class Backend(object):
         """
         self._maxResponseLength = maxResponseLength
 
+    def setResponseCacheMaxSize(self, size):
+        """
+        Sets the maximum number of responses in the cache of metadata
+        responses; a size of 0 disables it.
+        """
+        self._responseCache.setMaxCacheSize(size)
+
+    def setExportCheckpointInterval(self, exportCheckpointInterval):
+        """
+        Sets the number of objects between the page tokens that exports
+        can be resumed from.
+        """
+        self._exportCheckpointInterval = exportCheckpointInterval
+
+    def getResponseCache(self):
+        """
+        Returns the cache of metadata responses
+        """
+        return self._responseCache
+
     def startProfile(self):
         """
         Profiling hook. Called at the start of the runSearchRequest method
@@ -121,6 +152,31 @@ class Backend(object):
         return self._protocolObjectGenerator(
             request, len(objectList), lambda index: objectList[index])
 
+    def _protocolPageGenerator(self, request, getPageMethod):
+        """
+        Returns a generator over the results for the specified request,
+        which are fetched a page at a time by calls to the specified method.
+        This method must take an offset and a limit and return a list of at
+        most limit protocol objects starting at that offset. One object more
+        than the page size is fetched so that we know whether there is a
+        next page without counting the results.
+        """
+        currentIndex = 0
+        if request.page_token:
+            currentIndex, = paging._parsePageToken(
+                request.page_token, 1)
+        pageSize = request.page_size or self._defaultPageSize
+        while True:
+            objects = getPageMethod(currentIndex, pageSize + 1)
+            for index, object_ in enumerate(objects[:pageSize]):
+                currentIndex += 1
+                nextPageToken = None
+                if index + 1 < len(objects):
+                    nextPageToken = str(currentIndex)
+                yield object_, nextPageToken
+            if len(objects) <= pageSize:
+                break
+
     def _objectListGenerator(self, request, objectList):
         """
         Returns a generator over the objects in the specified list using
@@ -363,10 +419,13 @@ class Backend(object):
             request, variantAnnotationSet)
         return iterator
 
-    def featuresGenerator(self, request):
+    def featuresGenerator(self, request, depth=1, prefix=False):
         """
         Returns a generator over the (features, nextPageToken) pairs
-        defined by the (JSON string) request.
+        defined by the (JSON string) request. When the request has a
+        parent_id, depth is the number of levels of its subtree to
+        return; 0 returns the whole subtree. When prefix is set, the
+        request's name and gene_symbol are case-insensitive prefixes.
         """
         compoundId = None
         parentId = None
@@ -399,13 +458,15 @@ class Backend(object):
             compoundId.dataset_id)
         featureSet = dataset.getFeatureSet(compoundId.feature_set_id)
         iterator = paging.FeaturesIterator(
-            request, featureSet, parentId)
+            request, featureSet, parentId, depth, prefix)
         return iterator
 
-    def continuousGenerator(self, request):
+    def continuousGenerator(
+            self, request, binSize=None, numBins=None, summaryType='mean'):
         """
         Returns a generator over the (continuous, nextPageToken) pairs
-        defined by the (JSON string) request.
+        defined by the (JSON string) request. If binSize or numBins is
+        given, values are summaries of bins of the requested range.
         """
         compoundId = None
         if request.continuous_set_id != "":
@@ -417,7 +478,8 @@ class Backend(object):
         dataset = self.getDataRepository().getDataset(
             compoundId.dataset_id)
         continuousSet = dataset.getContinuousSet(request.continuous_set_id)
-        iterator = paging.ContinuousIterator(request, continuousSet)
+        iterator = paging.ContinuousIterator(
+            request, continuousSet, binSize, numBins, summaryType)
         return iterator
 
     def phenotypesGenerator(self, request):
@@ -425,32 +487,34 @@ class Backend(object):
         Returns a generator over the (phenotypes, nextPageToken) pairs
         defined by the (JSON string) request
         """
-        # TODO make paging work using SPARQL?
         compoundId = datamodel.PhenotypeAssociationSetCompoundId.parse(
             request.phenotype_association_set_id)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         phenotypeAssociationSet = dataset.getPhenotypeAssociationSet(
             compoundId.phenotypeAssociationSetId)
-        associations = phenotypeAssociationSet.getAssociations(request)
-        phenotypes = [association.phenotype for association in associations]
-        return self._protocolListGenerator(
-            request, phenotypes)
+
+        def getPage(offset, limit):
+            associations = phenotypeAssociationSet.getAssociations(
+                request, offset=offset, limit=limit)
+            return [association.phenotype for association in associations]
+        return self._protocolPageGenerator(request, getPage)
 
     def genotypesPhenotypesGenerator(self, request):
         """
         Returns a generator over the (phenotypes, nextPageToken) pairs
         defined by the (JSON string) request
         """
-        # TODO make paging work using SPARQL?
         compoundId = datamodel.PhenotypeAssociationSetCompoundId.parse(
             request.phenotype_association_set_id)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         phenotypeAssociationSet = dataset.getPhenotypeAssociationSet(
             compoundId.phenotypeAssociationSetId)
         featureSets = dataset.getFeatureSets()
-        annotationList = phenotypeAssociationSet.getAssociations(
-            request, featureSets)
-        return self._protocolListGenerator(request, annotationList)
+
+        def getPage(offset, limit):
+            return phenotypeAssociationSet.getAssociations(
+                request, featureSets, offset, limit)
+        return self._protocolPageGenerator(request, getPage)
 
     def callSetsGenerator(self, request):
         """
@@ -568,14 +632,20 @@ class Backend(object):
     def runGetRequest(self, obj):
         """
         Runs a get request by converting the specified datamodel
-        object into its protocol representation.
-        """
-        protocolElement = obj.toProtocolElement()
-        jsonString = protocol.toJson(protocolElement)
+        object into its protocol representation. The response is
+        cached, and returned as a response_cache.SerializedResponse.
+        """
+        cacheKey = ("get", type(obj).__name__, obj.getId())
+        jsonString = self._responseCache.get(cacheKey)
+        if jsonString is None:
+            protocolElement = obj.toProtocolElement()
+            jsonString = self._responseCache.put(
+                cacheKey, protocol.toJson(protocolElement))
         return jsonString
 
     def runSearchRequest(
-            self, requestStr, requestClass, responseClass, objectGenerator):
+            self, requestStr, requestClass, responseClass, objectGenerator,
+            cacheable=False):
         """
         Runs the specified request. The request is a string containing
         a JSON representation of an instance of the specified requestClass.
@@ -584,6 +654,8 @@ class Backend(object):
         using the specified object generator, which must return
         (object, nextPageToken) pairs, and be able to resume iteration from
         any point using the nextPageToken attribute of the request object.
+        The responses of cacheable (metadata) searches are cached, and
+        returned as response_cache.SerializedResponse objects.
         """
         self.startProfile()
         try:
@@ -595,6 +667,13 @@ class Backend(object):
             request.page_size = self._defaultPageSize
         if request.page_size < 0:
             raise exceptions.BadPageSizeException(request.page_size)
+        if cacheable:
+            # The JSON form of the parsed request is canonical
+            cacheKey = (requestClass.__name__, protocol.toJson(request))
+            responseString = self._responseCache.get(cacheKey)
+            if responseString is not None:
+                self.endProfile()
+                return responseString
         responseBuilder = response_builder.SearchResponseBuilder(
             responseClass, request.page_size, self._maxResponseLength)
         nextPageToken = None
@@ -604,9 +683,54 @@ class Backend(object):
                 break
         responseBuilder.setNextPageToken(nextPageToken)
         responseString = responseBuilder.getSerializedResponse()
+        if cacheable:
+            responseString = self._responseCache.put(cacheKey, responseString)
         self.endProfile()
         return responseString
 
+    def runExportRequest(self, requestStr, requestClass, objectGenerator):
+        """
+        Runs the specified request as an export. Rather than a page, all
+        the objects defined by the request are returned, from a single
+        pass of the specified object generator, as an iterator over
+        chunks of newline-delimited JSON. Objects are only drawn from the
+        generator as the chunks are consumed.
+
+        Every exportCheckpointInterval objects a {"nextPageToken": token}
+        line gives the page token from which an export of the same
+        request resumes after the objects before it. The export ends
+        with a line whose token is empty, so a client can tell a complete
+        export from one that was cut off.
+        """
+        try:
+            request = protocol.fromJson(requestStr, requestClass)
+        except protocol.json_format.ParseError:
+            raise exceptions.InvalidJsonException(requestStr)
+        # A page size of 0 asks the iterators for all the objects
+        request.page_size = 0
+        # The generator is created here, so that bad requests are
+        # rejected before the response starts
+        return self._exportObjects(objectGenerator(request))
+
+    def _exportObjects(self, objects):
+        chunk = []
+        chunkSize = 0
+        numObjects = 0
+        for obj, nextPageToken in objects:
+            line = protocol.toJson(obj) + "\n"
+            numObjects += 1
+            if (numObjects % self._exportCheckpointInterval == 0 and
+                    nextPageToken is not None):
+                line += json.dumps({"nextPageToken": nextPageToken}) + "\n"
+            chunk.append(line)
+            chunkSize += len(line)
+            if chunkSize >= self._exportChunkSize:
+                yield "".join(chunk)
+                chunk = []
+                chunkSize = 0
+        chunk.append(json.dumps({"nextPageToken": ""}) + "\n")
+        yield "".join(chunk)
+
     def runListReferenceBases(self, requestJson):
         """
         Runs a listReferenceBases request for the specified ID and
@@ -865,6 +989,27 @@ class Backend(object):
         rnaQuantificationSet = dataset.getRnaQuantificationSet(id_)
         return self.runGetRequest(rnaQuantificationSet)
 
+    def runGetExpressionMatrix(self, id_, names):
+        """
+        Runs a request for the expression of the specified feature names
+        in each RnaQuantification of the RnaQuantificationSet with the
+        specified ID. The response holds the RnaQuantification IDs, the
+        names and a row of values for each RnaQuantification, with null
+        where it has no value for a name.
+        """
+        compoundId = datamodel.RnaQuantificationSetCompoundId.parse(id_)
+        dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
+        rnaQuantificationSet = dataset.getRnaQuantificationSet(id_)
+        matrix = rnaQuantificationSet.getExpressionMatrix(names)
+        return json.dumps({
+            "rnaQuantificationIds": [
+                rnaQuantification.getId() for rnaQuantification in
+                rnaQuantificationSet.getRnaQuantifications()],
+            "names": names,
+            "values": [
+                [None if math.isnan(value) else value for value in row]
+                for row in matrix.tolist()]})
+
     def runGetExpressionLevel(self, id_):
         """
         Runs a getExpressionLevel request for the specified ID.
@@ -887,7 +1032,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchReadGroupSetsRequest,
             protocol.SearchReadGroupSetsResponse,
-            self.readGroupSetsGenerator)
+            self.readGroupSetsGenerator, cacheable=True)
 
     def runSearchIndividuals(self, request):
         """
@@ -896,7 +1041,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchIndividualsRequest,
             protocol.SearchIndividualsResponse,
-            self.individualsGenerator)
+            self.individualsGenerator, cacheable=True)
 
     def runSearchBiosamples(self, request):
         """
@@ -905,7 +1050,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchBiosamplesRequest,
             protocol.SearchBiosamplesResponse,
-            self.biosamplesGenerator)
+            self.biosamplesGenerator, cacheable=True)
 
     def runSearchReads(self, request):
         """
@@ -916,6 +1061,13 @@ class Backend(object):
             protocol.SearchReadsResponse,
             self.readsGenerator)
 
+    def runExportReads(self, request):
+        """
+        Exports all the reads defined by the specified SearchReadsRequest.
+        """
+        return self.runExportRequest(
+            request, protocol.SearchReadsRequest, self.readsGenerator)
+
     def runSearchReferenceSets(self, request):
         """
         Runs the specified SearchReferenceSetsRequest.
@@ -923,7 +1075,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchReferenceSetsRequest,
             protocol.SearchReferenceSetsResponse,
-            self.referenceSetsGenerator)
+            self.referenceSetsGenerator, cacheable=True)
 
     def runSearchReferences(self, request):
         """
@@ -932,7 +1084,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchReferencesRequest,
             protocol.SearchReferencesResponse,
-            self.referencesGenerator)
+            self.referencesGenerator, cacheable=True)
 
     def runSearchVariantSets(self, request):
         """
@@ -941,7 +1093,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchVariantSetsRequest,
             protocol.SearchVariantSetsResponse,
-            self.variantSetsGenerator)
+            self.variantSetsGenerator, cacheable=True)
 
     def runSearchVariantAnnotationSets(self, request):
         """
@@ -950,7 +1102,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchVariantAnnotationSetsRequest,
             protocol.SearchVariantAnnotationSetsResponse,
-            self.variantAnnotationSetsGenerator)
+            self.variantAnnotationSetsGenerator, cacheable=True)
 
     def runSearchVariants(self, request):
         """
@@ -961,6 +1113,14 @@ class Backend(object):
             protocol.SearchVariantsResponse,
             self.variantsGenerator)
 
+    def runExportVariants(self, request):
+        """
+        Exports all the variants defined by the specified
+        SearchVariantsRequest.
+        """
+        return self.runExportRequest(
+            request, protocol.SearchVariantsRequest, self.variantsGenerator)
+
     def runSearchVariantAnnotations(self, request):
         """
         Runs the specified SearchVariantAnnotationsRequest.
@@ -977,7 +1137,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchCallSetsRequest,
             protocol.SearchCallSetsResponse,
-            self.callSetsGenerator)
+            self.callSetsGenerator, cacheable=True)
 
     def runSearchDatasets(self, request):
         """
@@ -986,7 +1146,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchDatasetsRequest,
             protocol.SearchDatasetsResponse,
-            self.datasetsGenerator)
+            self.datasetsGenerator, cacheable=True)
 
     def runSearchFeatureSets(self, request):
         """
@@ -996,20 +1156,40 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchFeatureSetsRequest,
             protocol.SearchFeatureSetsResponse,
-            self.featureSetsGenerator)
+            self.featureSetsGenerator, cacheable=True)
 
-    def runSearchFeatures(self, request):
+    def runSearchFeatures(self, request, depth=1, prefix=False):
         """
         Returns a SearchFeaturesResponse for the specified
         SearchFeaturesRequest object.
 
         :param request: JSON string representing searchFeaturesRequest
+        :param depth: number of levels below the request's parent_id to
+            return, where 1 is the direct children and 0 the whole subtree
+        :param prefix: whether the request's name and gene_symbol match
+            case-insensitive prefixes rather than exact values
         :return: JSON string representing searchFeatureResponse
         """
+        if depth < 0:
+            raise exceptions.BadFeatureDepthException(depth)
         return self.runSearchRequest(
             request, protocol.SearchFeaturesRequest,
             protocol.SearchFeaturesResponse,
-            self.featuresGenerator)
+            functools.partial(
+                self.featuresGenerator, depth=depth, prefix=prefix))
+
+    def runExportFeatures(self, request, depth=1, prefix=False):
+        """
+        Exports all the features defined by the specified
+        SearchFeaturesRequest, with the same depth and prefix as
+        runSearchFeatures.
+        """
+        if depth < 0:
+            raise exceptions.BadFeatureDepthException(depth)
+        return self.runExportRequest(
+            request, protocol.SearchFeaturesRequest,
+            functools.partial(
+                self.featuresGenerator, depth=depth, prefix=prefix))
 
     def runSearchContinuousSets(self, request):
         """
@@ -1019,20 +1199,39 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchContinuousSetsRequest,
             protocol.SearchContinuousSetsResponse,
-            self.continuousSetsGenerator)
+            self.continuousSetsGenerator, cacheable=True)
 
-    def runSearchContinuous(self, request):
+    def runSearchContinuous(
+            self, request, binSize=None, numBins=None, summaryType='mean'):
         """
         Returns a SearchContinuousResponse for the specified
         SearchContinuousRequest object.
 
         :param request: JSON string representing searchContinuousRequest
+        :param binSize: if given, return a summary of each bin of this
+            many bases instead of base level values
+        :param numBins: if given, return summaries of this many bins
+            spanning the requested range
+        :param summaryType: the summary of each bin, one of
+            continuous.SUMMARY_TYPES
         :return: JSON string representing searchContinuousResponse
         """
+        if binSize is not None and numBins is not None:
+            raise exceptions.BadContinuousSummaryException(
+                "Only one of bin size and number of bins may be given")
+        for value in [binSize, numBins]:
+            if value is not None and value <= 0:
+                raise exceptions.BadContinuousSummaryException(
+                    "Bin size and number of bins must be positive")
+        if summaryType not in continuous.SUMMARY_TYPES:
+            raise exceptions.BadContinuousSummaryException(
+                "Unknown summary type '{}'".format(summaryType))
         return self.runSearchRequest(
             request, protocol.SearchContinuousRequest,
             protocol.SearchContinuousResponse,
-            self.continuousGenerator)
+            functools.partial(
+                self.continuousGenerator, binSize=binSize, numBins=numBins,
+                summaryType=summaryType))
 
     def runSearchGenotypePhenotypes(self, request):
         return self.runSearchRequest(
@@ -1050,7 +1249,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchPhenotypeAssociationSetsRequest,
             protocol.SearchPhenotypeAssociationSetsResponse,
-            self.phenotypeAssociationSetsGenerator)
+            self.phenotypeAssociationSetsGenerator, cacheable=True)
 
     def runSearchRnaQuantificationSets(self, request):
         """
@@ -1060,7 +1259,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchRnaQuantificationSetsRequest,
             protocol.SearchRnaQuantificationSetsResponse,
-            self.rnaQuantificationSetsGenerator)
+            self.rnaQuantificationSetsGenerator, cacheable=True)
 
     def runSearchRnaQuantifications(self, request):
         """
@@ -1070,7 +1269,7 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchRnaQuantificationsRequest,
             protocol.SearchRnaQuantificationsResponse,
-            self.rnaQuantificationsGenerator)
+            self.rnaQuantificationsGenerator, cacheable=True)
 
     def runSearchExpressionLevels(self, request):
         """
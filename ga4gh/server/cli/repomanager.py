@@ -47,6 +47,28 @@ def getNameFromPath(filePath):
     return ret
 
 
+def isGff3Path(filePath):
+    """
+    Returns True if the specified path names a (possibly compressed)
+    GFF3 file rather than a converted feature database.
+    """
+    for suffix in [".gz", ".bz2"]:
+        if filePath.endswith(suffix):
+            filePath = filePath[:-len(suffix)]
+    return os.path.splitext(filePath)[1] in [".gff3", ".gff"]
+
+
+def isContinuousTextPath(filePath):
+    """
+    Returns True if the specified path names a (possibly gzipped)
+    wiggle or bedGraph file rather than a bigWig or track file.
+    """
+    if filePath.endswith(".gz"):
+        filePath = filePath[:-len(".gz")]
+    return os.path.splitext(filePath)[1].lower() in [
+        ".wig", ".wiggle", ".bedgraph", ".bdg"]
+
+
 def getRawInput(display):
     """
     Wrapper around raw_input; put into separate function so that it
@@ -164,6 +186,11 @@ class RepoManager(object):
         ontology = ontologies.Ontology(name)
         ontology.populateFromFile(filePath)
         self._updateRepo(self._repo.insertOntology, ontology)
+        # compile the ontology so that the server need not parse it
+        cachePath = self._repo.getOntologyCachePath(name)
+        if not os.path.exists(os.path.dirname(cachePath)):
+            os.makedirs(os.path.dirname(cachePath))
+        ontology.writeCache(cachePath)
 
     def addDataset(self):
         """
@@ -330,6 +357,8 @@ class RepoManager(object):
         if name is None:
             name = getNameFromPath(self._args.dirPath)
         dataset = self._repo.getDatasetByName(self._args.datasetName)
+        if self._args.compile:
+            genotype_phenotype.compileRdfStore(self._args.dirPath)
         phenotypeAssociationSet = \
             genotype_phenotype.RdfPhenotypeAssociationSet(
                 dataset, name, self._args.dirPath)
@@ -405,15 +434,35 @@ class RepoManager(object):
             self._updateRepo(self._repo.removeDataset, dataset)
         self._confirmDelete("Dataset", dataset.getLocalId(), func)
 
+    def _importGff3(self, gff3Path):
+        """
+        Streams the specified GFF3 file into a new feature database and
+        returns the path of that database.
+        """
+        dbPath = self._args.featureDbPath
+        if dbPath is None:
+            dbPath = os.path.join(
+                os.path.dirname(gff3Path),
+                getNameFromPath(gff3Path) + ".db")
+        if os.path.exists(dbPath):
+            raise exceptions.RepoManagerException(
+                "Feature database '{}' already exists. Remove it or use "
+                "the --featureDbPath option.".format(dbPath))
+        importer = sequence_annotations.Gff3DbImporter(gff3Path, dbPath)
+        importer.run()
+        return dbPath
+
     def addFeatureSet(self):
         """
         Adds a new feature set into this repo
         """
         self._openRepo()
         dataset = self._repo.getDatasetByName(self._args.datasetName)
-        filePath = self._getFilePath(self._args.filePath,
-                                     self._args.relativePath)
         name = getNameFromPath(self._args.filePath)
+        dbPath = self._args.filePath
+        if isGff3Path(dbPath):
+            dbPath = self._importGff3(dbPath)
+        filePath = self._getFilePath(dbPath, self._args.relativePath)
         featureSet = sequence_annotations.Gff3DbFeatureSet(
             dataset, name)
         referenceSetName = self._args.referenceSetName
@@ -445,21 +494,49 @@ class RepoManager(object):
             self._updateRepo(self._repo.removeFeatureSet, featureSet)
         self._confirmDelete("FeatureSet", featureSet.getLocalId(), func)
 
+    def _importContinuous(self, sourcePath, referenceSet):
+        """
+        Converts the specified wiggle or bedGraph file into a new
+        continuous track file, with the reference lengths of the
+        specified reference set, and returns the path of that file.
+        """
+        trackPath = self._args.trackPath
+        if trackPath is None:
+            trackPath = os.path.join(
+                os.path.dirname(sourcePath),
+                getNameFromPath(sourcePath) + continuous.TRACK_EXTENSION)
+        if os.path.exists(trackPath):
+            raise exceptions.RepoManagerException(
+                "Continuous track '{}' already exists. Remove it or use "
+                "the --trackPath option.".format(trackPath))
+        referenceLengths = dict(
+            (reference.getName(), reference.getLength())
+            for reference in referenceSet.getReferences())
+        importer = continuous.ContinuousTrackImporter(
+            sourcePath, trackPath, referenceLengths)
+        importer.run()
+        return trackPath
+
     def addContinuousSet(self):
         """
         Adds a new continuous set into this repo
         """
         self._openRepo()
         dataset = self._repo.getDatasetByName(self._args.datasetName)
-        filePath = self._getFilePath(self._args.filePath,
-                                     self._args.relativePath)
-        name = getNameFromPath(self._args.filePath)
-        continuousSet = continuous.FileContinuousSet(dataset, name)
         referenceSetName = self._args.referenceSetName
         if referenceSetName is None:
             raise exceptions.RepoManagerException(
                 "A reference set name must be provided")
         referenceSet = self._repo.getReferenceSetByName(referenceSetName)
+        dataPath = self._args.filePath
+        if isContinuousTextPath(dataPath):
+            dataPath = self._importContinuous(dataPath, referenceSet)
+        filePath = self._getFilePath(dataPath, self._args.relativePath)
+        name = getNameFromPath(self._args.filePath)
+        if continuous.isTrackPath(filePath):
+            continuousSet = continuous.TrackContinuousSet(dataset, name)
+        else:
+            continuousSet = continuous.FileContinuousSet(dataset, name)
         continuousSet.setReferenceSet(referenceSet)
         continuousSet.populateFromFile(filePath)
         self._updateRepo(self._repo.insertContinuousSet, continuousSet)
@@ -559,6 +636,9 @@ class RepoManager(object):
 
         def func():
             self._updateRepo(self._repo.removeOntology, ontology)
+            cachePath = self._repo.getOntologyCachePath(ontology.getName())
+            if os.path.exists(cachePath):
+                os.unlink(cachePath)
         self._confirmDelete("Ontology", ontology.getName(), func)
 
     def addRnaQuantification(self):
@@ -588,6 +668,62 @@ class RepoManager(object):
             readGroupSetNames=self._args.readGroupSetName,
             biosampleId=biosampleId)
 
+    def _readRnaQuantificationManifest(self, dataset):
+        """
+        Returns the (name, quantificationFilePath, biosampleId) tuples
+        listed in the manifest file given on the command line. Each line
+        holds a name and a file path, relative to the manifest, with an
+        optional biosample name, separated by tabs.
+        """
+        manifestPath = self._args.manifestPath
+        manifestDir = os.path.dirname(manifestPath)
+        quantifications = []
+        with open(manifestPath) as manifest:
+            for lineNumber, line in enumerate(manifest, 1):
+                if line.strip() == "" or line.startswith("#"):
+                    continue
+                fields = line.rstrip("\r\n").split("\t")
+                if len(fields) not in (2, 3):
+                    raise exceptions.RepoManagerException(
+                        "Manifest '{}' line {}: expected a name, a file path "
+                        "and optionally a biosample name".format(
+                            manifestPath, lineNumber))
+                biosampleId = ""
+                if len(fields) == 3 and fields[2] != "":
+                    biosampleId = dataset.getBiosampleByName(
+                        fields[2]).getId()
+                quantifications.append((
+                    fields[0], os.path.join(manifestDir, fields[1]),
+                    biosampleId))
+        names = [name for name, _, _ in quantifications]
+        for name in names:
+            if names.count(name) > 1:
+                raise exceptions.DuplicateNameException(name, manifestPath)
+        return quantifications
+
+    def addRnaQuantifications(self):
+        """
+        Adds the rnaQuantifications listed in a manifest file into an
+        RNA quantification set, parsing the files in parallel
+        """
+        self._openRepo()
+        dataset = self._repo.getDatasetByName(self._args.datasetName)
+        quantifications = self._readRnaQuantificationManifest(dataset)
+        featureType = "gene"
+        if self._args.transcript:
+            featureType = "transcript"
+
+        def progress(numDone, numTotal, numRows, rowsPerSecond):
+            print(
+                "Loaded {}/{} quantifications: {} rows, {:.0f} rows/sec"
+                .format(numDone, numTotal, numRows, rowsPerSecond))
+        rnaseq2ga.bulkRnaseq2ga(
+            quantifications, self._args.filePath, self._args.format,
+            dataset=dataset, featureType=featureType,
+            description=self._args.description,
+            featureSetNames=self._args.featureSetNames,
+            processes=self._args.processes, progress=progress)
+
     def initRnaQuantificationSet(self):
         """
         Initialize an empty RNA quantification set
@@ -1024,7 +1160,14 @@ class RepoManager(object):
         cls.addFilePathArgument(
             addFeatureSetParser,
             "The path to the converted SQLite database containing Feature "
-            "data")
+            "data, or to a GFF3 file (optionally gzip or bzip2 compressed) "
+            "to convert")
+        addFeatureSetParser.add_argument(
+            "--featureDbPath", default=None,
+            help=(
+                "The path of the SQLite database to create when filePath "
+                "is a GFF3 file. Defaults to the GFF3 path with its "
+                "extensions replaced by '.db'."))
         cls.addReferenceSetNameOption(addFeatureSetParser, "feature set")
         cls.addSequenceOntologyNameOption(addFeatureSetParser, "feature set")
         cls.addClassNameOption(addFeatureSetParser, "feature set")
@@ -1047,7 +1190,16 @@ class RepoManager(object):
         cls.addRelativePathOption(addContinuousSetParser)
         cls.addFilePathArgument(
             addContinuousSetParser,
-            "The path to the file contianing the continuous data ")
+            "The path to the file contianing the continuous data: a "
+            "bigWig file, or a wiggle or bedGraph file to convert into "
+            "a track file")
+        addContinuousSetParser.add_argument(
+            "--trackPath", default=None,
+            help=(
+                "The path of the track file to create when filePath is a "
+                "wiggle or bedGraph file. Defaults to the input path with "
+                "its extensions replaced by '{}'.".format(
+                    continuous.TRACK_EXTENSION)))
         cls.addReferenceSetNameOption(addContinuousSetParser, "continuous set")
         cls.addClassNameOption(addContinuousSetParser, "continuous set")
 
@@ -1119,6 +1271,33 @@ class RepoManager(object):
         cls.addRnaFeatureTypeOption(addRnaQuantificationParser)
         cls.addAttributesArgument(addRnaQuantificationParser)
 
+        addRnaQuantificationsParser = common_cli.addSubparser(
+            subparsers, "add-rnaquantifications",
+            "Add many RNA quantifications to the data repo at once")
+        addRnaQuantificationsParser.set_defaults(
+            runner="addRnaQuantifications")
+        cls.addFilePathArgument(
+            addRnaQuantificationsParser,
+            "The path to the RNA SQLite database to create or modify")
+        addRnaQuantificationsParser.add_argument(
+            "manifestPath",
+            help=(
+                "The path to a tab separated file listing the name and "
+                "expression file path of each quantification, and "
+                "optionally its biosample name"))
+        cls.addRnaFormatArgument(addRnaQuantificationsParser)
+        cls.addRepoArgument(addRnaQuantificationsParser)
+        cls.addDatasetNameArgument(addRnaQuantificationsParser)
+        addRnaQuantificationsParser.add_argument(
+            "--featureSetNames", default=None, help="Comma separated list")
+        addRnaQuantificationsParser.add_argument(
+            "--processes", type=int, default=None,
+            help=(
+                "The number of processes parsing expression files. "
+                "Defaults to the number of CPUs."))
+        cls.addDescriptionOption(addRnaQuantificationsParser, objectType)
+        cls.addRnaFeatureTypeOption(addRnaQuantificationsParser)
+
         objectType = "RnaQuantificationSet"
         initRnaQuantificationSetParser = common_cli.addSubparser(
             subparsers, "init-rnaquantificationset",
@@ -1169,6 +1348,13 @@ class RepoManager(object):
         cls.addNameOption(
             addPhenotypeAssociationSetParser,
             "PhenotypeAssociationSet")
+        addPhenotypeAssociationSetParser.add_argument(
+            "-c", "--compile", default=False, action="store_true",
+            help=(
+                "Compile the ttl files into a persistent triple store, "
+                "'{}' in the same directory, which the server opens "
+                "instead of parsing the ttl files.".format(
+                    genotype_phenotype.RDF_STORE_FILENAME)))
         cls.addAttributesArgument(addPhenotypeAssociationSetParser)
 
         removePhenotypeAssociationSetParser = common_cli.addSubparser(
@@ -9,6 +9,7 @@ import requests
 
 import ga4gh.server.cli as cli
 import ga4gh.server.frontend as frontend
+import ga4gh.server.prefork as prefork
 
 import ga4gh.common.cli as common_cli
 
@@ -32,6 +33,29 @@ def addServerOptions(parser):
     parser.add_argument(
         "--dont-use-reloader", default=False, action="store_true",
         help="Don't use the flask reloader")
+    parser.add_argument(
+        "--workers", "-w", default=0, type=int,
+        help="Serve from this many forked worker processes, which share "
+        "the data loaded by the master process; 0 runs the flask "
+        "development server instead")
+    parser.add_argument(
+        "--threads", default=1, type=int,
+        help="The number of threads serving requests in each worker")
+    parser.add_argument(
+        "--bulk-threads", default=0, type=int,
+        help="Serve the endpoints reading bulk data (reads, variants, "
+        "features, ...) on a separate pool of this many threads in each "
+        "worker, so that slow queries do not hold up the metadata "
+        "endpoints, which are served by the --threads pool")
+    parser.add_argument(
+        "--max-requests", default=0, type=int,
+        help="Replace a worker after it has served this many requests; "
+        "0 never replaces workers")
+    parser.add_argument(
+        "--graceful-timeout", default=30, type=int,
+        help="The number of seconds workers have to finish the requests "
+        "they are serving when the server is stopped (SIGTERM) or "
+        "reloaded (SIGHUP)")
     cli.addVersionArgument(parser)
     cli.addDisableUrllibWarningsArgument(parser)
 
@@ -52,6 +76,20 @@ def server_main(args=None):
     sslContext = None
     if parsedArgs.tls or ("OIDC_PROVIDER" in frontend.app.config):
         sslContext = "adhoc"
+    if parsedArgs.workers > 0:
+        def reload():
+            frontend.configure(
+                parsedArgs.config_file, parsedArgs.config, parsedArgs.port)
+        server = prefork.PreforkServer(
+            frontend.app, parsedArgs.host, parsedArgs.port,
+            workers=parsedArgs.workers, threads=parsedArgs.threads,
+            maxRequests=parsedArgs.max_requests,
+            gracefulTimeout=parsedArgs.graceful_timeout,
+            sslContext=sslContext, reloadFunction=reload,
+            bulkThreads=parsedArgs.bulk_threads,
+            isBulkRequest=frontend.isBulkDataPath)
+        server.serveForever()
+        return
     frontend.app.run(
         host=parsedArgs.host, port=parsedArgs.port,
         use_reloader=not parsedArgs.dont_use_reloader,
@@ -0,0 +1,110 @@
+"""
+Negotiated compression of HTTP responses.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# The media types worth compressing
+COMPRESSIBLE_MIMETYPES = frozenset([
+    "application/json", "application/x-ndjson", "text/html", "text/plain"])
+
+
+def getAvailableEncodings():
+    """
+    Returns the content codings this server is able to produce.
+    """
+    encodings = [GZIP]
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    return encodings
+
+
+def negotiateEncoding(acceptEncodings, encodings):
+    """
+    Returns the first of the specified content codings, in order of
+    preference, that is available and that the client accepts according
+    to the specified werkzeug Accept object of its Accept-Encoding
+    header, or None if there is no such coding.
+    """
+    available = getAvailableEncodings()
+    for encoding in encodings:
+        # A quality of 0 means the client refuses the coding
+        if encoding in available and acceptEncodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+class _ZlibCompressor(object):
+    """
+    Adapts a zlib compression object to the interface of the zstandard
+    ones.
+    """
+    def __init__(self, level):
+        # A window size offset by 16 makes zlib write the gzip format
+        self._compressObject = zlib.compressobj(
+            level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data):
+        return self._compressObject.compress(data)
+
+    def flush(self):
+        return self._compressObject.flush()
+
+
+def _getCompressor(encoding, level):
+    if encoding == GZIP:
+        return _ZlibCompressor(level)
+    elif encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError("Unsupported content coding: {}".format(encoding))
+
+
+def compress(data, encoding, level):
+    """
+    Returns the specified bytes compressed with the specified content
+    coding at the specified level.
+    """
+    compressor = _getCompressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compressChunks(chunks, encoding, level):
+    """
+    Compresses the specified iterable of byte strings with the specified
+    content coding at the specified level, yielding the compressed data
+    as it becomes available, so that a streamed response is never held
+    in memory as a whole.
+    """
+    compressor = _getCompressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode("utf-8")
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def getEncodedEtag(etag, encoding):
+    """
+    Returns the strong entity tag of the specified encoding of the
+    representation with the specified entity tag, as strong tags must
+    differ between encodings.
+    """
+    return "{}-{}".format(etag, encoding)
@@ -11,6 +11,8 @@ import collections
 import glob
 import json
 import os
+import threading
+import weakref
 
 import ga4gh.server.exceptions as exceptions
 
@@ -89,9 +91,76 @@ class PysamFileHandleCache(object):
                 del self._memoTable[dataFile]
             return handle
 
+    def clear(self):
+        """
+        Closes all the file handles in the cache and empties it.
+        """
+        while len(self._cache) > 0:
+            self._removeLru()
+        self._memoTable.clear()
+
+
+class ThreadLocalFileHandleCache(object):
+    """
+    Gives each thread a PysamFileHandleCache of its own. A pysam file
+    handle holds a file position and decompression state, so concurrent
+    reads through a shared handle return each other's records.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # The caches of threads that exit are dropped with the thread,
+        # which closes their handles
+        self._caches = weakref.WeakSet()
+        self._maxCacheSize = 50
+
+    def setMaxCacheSize(self, size):
+        """
+        Sets the maximum size of the cache of each thread
+        """
+        if size <= 0:
+            raise ValueError(
+                "The size of the cache must be a strictly positive value")
+        with self._lock:
+            self._maxCacheSize = size
+            for cache in self._caches:
+                cache.setMaxCacheSize(size)
+
+    def getThreadCache(self):
+        """
+        Returns the PysamFileHandleCache of the calling thread
+        """
+        cache = getattr(self._local, "cache", None)
+        if cache is None:
+            cache = PysamFileHandleCache()
+            with self._lock:
+                cache.setMaxCacheSize(self._maxCacheSize)
+                self._caches.add(cache)
+            self._local.cache = cache
+        return cache
+
+    def getFileHandle(self, dataFile, openMethod):
+        """
+        Returns the calling thread's handle of the specified file, opening
+        it with openMethod if it has none.
+        """
+        return self.getThreadCache().getFileHandle(dataFile, openMethod)
+
+    def clear(self):
+        """
+        Closes the file handles of all the threads and empties their
+        caches. No other thread may be using its handles, as is the case
+        in a newly forked process.
+        """
+        with self._lock:
+            caches = list(self._caches)
+        for cache in caches:
+            cache.clear()
+
 
-# LRU cache of open file handles
-fileHandleCache = PysamFileHandleCache()
+# LRU caches of open file handles, one per thread
+fileHandleCache = ThreadLocalFileHandleCache()
 
 
 class CompoundId(object):
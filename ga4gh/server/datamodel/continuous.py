@@ -6,9 +6,15 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import gzip
+import json
+import os
 import random
 import re
-import math
+import struct
+
+import numpy
 
 # no step/span; requires numpy
 import pyBigWig
@@ -169,6 +175,66 @@ class WiggleReader:
             return self.wiggleFileHandleToProtocol(f)
 
 
+# summary types supported by pyBigWig's stats()
+SUMMARY_TYPES = ['mean', 'min', 'max', 'coverage', 'std']
+
+
+def _nonNanRuns(values):
+    """
+    Returns arrays of the (start, end) offsets of the runs of values
+    in the specified numpy array that are not NaN.
+    """
+    isValue = numpy.concatenate(([0], ~numpy.isnan(values), [0]))
+    edges = numpy.diff(isValue.astype(numpy.int8))
+    return numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1)
+
+
+def _resumePosition(start, end, pageStart, binSize=1):
+    """
+    Returns the position to read the range [start, end) from, given the
+    position taken from a page token, or None for the first page. Pages
+    resume at the start of an object, which always lies on a bin.
+    """
+    if pageStart is None:
+        return start
+    if not start <= pageStart < end or (pageStart - start) % binSize != 0:
+        raise exceptions.BadPageTokenException()
+    return pageStart
+
+
+def _segment(windows, maxValues, binSize=1):
+    """
+    Yields protocol objects holding the runs of non-NaN values in
+    the specified (windowStart, values) pairs, each value covering
+    binSize bases. Runs are split at maxValues values and continue
+    across windows.
+    """
+    data = protocol.Continuous()
+    for windowStart, values in windows:
+        for runStart, runEnd in zip(*_nonNanRuns(values)):
+            # a run continues the pending object only if it begins
+            # where that object ends, i.e. across a window boundary
+            dataEnd = data.start + len(data.values) * binSize
+            runPosition = windowStart + runStart * binSize
+            if len(data.values) > 0 and dataEnd != runPosition:
+                yield data
+                data = protocol.Continuous()
+            position = runStart
+            while position < runEnd:
+                if len(data.values) == 0:
+                    data.start = windowStart + position * binSize
+                count = min(runEnd - position, maxValues - len(data.values))
+                data.values.extend(
+                    values[position:position + count].tolist())
+                position += count
+                if len(data.values) == maxValues:
+                    yield data
+                    data = protocol.Continuous()
+
+    if len(data.values) > 0:
+        yield data
+
+
 class BigWigDataSource:
     """
     Class for reading from bigwig files.
@@ -195,7 +261,7 @@ class BigWigDataSource:
             return False
         return True
 
-    def readValuesPyBigWig(self, reference, start, end):
+    def readValuesPyBigWig(self, reference, start, end, pageStart=None):
         """
         Use pyBigWig package to read a BigWig file for the
         given range and return a protocol object.
@@ -204,17 +270,61 @@ class BigWigDataSource:
         Not sure if it is possible to get the step and span.
 
         This method trims NaN values from the start and end.
+        If pageStart is given, reading resumes from that position, which
+        must be the start of an object returned for the same range.
+        """
+        bw, start, end = self._openRange(reference, start, end)
+        start = _resumePosition(start, end, pageStart)
+        windows = (
+            (curStart, self._readValues(
+                bw, reference, curStart, min(curStart + self._INCREMENT, end)))
+            for curStart in xrange(start, end, self._INCREMENT))
+        for data in _segment(windows, self._MAX_VALUES):
+            yield data
+
+    def readSummariesPyBigWig(
+            self, reference, start, end, binSize=None, numBins=None,
+            summaryType='mean', pageStart=None):
+        """
+        Use pyBigWig package to summarise a BigWig file over bins of the
+        given range, answered from the file's zoom levels where possible.
+
+        Either binSize or numBins must be given; numBins is converted to
+        the bin size that covers the range in that many bins. Each value
+        of a returned protocol object summarises binSize bases, the i'th
+        starting at start + i * binSize, except that the last bin of the
+        range may be shorter. Bins without data are trimmed as NaN values
+        are in readValuesPyBigWig, and pageStart resumes reading as it
+        does there.
+        """
+        bw, start, end = self._openRange(reference, start, end)
+        if binSize is None:
+            binSize = -(-(end - start) // numBins)  # rounded up
+        start = _resumePosition(start, end, pageStart, binSize)
+        windowSize = binSize * self._MAX_VALUES
+        windows = (
+            (curStart, self._readSummaries(
+                bw, reference, curStart, min(curStart + windowSize, end),
+                binSize, summaryType))
+            for curStart in xrange(start, end, windowSize))
+        for data in _segment(windows, self._MAX_VALUES, binSize):
+            yield data
+
+    def _openRange(self, reference, start, end):
+        """
+        Returns the cached pyBigWig handle for this file together with
+        the query range clipped to the reference.
 
         pyBigWig throws an exception if end is outside of the
-        reference range. This function checks the query range
-        and throws its own exceptions to avoid the ones thrown
-        by pyBigWig.
+        reference range, so the range is checked here and our own
+        exceptions thrown instead.
         """
         if not self.checkReference(reference):
             raise exceptions.ReferenceNameNotFoundException(reference)
         if start < 0:
             start = 0
-        bw = pyBigWig.open(self._sourceFile)
+        bw = datamodel.fileHandleCache.getFileHandle(
+            self._sourceFile, pyBigWig.open)
         referenceLen = bw.chroms(reference)
         if referenceLen is None:
             raise exceptions.ReferenceNameNotFoundException(reference)
@@ -223,31 +333,37 @@ class BigWigDataSource:
         if start >= end:
             raise exceptions.ReferenceRangeErrorException(
                 reference, start, end)
+        return bw, start, end
 
-        data = protocol.Continuous()
-        curStart = start
-        curEnd = curStart + self._INCREMENT
-        while curStart < end:
-            if curEnd > end:
-                curEnd = end
-            for i, val in enumerate(bw.values(reference, curStart, curEnd)):
-                if not math.isnan(val):
-                    if len(data.values) == 0:
-                        data.start = curStart + i
-                    data.values.append(val)
-                    if len(data.values) == self._MAX_VALUES:
-                        yield data
-                        data = protocol.Continuous()
-                elif len(data.values) > 0:
-                    # data.values.append(float('NaN'))
-                    yield data
-                    data = protocol.Continuous()
-            curStart = curEnd
-            curEnd = curStart + self._INCREMENT
-
-        bw.close()
-        if len(data.values) > 0:
-            yield data
+    def _readSummaries(self, bw, reference, start, end, binSize, summaryType):
+        """
+        Returns the summaries of the binSize bins of the specified range
+        as a numpy array, with NaN for bins that have no data. A final
+        partial bin is summarised over the bases it covers.
+        """
+        numFullBins = (end - start) // binSize
+        summaries = []
+        if numFullBins > 0:
+            summaries.extend(bw.stats(
+                reference, start, start + numFullBins * binSize,
+                type=summaryType, nBins=numFullBins))
+        if start + numFullBins * binSize < end:
+            summaries.extend(bw.stats(
+                reference, start + numFullBins * binSize, end,
+                type=summaryType))
+        return numpy.array(
+            [numpy.nan if summary is None else summary
+             for summary in summaries], numpy.float64)
+
+    def _readValues(self, bw, reference, start, end):
+        """
+        Returns the values of the specified range as a numpy array,
+        with NaN for positions that have no value.
+        """
+        if pyBigWig.numpy:
+            return bw.values(reference, start, end, numpy=True)
+        # pyBigWig was built without numpy support
+        return numpy.array(bw.values(reference, start, end), numpy.float64)
 
     def readValuesBigWigToWig(self, reference, start, end):
         """
@@ -290,12 +406,428 @@ class BigWigDataSource:
 
         return wiggleReader.getData()
 
-    def bigWigToProtocol(self, reference, start, end):
+    def bigWigToProtocol(self, reference, start, end, pageStart=None):
         # return self.readValuesBigWigToWig(reference, start, end)
-        for continuousObj in self.readValuesPyBigWig(reference, start, end):
+        for continuousObj in self.readValuesPyBigWig(
+                reference, start, end, pageStart):
+            yield continuousObj
+
+    def bigWigSummaryToProtocol(
+            self, reference, start, end, binSize=None, numBins=None,
+            summaryType='mean', pageStart=None):
+        for continuousObj in self.readSummariesPyBigWig(
+                reference, start, end, binSize, numBins, summaryType,
+                pageStart):
             yield continuousObj
 
 
+# extension of the indexed binary continuous track files written by
+# ContinuousTrackImporter
+TRACK_EXTENSION = ".ctrack"
+_TRACK_MAGIC = b"GA4GHCT2"
+# the magic string followed by the little-endian length of the index
+_TRACK_HEADER = struct.Struct(b"<8sQ")
+_TRACK_POSITION_TYPE = numpy.dtype("<u4")
+_TRACK_VALUE_TYPE = numpy.dtype("<f4")
+
+
+def isTrackPath(filePath):
+    """
+    Returns True if the specified path names a continuous track file
+    written by ContinuousTrackImporter.
+    """
+    return filePath.endswith(TRACK_EXTENSION)
+
+
+class ContinuousTrackImporter(object):
+    """
+    Converts a wiggle or bedGraph file into the indexed binary track
+    format served by TrackContinuousSet.
+
+    The values of each reference are stored as runs of equal values:
+    three arrays of the same length giving the 0-based, half open
+    start and end of each run as uint32 and its value as float32,
+    sorted by start. Adjacent runs with the same value are merged, so
+    a bedGraph file is stored as compactly as its own lines and a
+    wiggle file with a span stores one run per data line. The arrays
+    follow a JSON index giving the offset and number of the runs of
+    each reference and its length, so that they can be memory mapped
+    and sliced without reading or copying the rest of the file.
+
+    Reference lengths are taken from the specified map of reference
+    names to lengths, such as those of the reference set the track is
+    served with; every reference in it is indexed, with or without
+    values. Wiggle and bedGraph files do not record lengths, so a
+    reference missing from the map is taken to end with its last value.
+    """
+    def __init__(self, sourceFile, trackFile, referenceLengths=None):
+        self._sourceFile = sourceFile
+        self._trackFile = trackFile
+        self._referenceLengths = referenceLengths or {}
+        self._lineNumber = 0
+        self._runs = {}
+
+    def run(self):
+        """
+        Reads the source file and writes the track file, which is
+        removed again if the source file cannot be read.
+        """
+        try:
+            self._readSource()
+            self._writeTrack()
+        except Exception:
+            if os.path.exists(self._trackFile):
+                os.unlink(self._trackFile)
+            raise
+
+    def _formatError(self, message):
+        return exceptions.ContinuousFileFormatException(
+            self._sourceFile, "line {}: {}".format(self._lineNumber, message))
+
+    def _openSource(self):
+        if self._sourceFile.endswith(".gz"):
+            return gzip.open(self._sourceFile)
+        return open(self._sourceFile)
+
+    def _addRun(self, reference, start, end, value):
+        if start < 0 or end <= start:
+            raise self._formatError("invalid range {}-{}".format(start, end))
+        if numpy.isnan(value):
+            return
+        if reference not in self._runs:
+            self._runs[reference] = (
+                array.array(b"I"), array.array(b"I"), array.array(b"f"))
+        starts, ends, values = self._runs[reference]
+        starts.append(start)
+        ends.append(end)
+        values.append(value)
+
+    def _parseStep(self, fields):
+        """
+        Returns the chrom, start, step and span of the specified fields
+        of a wiggle variableStep or fixedStep line, start being
+        converted to 0-based.
+        """
+        try:
+            options = dict(field.split("=", 1) for field in fields[1:])
+            start = int(options.get("start", 1)) - 1
+            step = int(options.get("step", 1))
+            span = int(options.get("span", 1))
+        except ValueError:
+            raise self._formatError("malformed {} line".format(fields[0]))
+        if "chrom" not in options:
+            raise self._formatError("missing chrom field")
+        if fields[0] == "fixedStep" and "start" not in options:
+            raise self._formatError("missing start field")
+        return options["chrom"], start, step, span
+
+    def _readSource(self):
+        # wiggle lines are read in the mode set by the preceding
+        # variableStep or fixedStep line; other data lines are bedGraph
+        mode = None
+        with self._openSource() as sourceFile:
+            for line in sourceFile:
+                self._lineNumber += 1
+                fields = line.split()
+                if len(fields) == 0 or fields[0].startswith("#") or \
+                        fields[0] == "browser":
+                    continue
+                if fields[0] == "track":
+                    mode = None
+                    continue
+                if fields[0] in ("variableStep", "fixedStep"):
+                    mode = fields[0]
+                    reference, position, step, span = self._parseStep(
+                        fields)
+                    continue
+                try:
+                    if mode == "variableStep":
+                        start = int(fields[0]) - 1
+                        self._addRun(
+                            reference, start, start + span, float(fields[1]))
+                    elif mode == "fixedStep":
+                        self._addRun(
+                            reference, position, position + span,
+                            float(fields[0]))
+                        position += step
+                    else:
+                        self._addRun(
+                            fields[0], int(fields[1]), int(fields[2]),
+                            float(fields[3]))
+                except (ValueError, IndexError):
+                    raise self._formatError(
+                        "malformed data line '{}'".format(line.strip()))
+
+    def _mergedRuns(self, reference):
+        """
+        Returns the runs of the specified reference as sorted numpy
+        arrays, merging adjacent runs of the same value.
+        """
+        starts, ends, values = [
+            numpy.frombuffer(runArray, dtype)
+            for runArray, dtype in zip(self._runs[reference], (
+                numpy.uint32, numpy.uint32, numpy.float32))]
+        order = numpy.argsort(starts, kind="mergesort")
+        starts, ends, values = starts[order], ends[order], values[order]
+        overlaps = numpy.flatnonzero(starts[1:] < ends[:-1])
+        if len(overlaps) > 0:
+            raise exceptions.ContinuousFileFormatException(
+                self._sourceFile, "overlapping values at {}:{}".format(
+                    reference, starts[overlaps[0] + 1]))
+        first = numpy.concatenate(([True], (
+            (starts[1:] != ends[:-1]) | (values[1:] != values[:-1]))))
+        last = numpy.concatenate((first[1:], [True]))
+        return starts[first], ends[last], values[first]
+
+    def _writeTrack(self):
+        index = {}
+        blocks = []
+        offset = 0
+        for reference in sorted(set(self._runs) | set(self._referenceLengths)):
+            if reference in self._runs:
+                starts, ends, values = self._mergedRuns(reference)
+            else:
+                starts, ends, values = [
+                    numpy.zeros(0, dtype) for dtype in (
+                        numpy.uint32, numpy.uint32, numpy.float32)]
+            length = self._referenceLengths.get(reference)
+            if length is None:
+                length = ends[-1]
+            elif len(ends) > 0 and ends[-1] > length:
+                raise exceptions.ContinuousFileFormatException(
+                    self._sourceFile,
+                    "values past the end of {} at {}".format(
+                        reference, ends[-1]))
+            index[reference] = {
+                "offset": offset, "count": len(starts),
+                "length": int(length)}
+            blocks.extend([
+                starts.astype(_TRACK_POSITION_TYPE),
+                ends.astype(_TRACK_POSITION_TYPE),
+                values.astype(_TRACK_VALUE_TYPE)])
+            offset += len(starts) * 12
+        indexJson = json.dumps(index, sort_keys=True).encode("utf-8")
+        # pad the index so that the arrays are aligned
+        indexJson += b" " * (-len(indexJson) % 8)
+        with open(self._trackFile, "wb") as trackFile:
+            trackFile.write(_TRACK_HEADER.pack(_TRACK_MAGIC, len(indexJson)))
+            trackFile.write(indexJson)
+            for block in blocks:
+                trackFile.write(block.tostring())
+
+
+class ContinuousTrack(object):
+    """
+    Class for reading the track files written by
+    ContinuousTrackImporter.
+
+    The file is memory mapped once and the runs of each reference are
+    numpy views of the mapping, so reading a range only touches the
+    pages holding the runs that overlap it. Queries locate those runs
+    by binary search and return objects shaped exactly as
+    BigWigDataSource returns them for the same data.
+    """
+    _INCREMENT = 10000  # max positions per window
+    _MAX_VALUES = 1000  # max values length
+
+    def __init__(self, trackFile):
+        self._trackFile = trackFile
+        with open(trackFile, "rb") as f:
+            header = f.read(_TRACK_HEADER.size)
+            if len(header) < _TRACK_HEADER.size or \
+                    _TRACK_HEADER.unpack(header)[0] != _TRACK_MAGIC:
+                raise exceptions.ContinuousFileFormatException(
+                    trackFile, "not a continuous track file")
+            indexLength = _TRACK_HEADER.unpack(header)[1]
+            self._index = json.loads(f.read(indexLength).decode("utf-8"))
+        self._dataOffset = _TRACK_HEADER.size + indexLength
+        self._data = None
+        if any(entry["count"] > 0 for entry in self._index.values()):
+            self._data = numpy.memmap(trackFile, numpy.uint8, "r")
+        self._references = {}
+
+    def close(self):
+        """
+        Releases this track's mapping of the file; the mapping itself is
+        unmapped once no arrays returned from it remain.
+        """
+        self._data = None
+        self._references = {}
+
+    def getReferenceNames(self):
+        """
+        Returns the names of the references with values in this track.
+        """
+        return sorted(self._index.keys())
+
+    def getRuns(self, reference):
+        """
+        Returns the (starts, ends, values) arrays of the runs of the
+        specified reference, which are views of the mapped file.
+        """
+        if reference not in self._references:
+            if reference not in self._index:
+                raise exceptions.ReferenceNameNotFoundException(reference)
+            count = self._index[reference]["count"]
+            offset = self._dataOffset + self._index[reference]["offset"]
+            runs = []
+            for dtype in (
+                    _TRACK_POSITION_TYPE, _TRACK_POSITION_TYPE,
+                    _TRACK_VALUE_TYPE):
+                if count == 0:
+                    runs.append(numpy.zeros(0, dtype))
+                else:
+                    runs.append(
+                        self._data[offset:offset + count * 4].view(dtype))
+                offset += count * 4
+            self._references[reference] = tuple(runs)
+        return self._references[reference]
+
+    def _openRange(self, reference, start, end):
+        """
+        Returns the runs of the specified reference together with the
+        query range clipped to the reference, raising the exceptions
+        that BigWigDataSource raises for the same range.
+        """
+        runs = self.getRuns(reference)
+        if start < 0:
+            start = 0
+        referenceLen = self._index[reference]["length"]
+        if end > referenceLen:
+            end = referenceLen
+        if start >= end:
+            raise exceptions.ReferenceRangeErrorException(
+                reference, start, end)
+        return runs, start, end
+
+    def _windows(self, runs, start, end, windowSize, readWindow):
+        """
+        Yields (windowStart, values) pairs for the windows of windowSize
+        positions of the range [start, end) starting at start, skipping
+        windows that no run overlaps.
+        """
+        starts, ends = runs[0], runs[1]
+        position = start
+        while position < end:
+            nextRun = numpy.searchsorted(ends, position, "right")
+            if nextRun == len(ends) or starts[nextRun] >= end:
+                break
+            if starts[nextRun] > position:
+                position += (
+                    (int(starts[nextRun]) - position) //
+                    windowSize * windowSize)
+            windowEnd = min(position + windowSize, end)
+            yield position, readWindow(runs, position, windowEnd)
+            position = windowEnd
+
+    def _overlapping(self, runs, start, end):
+        """
+        Returns views of the runs that overlap the range [start, end).
+        """
+        first = numpy.searchsorted(runs[1], start, "right")
+        last = numpy.searchsorted(runs[0], end, "left")
+        return [runArray[first:last] for runArray in runs]
+
+    def _readValues(self, runs, start, end):
+        """
+        Returns the values of the specified range as a numpy array,
+        with NaN for positions that have no value.
+        """
+        starts, ends, runValues = self._overlapping(runs, start, end)
+        values = numpy.full(end - start, numpy.nan, numpy.float64)
+        if len(starts) > 0:
+            positions = numpy.arange(start, end)
+            # the run starting at or before each position, if any
+            runIndexes = numpy.searchsorted(starts, positions, "right") - 1
+            covered = runIndexes >= 0
+            covered[covered] = (
+                positions[covered] < ends[runIndexes[covered]])
+            values[covered] = runValues[runIndexes[covered]]
+        return values
+
+    def _readSummaries(self, runs, start, end, binSize, summaryType):
+        """
+        Returns the summaries of the binSize bins of the specified range
+        as a numpy array, with NaN for bins that have no data. As with
+        pyBigWig, coverage is the fraction of a bin's bases with a value
+        and the other summaries are of those bases' values.
+        """
+        starts, ends, runValues = self._overlapping(runs, start, end)
+        binStarts = numpy.arange(start, end, binSize)
+        binEnds = numpy.minimum(binStarts + binSize, end)
+        # the runs overlapping each bin are [firstRuns, lastRuns)
+        firstRuns = numpy.searchsorted(ends, binStarts, "right")
+        lastRuns = numpy.searchsorted(starts, binEnds, "left")
+        counts = numpy.maximum(lastRuns - firstRuns, 0)
+        summaries = numpy.full(len(binStarts), numpy.nan, numpy.float64)
+        hasData = counts > 0
+        if not hasData.any():
+            return summaries
+        # one (bin, run) pair for each overlap, grouped by bin
+        pairBins = numpy.repeat(numpy.arange(len(binStarts)), counts)
+        groupStarts = numpy.cumsum(counts) - counts
+        pairRuns = (
+            numpy.arange(len(pairBins)) - groupStarts[pairBins] +
+            firstRuns[pairBins])
+        values = runValues[pairRuns].astype(numpy.float64)
+        bases = (
+            numpy.minimum(ends[pairRuns], binEnds[pairBins]).astype(
+                numpy.int64) -
+            numpy.maximum(starts[pairRuns], binStarts[pairBins]))
+        groups = groupStarts[hasData]
+        covered = numpy.add.reduceat(bases, groups)
+        mean = numpy.add.reduceat(values * bases, groups) / covered
+        if summaryType == "mean":
+            summaries[hasData] = mean
+        elif summaryType == "min":
+            summaries[hasData] = numpy.minimum.reduceat(values, groups)
+        elif summaryType == "max":
+            summaries[hasData] = numpy.maximum.reduceat(values, groups)
+        elif summaryType == "coverage":
+            summaries[hasData] = (
+                covered / (binEnds[hasData] - binStarts[hasData]))
+        else:
+            # the sample standard deviation, as pyBigWig computes, and
+            # 0 for a bin with a single base of data
+            sumSquares = numpy.add.reduceat(values * values * bases, groups)
+            variance = (
+                (sumSquares - covered * mean * mean) /
+                numpy.maximum(covered - 1, 1))
+            summaries[hasData] = numpy.where(
+                covered > 1, numpy.sqrt(numpy.maximum(variance, 0)), 0)
+        return summaries
+
+    def readValues(self, reference, start, end, pageStart=None):
+        """
+        Yields protocol objects holding the runs of values of the
+        specified range, as BigWigDataSource.readValuesPyBigWig does.
+        """
+        runs, start, end = self._openRange(reference, start, end)
+        start = _resumePosition(start, end, pageStart)
+        windows = self._windows(
+            runs, start, end, self._INCREMENT, self._readValues)
+        for data in _segment(windows, self._MAX_VALUES):
+            yield data
+
+    def readSummaries(
+            self, reference, start, end, binSize=None, numBins=None,
+            summaryType="mean", pageStart=None):
+        """
+        Yields protocol objects holding the summaries of bins of the
+        specified range, as BigWigDataSource.readSummariesPyBigWig does.
+        """
+        runs, start, end = self._openRange(reference, start, end)
+        if binSize is None:
+            binSize = -(-(end - start) // numBins)  # rounded up
+        start = _resumePosition(start, end, pageStart, binSize)
+        windows = self._windows(
+            runs, start, end, binSize * self._MAX_VALUES,
+            lambda runs, windowStart, windowEnd: self._readSummaries(
+                runs, windowStart, windowEnd, binSize, summaryType))
+        for data in _segment(windows, self._MAX_VALUES, binSize):
+            yield data
+
+
 class AbstractContinuousSet(datamodel.DatamodelObject):
     """
     A continuous sequence annotation set
@@ -369,7 +901,9 @@ class FileContinuousSet(AbstractContinuousSet):
         """
         return self._filePath
 
-    def getContinuous(self, referenceName=None, start=None, end=None):
+    def getContinuous(self, referenceName=None, start=None, end=None,
+                      binSize=None, numBins=None, summaryType='mean',
+                      pageStart=None):
         """
         Method passed to runSearchRequest to fulfill the request to
         yield continuous protocol objects that satisfy the given query.
@@ -377,11 +911,48 @@ class FileContinuousSet(AbstractContinuousSet):
         :param str referenceName: name of reference (ex: "chr1")
         :param start: castable to int, start position on reference
         :param end: castable to int, end position on reference
+        :param binSize: if given, summarise bins of this many bases
+            rather than returning base level values
+        :param numBins: if given, summarise this many bins
+        :param summaryType: one of SUMMARY_TYPES, used for bins
+        :param pageStart: if given, the start of the first object to
+            return, as taken from a page token
         :return: yields a protocol.Continuous at a time
         """
         bigWigReader = BigWigDataSource(self._filePath)
-        for continuousObj in bigWigReader.bigWigToProtocol(
-                                            referenceName, start, end):
+        if binSize is None and numBins is None:
+            continuousObjs = bigWigReader.bigWigToProtocol(
+                referenceName, start, end, pageStart)
+        else:
+            continuousObjs = bigWigReader.bigWigSummaryToProtocol(
+                referenceName, start, end, binSize, numBins, summaryType,
+                pageStart)
+        for continuousObj in continuousObjs:
+            yield continuousObj
+
+
+class TrackContinuousSet(FileContinuousSet):
+    """
+    Continuous data held in a track file converted from wiggle or
+    bedGraph by ContinuousTrackImporter.
+    """
+    def getContinuous(self, referenceName=None, start=None, end=None,
+                      binSize=None, numBins=None, summaryType='mean',
+                      pageStart=None):
+        """
+        Yields the continuous protocol objects that satisfy the given
+        query, as FileContinuousSet.getContinuous does.
+        """
+        track = datamodel.fileHandleCache.getFileHandle(
+            self._filePath, ContinuousTrack)
+        if binSize is None and numBins is None:
+            continuousObjs = track.readValues(
+                referenceName, start, end, pageStart)
+        else:
+            continuousObjs = track.readSummaries(
+                referenceName, start, end, binSize, numBins, summaryType,
+                pageStart)
+        for continuousObj in continuousObjs:
             yield continuousObj
 
 
@@ -7,7 +7,17 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import collections
+import copy
+import glob
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
 import rdflib
+import rdflib.store
 
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.exceptions as exceptions
@@ -19,6 +29,455 @@ TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
 LABEL = 'http://www.w3.org/2000/01/rdf-schema#label'
 HAS_QUALITY = 'http://purl.obolibrary.org/obo/BFO_0000159'
 
+# The compiled triple store written next to the ttl files of a directory
+RDF_STORE_FILENAME = "triples.db"
+RDF_DATA_PATTERNS = ['*.ttl']
+
+
+def _encodeTerm(term):
+    """
+    Returns the text stored in a triple store column for the specified
+    rdflib term. Equal terms always have equal encodings, so that bound
+    terms in a triple pattern can be looked up directly.
+    """
+    if isinstance(term, rdflib.Literal):
+        datatype = term.datatype
+        if datatype is not None:
+            datatype = unicode(datatype)
+        return "L" + json.dumps([unicode(term), term.language, datatype])
+    elif isinstance(term, rdflib.BNode):
+        return "B" + unicode(term)
+    elif isinstance(term, rdflib.URIRef):
+        return "U" + unicode(term)
+    raise ValueError("Cannot store RDF term {!r}".format(term))
+
+
+def _decodeTerm(value):
+    """
+    Returns the rdflib term for the specified triple store column text.
+    """
+    kind, text = value[0], value[1:]
+    if kind == "U":
+        return rdflib.URIRef(text)
+    elif kind == "B":
+        return rdflib.BNode(text)
+    lexical, language, datatype = json.loads(text)
+    return rdflib.Literal(lexical, lang=language, datatype=datatype)
+
+
+class SqliteTripleStore(rdflib.store.Store):
+    """
+    A read-only rdflib store backed by an SQLite triple table, as written
+    by compileRdfStore. Each column of the table is indexed in turn, so any
+    triple pattern is answered from an index without loading the graph
+    into memory.
+    """
+    _columns = ("subject", "predicate", "object")
+    _maxChoices = 500
+
+    def __init__(self, configuration=None):
+        self._connection = None
+        self._path = None
+        self._namespaces = collections.OrderedDict()
+        super(SqliteTripleStore, self).__init__(configuration)
+
+    def open(self, configuration, create=False):
+        if not os.path.exists(configuration):
+            return rdflib.store.NO_STORE
+        self._path = configuration
+        self._connection = sqlite3.connect(
+            configuration, check_same_thread=False)
+        cursor = self._connection.execute(
+            "SELECT prefix, uri FROM Namespace ORDER BY position")
+        for prefix, uri in cursor:
+            self._namespaces[prefix] = rdflib.URIRef(uri)
+        return rdflib.store.VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def reopen(self):
+        """
+        Replaces the connection to the store with a new one, as a forked
+        process must not use the connection of its parent.
+        """
+        if self._connection is not None:
+            self.close()
+            self.open(self._path)
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError("The SQLite triple store is read only")
+
+    def remove(self, triple, context=None):
+        raise TypeError("The SQLite triple store is read only")
+
+    def triples(self, triplePattern, context=None):
+        conditions = []
+        args = []
+        for column, term in zip(self._columns, triplePattern):
+            if term is not None:
+                conditions.append("{} = ?".format(column))
+                args.append(_encodeTerm(term))
+        return self._select(conditions, args)
+
+    def triples_choices(self, triplePattern, context=None):
+        """
+        Matches a pattern with a list of terms in one position with one
+        query per _maxChoices terms, rather than one query per term.
+        """
+        conditions = []
+        args = []
+        choiceColumn = None
+        choices = []
+        for column, term in zip(self._columns, triplePattern):
+            if isinstance(term, list):
+                choiceColumn = column
+                choices = [_encodeTerm(choice) for choice in term]
+            elif term is not None:
+                conditions.append("{} = ?".format(column))
+                args.append(_encodeTerm(term))
+        if len(choices) == 0:
+            return self._select(conditions, args)
+        return itertools.chain.from_iterable(
+            self._select(
+                conditions + ["{} IN ({})".format(
+                    choiceColumn, ", ".join("?" * len(batch)))],
+                args + batch)
+            for batch in (
+                choices[start:start + self._maxChoices]
+                for start in range(0, len(choices), self._maxChoices)))
+
+    def _select(self, conditions, args):
+        sql = "SELECT subject, predicate, object FROM Triple"
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        for subject, predicate, object_ in self._connection.execute(
+                sql, args):
+            triple = (
+                _decodeTerm(subject), _decodeTerm(predicate),
+                _decodeTerm(object_))
+            yield triple, iter(())
+
+    def __len__(self, context=None):
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM Triple").fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace):
+        self._namespaces[prefix] = namespace
+
+    def prefix(self, namespace):
+        for prefix, boundNamespace in self._namespaces.items():
+            if boundNamespace == namespace:
+                return prefix
+        return None
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def namespaces(self):
+        return iter(self._namespaces.items())
+
+
+def getRdfStorePath(dataDir):
+    """
+    Returns the path of the compiled triple store for the specified
+    directory of ttl files.
+    """
+    return os.path.join(dataDir, RDF_STORE_FILENAME)
+
+
+def _getDataFiles(dataDir):
+    fileNames = []
+    for pattern in RDF_DATA_PATTERNS:
+        fileNames.extend(sorted(glob.glob(os.path.join(dataDir, pattern))))
+    return fileNames
+
+
+def _getSourceFiles(fileNames):
+    """
+    Returns the (name, size, mtime) of each of the specified data files,
+    as recorded in a compiled store.
+    """
+    sourceFiles = []
+    for fileName in fileNames:
+        status = os.stat(fileName)
+        sourceFiles.append((
+            os.path.basename(fileName), status.st_size, status.st_mtime))
+    return sourceFiles
+
+
+def _parseDataFile(graph, fileName):
+    """
+    Parses the specified file into the specified graph.
+    """
+    if fileName.endswith('.ttl'):
+        graph.parse(fileName, format='n3')
+    else:
+        graph.parse(fileName, format='xml')
+
+
+def compileRdfStore(dataDir, storePath=None):
+    """
+    Parses the ttl files in the specified directory into a persistent
+    SqliteTripleStore at the specified path, which defaults to
+    getRdfStorePath(dataDir). Files are parsed one at a time, so only the
+    largest of them needs to fit in memory. The name, size and mtime of
+    each file are stored alongside the triples, so that changes to the
+    set of files can be detected.
+    """
+    if storePath is None:
+        storePath = getRdfStorePath(dataDir)
+    fileNames = _getDataFiles(dataDir)
+    if len(fileNames) == 0:
+        raise exceptions.EmptyDirException(dataDir, RDF_DATA_PATTERNS)
+    # Taken before parsing, so a file changed meanwhile makes the store stale
+    sourceFiles = _getSourceFiles(fileNames)
+    tempPath = storePath + ".tmp"
+    if os.path.exists(tempPath):
+        os.unlink(tempPath)
+    try:
+        connection = sqlite3.connect(tempPath)
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("""
+            CREATE TABLE Triple (
+                subject TEXT NOT NULL,
+                predicate TEXT NOT NULL,
+                object TEXT NOT NULL,
+                PRIMARY KEY (subject, predicate, object))
+            WITHOUT ROWID""")
+        connection.execute("""
+            CREATE TABLE Namespace (
+                position INTEGER PRIMARY KEY,
+                prefix TEXT NOT NULL,
+                uri TEXT NOT NULL)""")
+        connection.execute("""
+            CREATE TABLE SourceFile (
+                name TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL)""")
+        namespaces = collections.OrderedDict()
+        for fileName in fileNames:
+            graph = rdflib.Graph()
+            _parseDataFile(graph, fileName)
+            for prefix, namespace in graph.namespaces():
+                namespaces.setdefault(prefix, namespace)
+            with connection:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO Triple VALUES (?, ?, ?)",
+                    ([_encodeTerm(term) for term in triple]
+                     for triple in graph))
+        with connection:
+            connection.executemany(
+                "INSERT INTO Namespace (prefix, uri) VALUES (?, ?)",
+                namespaces.items())
+            connection.executemany(
+                "INSERT INTO SourceFile VALUES (?, ?, ?)", sourceFiles)
+            connection.execute(
+                "CREATE INDEX triple_pos ON Triple "
+                "(predicate, object, subject)")
+            connection.execute(
+                "CREATE INDEX triple_osp ON Triple "
+                "(object, subject, predicate)")
+            connection.execute("ANALYZE")
+        connection.close()
+        os.rename(tempPath, storePath)
+    except Exception:
+        if os.path.exists(tempPath):
+            os.unlink(tempPath)
+        raise
+    return storePath
+
+
+def _isRdfStoreCurrent(dataDir, storePath):
+    """
+    Returns True if the compiled store at the specified path exists and
+    was compiled from exactly the data files now in the specified
+    directory, with the same names, sizes and mtimes; adding, removing,
+    renaming or changing any of them makes the store stale.
+    """
+    if not os.path.exists(storePath):
+        return False
+    try:
+        connection = sqlite3.connect(storePath)
+        try:
+            sourceFiles = connection.execute(
+                "SELECT name, size, mtime FROM SourceFile "
+                "ORDER BY name").fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        # Not a store, or one compiled before source files were recorded
+        return False
+    currentFiles = sorted(_getSourceFiles(_getDataFiles(dataDir)))
+    return sourceFiles == currentFiles
+
+
+class AssociationQueryCache(object):
+    """
+    LRU cache of the associations found by G2P searches. Entries expire
+    timeToLive seconds after they were stored, and the cache keeps at
+    most maxCacheSize of them; a size of 0 disables it. The cache counts
+    its hits and misses, so its effect can be observed. Values are copied
+    in and out of the cache, so callers are free to modify them.
+    """
+
+    def __init__(self, maxCacheSize=256, timeToLive=600, timer=time.time):
+        self._cache = collections.OrderedDict()
+        self._maxCacheSize = maxCacheSize
+        self._timeToLive = timeToLive
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def setMaxCacheSize(self, size):
+        """
+        Sets the maximum number of entries in the cache
+        """
+        if size < 0:
+            raise ValueError("The size of the cache cannot be negative")
+        with self._lock:
+            self._maxCacheSize = size
+            while len(self._cache) > size:
+                self._cache.popitem(last=False)
+
+    def setTimeToLive(self, seconds):
+        """
+        Sets the number of seconds for which an entry is valid
+        """
+        if seconds <= 0:
+            raise ValueError(
+                "The time to live must be a strictly positive value")
+        self._timeToLive = seconds
+
+    def get(self, key):
+        """
+        Returns the value stored for the specified key, or None if there
+        is no such value or it has expired. A value that is found becomes
+        the most recently used.
+        """
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is None or entry[0] <= self._timer():
+                self._misses += 1
+                return None
+            self._cache[key] = entry
+            self._hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key, value):
+        """
+        Stores the specified value for the specified key, evicting the
+        least recently used entry if the cache is full.
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            if self._maxCacheSize == 0:
+                return
+            self._cache.pop(key, None)
+            self._cache[key] = (self._timer() + self._timeToLive, value)
+            if len(self._cache) > self._maxCacheSize:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all the entries and resets the counters; called when the
+        data repository is (re)loaded.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def getStatistics(self):
+        """
+        Returns a dict of the number of hits, misses and entries
+        """
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "size": len(self._cache)}
+
+
+# LRU cache of G2P search results
+associationQueryCache = AssociationQueryCache()
+
+
+def _requestCacheKey(request):
+    """
+    Returns a hashable key for the filters of the specified search
+    request. The order of the values of repeated fields does not change
+    the results of a search, so they are sorted; paging fields are left
+    out.
+    """
+    if request is None:
+        return None
+    key = []
+    for field, value in request.ListFields():
+        if field.name in ('page_size', 'page_token'):
+            continue
+        isMessage = field.type == field.TYPE_MESSAGE
+        if field.label == field.LABEL_REPEATED:
+            value = tuple(sorted(
+                item.SerializeToString() if isMessage else item
+                for item in value))
+        elif isMessage:
+            value = value.SerializeToString()
+        key.append((field.name, value))
+    return (type(request).__name__, tuple(key))
+
+
+_rdfGraphs = {}
+
+
+def getRdfGraph(dataDir):
+    """
+    Returns the rdflib graph for the specified directory. The compiled
+    triple store is opened if it is up to date; otherwise the ttl files
+    are parsed into memory. Graphs are shared by all the objects backed by
+    the same directory, so each directory is only loaded once until
+    clearRdfGraphs is called.
+    """
+    key = os.path.realpath(dataDir)
+    if key not in _rdfGraphs:
+        storePath = getRdfStorePath(dataDir)
+        if _isRdfStoreCurrent(dataDir, storePath):
+            graph = rdflib.Graph(SqliteTripleStore(storePath))
+        else:
+            graph = rdflib.ConjunctiveGraph()
+            fileNames = _getDataFiles(dataDir)
+            if len(fileNames) == 0:
+                raise exceptions.EmptyDirException(
+                    dataDir, RDF_DATA_PATTERNS)
+            for fileName in fileNames:
+                _parseDataFile(graph, fileName)
+        _rdfGraphs[key] = graph
+    return _rdfGraphs[key]
+
+
+def clearRdfGraphs():
+    """
+    Forgets the loaded graphs, so that the next data repository to be
+    loaded reads its directories again. The graphs themselves are left
+    open for the objects that still refer to them.
+    """
+    _rdfGraphs.clear()
+
+
+def reopenRdfStores():
+    """
+    Reopens the compiled triple stores of the loaded graphs.
+    """
+    for graph in _rdfGraphs.values():
+        if isinstance(graph.store, SqliteTripleStore):
+            graph.store.reopen()
+
 
 class AbstractPhenotypeAssociationSet(datamodel.DatamodelObject):
     compoundIdClass = datamodel.PhenotypeAssociationSetCompoundId
@@ -43,7 +502,8 @@ class SimulatedPhenotypeAssociationSet(AbstractPhenotypeAssociationSet):
             parentContainer, localId)
         self._numAssociations = numAssociations
 
-    def getAssociations(self, request=None, featureSets=[]):
+    def getAssociations(
+            self, request=None, featureSets=[], offset=0, limit=None):
         associations = []
         # no request, return a generic set of associations
         if request is None:
@@ -64,7 +524,9 @@ class SimulatedPhenotypeAssociationSet(AbstractPhenotypeAssociationSet):
                 associations.append(self._makeSimulatedAssociation(
                                     _id=test_phenotype_ids[i].split("-")[1],
                                     phenotype_id=test_phenotype_ids[i]))
-        return associations
+        if limit is None:
+            return associations[offset:]
+        return associations[offset:offset + limit]
 
     def _makeSimulatedAssociation(self, _id=None, phenotype_id=None):
         fpa = protocol.FeaturePhenotypeAssociation()
@@ -119,16 +581,35 @@ class G2PUtility(object):
         all values are strings
         """
         details = []
-        for uriRef in uriRefs:
-            for subject, predicate, object_ in self._rdfGraph.triples(
-                    (uriRef, None, None)):
-                details.append({
-                    'subject': subject.toPython(),
-                    'predicate': predicate.toPython(),
-                    'object': object_.toPython()
-                })
+        # look up each distinct uriRef once, in a single batched sweep
+        uniqueRefs = list(collections.OrderedDict.fromkeys(uriRefs))
+        if len(uniqueRefs) == 0:
+            return details
+        for subject, predicate, object_ in self._rdfGraph.triples_choices(
+                (uniqueRefs, None, None)):
+            details.append({
+                'subject': subject.toPython(),
+                'predicate': predicate.toPython(),
+                'object': object_.toPython()
+            })
         return details
 
+    def _detailsBySubject(self, uriRefs):
+        """
+        Given a list of uriRefs, return a dict mapping each of them (as
+        a string) to the dict of its details, keyed by predicate and with
+        the uriRef as its 'id', with all the details fetched in one
+        batched lookup
+        """
+        detailsBySubject = {}
+        for uriRef in uriRefs:
+            subject = uriRef.toPython()
+            detailsBySubject[subject] = {'id': subject}
+        for detail in self._detailTuples(uriRefs):
+            detailsBySubject[detail['subject']][detail['predicate']] = \
+                detail['object']
+        return detailsBySubject
+
     def _bindingsToDict(self, bindings):
         """
         Given a binding from the sparql query result,
@@ -139,26 +620,22 @@ class G2PUtility(object):
             myDict[key.toPython().replace('?', '')] = val.toPython()
         return myDict
 
-    def _addDataFile(self, filename):
+    def _loadGraph(self, dataDir):
         """
-        Given a filename, add it to the graph
+        Attaches the shared graph for the specified directory and extracts
+        the version of the data from it
         """
-        if filename.endswith('.ttl'):
-            self._rdfGraph.parse(filename, format='n3')
-        else:
-            self._rdfGraph.parse(filename, format='xml')
+        self._rdfGraph = getRdfGraph(dataDir)
+        # save the path
+        self._dataUrl = dataDir
 
-    def _getDetails(self, uriRef, associations_details):
-        """
-        Given a uriRef, return a dict of all the details for that Ref
-        use the uriRef as the 'id' of the dict
-        """
-        associationDetail = {}
-        for detail in associations_details:
-            if detail['subject'] == uriRef:
-                associationDetail[detail['predicate']] = detail['object']
-            associationDetail['id'] = uriRef
-        return associationDetail
+        # extract version
+        cgdTTL = rdflib.URIRef("http://data.monarchinitiative.org/ttl/cgd.ttl")
+        versionInfo = rdflib.URIRef(
+            u'http://www.w3.org/2002/07/owl#versionInfo')
+        self._version = None
+        for _, _, obj in self._rdfGraph.triples((cgdTTL, versionInfo, None)):
+            self._version = obj.toPython()
 
     def _formatExternalIdentifiers(self, element, element_type):
         """
@@ -223,11 +700,31 @@ class G2PUtility(object):
         elementClause = "({})".format(" || ".join(elements))
         return elementClause
 
-    def _formatFeatureClause(self, feature):
+    def _isLinkedFeatureSet(self, featureSet):
+        """
+        Returns True if the specified feature set serves the g2p features
+        of this association set, that is, it is a g2p feature set with
+        the same local ID.
+        """
+        return (isinstance(featureSet, G2PUtility) and
+                featureSet.getLocalId() == self.getLocalId())
+
+    def _formatFeatureClause(self, feature, featureSets=[]):
         """
-        Format a feature for lookup by gene_symbol
+        Format a feature for lookup by gene_symbol, or as any of the g2p
+        features whose location overlaps it, taken from the feature set
+        of this association set
         """
-        return 'regex(?feature_label, "{}")'.format(feature.gene_symbol)
+        clauses = ['regex(?feature_label, "{}")'.format(feature.gene_symbol)]
+        if feature.reference_name:
+            for featureSet in featureSets:
+                if self._isLinkedFeatureSet(featureSet):
+                    featureIds = featureSet.getFeatureIdsInRegion(
+                        feature.reference_name, feature.start, feature.end)
+                    clauses.extend(
+                        self._formatId(featureId, 'feature')
+                        for featureId in sorted(featureIds))
+        return "({})".format(" || ".join(clauses))
 
     def _formatId(self, element, element_type):
         """
@@ -381,7 +878,7 @@ class G2PUtility(object):
 
         feature_id = feature['id']
         for feature_set in featureSets:
-            if self.getLocalId() in feature_set.getLocalId():
+            if self._isLinkedFeatureSet(feature_set):
                 feature_id = feature_set.getCompoundIdForFeatureId(feature_id)
 
         fpa.feature_ids.extend([feature_id])
@@ -455,59 +952,59 @@ class RdfPhenotypeAssociationSet(G2PUtility, AbstractPhenotypeAssociationSet):
         """
         super(RdfPhenotypeAssociationSet, self).__init__(
             parentContainer, localId)
-
-        # initialize graph
-        self._rdfGraph = rdflib.ConjunctiveGraph()
-        # save the path
-        self._dataUrl = dataDir
-
-        self._scanDataFiles(dataDir, ['*.ttl'])
-
-        # extract version
-        cgdTTL = rdflib.URIRef("http://data.monarchinitiative.org/ttl/cgd.ttl")
-        versionInfo = rdflib.URIRef(
-            u'http://www.w3.org/2002/07/owl#versionInfo')
-        self._version = None
-        for _, _, obj in self._rdfGraph.triples((cgdTTL, versionInfo, None)):
-            self._version = obj.toPython()
+        self._loadGraph(dataDir)
 
     def getAssociations(
-            self, request=None, featureSets=[]):
+            self, request=None, featureSets=[], offset=0, limit=None):
         """
         This query is the main search mechanism.
         It queries the graph for annotations that match the
         AND of [feature,environment,phenotype].
+        Associations are ordered by id; only the page of at most limit
+        associations starting at offset is fetched and converted.
         """
         if len(featureSets) == 0:
             featureSets = self.getParentContainer().getFeatureSets()
+        cacheKey = (
+            self.getId(), self._dataUrl,
+            tuple(featureSet.getId() for featureSet in featureSets),
+            _requestCacheKey(request), offset, limit)
+        associations = associationQueryCache.get(cacheKey)
+        if associations is None:
+            associations = self._searchAssociations(
+                request, featureSets, offset, limit)
+            associationQueryCache.put(cacheKey, associations)
+        return associations
+
+    def _searchAssociations(self, request, featureSets, offset, limit):
+        """
+        Runs the search for getAssociations against the graph
+        """
         # query to do search
-        query = self._formatFilterQuery(request, featureSets)
+        query = self._formatFilterQuery(request, featureSets, offset, limit)
         associations = self._rdfGraph.query(query)
         # associations is now a dict with rdflib terms with variable and
         # URIrefs or literals
 
         # given get the details for the feature,phenotype and environment
-        associations_details = self._detailTuples(
+        associations_details = self._detailsBySubject(
             self._extractAssociationsDetails(
                 associations))
 
-        # association_details is now a list of {subject,predicate,object}
-        # for each of the association detail
+        # association_details now maps the uri of each association detail
+        # to a dict of its {predicate: object}
         # http://nmrml.org/cv/v1.0.rc1/doc/doc/objectproperties/BFO0000159___-324347567.html
         # label "has quality at all times" (en)
         associationList = []
         for assoc in associations.bindings:
             if '?feature' in assoc:
                 association = self._bindingsToDict(assoc)
-                association['feature'] = self._getDetails(
-                    association['feature'],
-                    associations_details)
-                association['environment'] = self._getDetails(
-                    association['environment'],
-                    associations_details)
-                association['phenotype'] = self._getDetails(
-                    association['phenotype'],
-                    associations_details)
+                association['feature'] = associations_details[
+                    association['feature']]
+                association['environment'] = associations_details[
+                    association['environment']]
+                association['phenotype'] = associations_details[
+                    association['phenotype']]
                 association['evidence'] = association['phenotype'][HAS_QUALITY]
                 association['id'] = association['association']
                 associationList.append(association)
@@ -523,9 +1020,11 @@ class RdfPhenotypeAssociationSet(G2PUtility, AbstractPhenotypeAssociationSet):
             assoc in associationList]
         return associations
 
-    def _formatFilterQuery(self, request=None, featureSets=[]):
+    def _formatFilterQuery(
+            self, request=None, featureSets=[], offset=0, limit=None):
         """
-        Generate a formatted sparql query with appropriate filters
+        Generate a formatted sparql query with appropriate filters,
+        restricted to the specified page of results
         """
         query = self._baseQuery()
         filters = []
@@ -542,6 +1041,10 @@ class RdfPhenotypeAssociationSet(G2PUtility, AbstractPhenotypeAssociationSet):
         if len(filters) == 0:
             filter = ""
         query = query.replace("#%FILTER%", filter)
+        if offset:
+            query += "OFFSET {}\n".format(offset)
+        if limit is not None:
+            query += "LIMIT {}\n".format(limit)
         return query
 
     def _filterSearchGenotypePhenotypeRequest(self, request, featureSets):
@@ -564,7 +1067,8 @@ class RdfPhenotypeAssociationSet(G2PUtility, AbstractPhenotypeAssociationSet):
                             feature = featureSet.getFeature(compoundId)
                             if feature:
                                 featureFilters.append(
-                                    self._formatFeatureClause(feature))
+                                    self._formatFeatureClause(
+                                        feature, featureSets))
                                 break
                     except Exception:
                         featureFilters.append(
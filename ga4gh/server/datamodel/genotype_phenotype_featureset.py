@@ -8,6 +8,7 @@ from __future__ import unicode_literals
 
 import re
 import bisect
+import collections
 import rdflib
 from rdflib import RDF
 
@@ -30,6 +31,9 @@ MEMBER_OF = 'http://purl.obolibrary.org/obo/RO_0002350'
 ASSOCIATION = "http://purl.org/oban/association"
 HAS_SUBJECT = "http://purl.org/oban/association_has_subject"
 
+# characters that make a regular expression more than a literal string
+REGEX_SPECIAL = '.^$*+?{}[]\\|()'
+
 
 class PhenotypeAssociationFeatureSet(
         g2p.G2PUtility, sequence_annotations.Gff3DbFeatureSet):
@@ -40,6 +44,8 @@ class PhenotypeAssociationFeatureSet(
     published by the Monarch project, was the source of Evidence.
     """
 
+    _featureBatchSize = 100
+
     def __init__(self, parentContainer, localId):
         super(PhenotypeAssociationFeatureSet, self).__init__(
             parentContainer, localId)
@@ -63,22 +69,11 @@ class PhenotypeAssociationFeatureSet(
         If path is set, this backend will load itself
         """
         self._dbFilePath = dataUrl
-        # initialize graph
-        self._rdfGraph = rdflib.ConjunctiveGraph()
-        # save the path
-        self._dataUrl = dataUrl
-        self._scanDataFiles(self._dataUrl, ['*.ttl'])
-
-        # extract version
-        cgdTTL = rdflib.URIRef("http://data.monarchinitiative.org/ttl/cgd.ttl")
-        versionInfo = rdflib.URIRef(
-            u'http://www.w3.org/2002/07/owl#versionInfo')
-        self._version = None
-        for _, _, obj in self._rdfGraph.triples((cgdTTL, versionInfo, None)):
-            self._version = obj.toPython()
+        self._loadGraph(dataUrl)
 
         # setup location cache
         self._initializeLocationCache()
+        self._initializeLabelIndex()
 
     # mimic featureset
     def getFeature(self, compoundId):
@@ -96,7 +91,26 @@ class PhenotypeAssociationFeatureSet(
         featureId
         """
         featureRef = rdflib.URIRef(featureId)
-        featureDetails = self._detailTuples([featureRef])
+        return self._detailsToFeature(
+            featureId, self._detailTuples([featureRef]))
+
+    def _getFeaturesByIds(self, featureIds):
+        """
+        find features and return their ga4gh representations, with the
+        details of all of them fetched in one batched lookup
+        """
+        featureRefs = [rdflib.URIRef(featureId) for featureId in featureIds]
+        detailsById = dict((featureId, []) for featureId in featureIds)
+        for detail in self._detailTuples(featureRefs):
+            detailsById[detail['subject']].append(detail)
+        return [
+            self._detailsToFeature(featureId, detailsById[featureId])
+            for featureId in featureIds]
+
+    def _detailsToFeature(self, featureId, featureDetails):
+        """
+        build the ga4gh representation of a feature from its details
+        """
         feature = {}
         for detail in featureDetails:
             feature[detail['predicate']] = []
@@ -140,79 +154,103 @@ class PhenotypeAssociationFeatureSet(
     def getFeatures(self, referenceName=None, start=None, end=None,
                     startIndex=None, maxResults=None,
                     featureTypes=None, parentId=None,
-                    name=None, geneSymbol=None, numFeatures=10):
+                    name=None, geneSymbol=None, depth=1, prefix=False,
+                    numFeatures=10):
 
-        # query to do search
-        query = self._filterSearchFeaturesRequest(
-            referenceName, geneSymbol, name, start, end)
-        featuresResults = self._rdfGraph.query(query)
-        featureIds = set()
-        try:
-            for row in featuresResults.bindings:
-                featureIds.add(row['feature'].toPython())
-        except re.error:
-            raise exceptions.BadFeatureSetSearchRequestRegularExpression()
+        if name or geneSymbol:
+            featureIds = self._searchFeatureLabels(name, geneSymbol)
+        else:
+            featureIds = set(
+                featureId for _, featureId in self._featureLabels)
+        if referenceName:
+            featureIds &= self.getFeatureIdsInRegion(
+                referenceName, start, end)
 
         if startIndex:
             startPosition = int(startIndex)
         else:
             startPosition = 0
-        for i, featureId in enumerate(featureIds):
-            if i < startPosition:
-                continue
-            feature = self._getFeatureById(featureId)
-            # _getFeatureById returns native id, cast to compound
-            feature.id = self.getCompoundIdForFeatureId(feature.id)
-            yield feature
-
-    def _baseQuery(self):
-        return """
-        PREFIX OBAN: <http://purl.org/oban/>
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        SELECT DISTINCT
-                        ?feature
-                        ?feature_label
-        WHERE {
-                   ?association  a OBAN:association .
-                   ?association    OBAN:association_has_subject ?feature .
-                   ?feature  rdfs:label ?feature_label  .
-                   #%FILTER%
-        }
-        ORDER BY ?feature
+        # fetch the features a page at a time
+        batchSize = maxResults or self._featureBatchSize
+        featureIds = sorted(featureIds)[startPosition:]
+        for batchStart in range(0, len(featureIds), batchSize):
+            for feature in self._getFeaturesByIds(
+                    featureIds[batchStart:batchStart + batchSize]):
+                # _getFeaturesByIds returns native ids, cast to compound
+                feature.id = self.getCompoundIdForFeatureId(feature.id)
+                yield feature
+
+    def _searchFeatureLabels(self, name, geneSymbol):
+        """
+        Returns the set of features with a label matched by the name and
+        gene symbol regular expressions, as the SPARQL regex() filter
+        would. A pattern of the form '^literal' is answered by bisecting
+        the sorted label index rather than scanning it.
         """
+        try:
+            patterns = [
+                re.compile(pattern) for pattern in [name, geneSymbol]
+                if pattern]
+        except re.error:
+            raise exceptions.BadFeatureSetSearchRequestRegularExpression()
+        labels = self._featureLabels
+        candidates = labels
+        for pattern in patterns:
+            prefix = pattern.pattern[1:]
+            literal = not any(char in REGEX_SPECIAL for char in prefix)
+            if pattern.pattern.startswith('^') and literal:
+                begin = bisect.bisect_left(labels, (prefix,))
+                end = begin
+                while end < len(labels) and labels[end][0].startswith(prefix):
+                    end += 1
+                candidates = labels[begin:end]
+                break
+        featureIds = set()
+        for label, featureId in candidates:
+            if all(pattern.search(label) for pattern in patterns):
+                featureIds.add(featureId)
+        return featureIds
 
-    def _filterSearchFeaturesRequest(self, reference_name, gene_symbol, name,
-                                     start, end):
+    def getFeatureIdsInRegion(self, referenceName, start=None, end=None):
         """
-        formulate a sparql query string based on parameters
+        Returns the set of ids of the features whose hg19 location
+        overlaps the specified region of the specified reference. The
+        region is half-open, as in GA4GH requests, while feature locations
+        are closed intervals: a feature ending at the region's start
+        overlaps it, but one beginning at the region's end does not. A
+        missing start or end leaves the region open on that side.
         """
-        filters = []
-        query = self._baseQuery()
-        filters = []
-        location = self._findLocation(reference_name, start, end)
-        if location:
-            filters.append("?feature = <{}>".format(location))
-        if gene_symbol:
-            filters.append('regex(?feature_label, "{}")')
-        if name:
-            filters.append(
-                'regex(?feature_label, "{}")'.format(name))
-        # apply filters
-        filter = "FILTER ({})".format(' && '.join(filters))
-        if len(filters) == 0:
-            filter = ""
-        query = query.replace("#%FILTER%", filter)
-        return query
-
-    def _findLocation(self, reference_name, start, end):
+        # TODO - sequence_annotations does not have build?
+        index = self._locationIndex.get(referenceName)
+        if index is None:
+            return set()
+        begins, maxEnds, ends, featureIds = index
+        if start is None:
+            start = 0
+        last = len(begins)
+        if end is not None:
+            last = bisect.bisect_left(begins, end)
+        # maxEnds is non-decreasing, so every feature before first ends
+        # before the region starts
+        first = bisect.bisect_left(maxEnds, start, 0, last)
+        return set(
+            featureIds[i] for i in range(first, last) if ends[i] >= start)
+
+    def _initializeLabelIndex(self):
         """
-        return a location key form the locationMap
+        Builds a sorted list of (label, feature) pairs covering the
+        labels of every association subject, the features searched by
+        getFeatures.
         """
-        try:
-            # TODO - sequence_annotations does not have build?
-            return self._locationMap['hg19'][reference_name][start][end]
-        except:
-            return None
+        graph = self._rdfGraph
+        labels = set()
+        associationType = rdflib.URIRef(ASSOCIATION)
+        for association in graph.subjects(RDF.type, associationType):
+            for feature in graph.objects(
+                    association, rdflib.URIRef(HAS_SUBJECT)):
+                for label in graph.objects(feature, rdflib.URIRef(LABEL)):
+                    labels.add((label.toPython(), feature.toPython()))
+        self._featureLabels = sorted(labels)
 
     def _initializeLocationCache(self):
         """
@@ -224,6 +262,8 @@ class PhenotypeAssociationFeatureSet(
         # cache of locations
         self._locationMap = {}
         locationMap = self._locationMap
+        # (begin, end, feature) of the hg19 locations of each chromosome
+        indexLocations = collections.defaultdict(set)
         triples = self._rdfGraph.triples
         Ref = rdflib.URIRef
 
@@ -313,3 +353,27 @@ class PhenotypeAssociationFeatureSet(
                             "begin": begin,
                             "end": end,
                         }
+                        if build == 'hg19':
+                            indexLocations[chromosome].add(
+                                (int(begin), int(end), location["_id"]))
+        self._initializeLocationIndex(indexLocations)
+
+    def _initializeLocationIndex(self, locations):
+        """
+        Builds an interval index over the specified map of chromosome
+        names to sets of (begin, end, featureId) locations. For each
+        chromosome it holds the begins, ends and ids of the features
+        sorted by begin, along with the running maximum of their ends,
+        so that the features overlapping a region are found by bisection.
+        """
+        self._locationIndex = {}
+        for chromosome, chromosomeLocations in locations.items():
+            chromosomeLocations = sorted(chromosomeLocations)
+            begins = [begin for begin, _, _ in chromosomeLocations]
+            ends = [end for _, end, _ in chromosomeLocations]
+            featureIds = [featureId for _, _, featureId in chromosomeLocations]
+            maxEnds = list(ends)
+            for i in range(1, len(maxEnds)):
+                maxEnds[i] = max(maxEnds[i - 1], maxEnds[i])
+            self._locationIndex[chromosome] = (
+                begins, maxEnds, ends, featureIds)
@@ -306,6 +306,10 @@ class GOTerm:
                                 ret.append("    {TERM}".format(TERM=t))
         return "\n  ".join(ret)
 
+    def get_parent_ids(self):
+        """Return the IDs of the is_a parents, as read from the file."""
+        return list(self._parents)
+
     def has_parent(self, term):
         for p in self.parents:
             if p.id == term or p.has_parent(term):
@@ -5,7 +5,10 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import bisect
 import collections
+import marshal
 import os.path
 
 import ga4gh.server.exceptions as exceptions
@@ -16,6 +19,26 @@ import ga4gh.schemas.protocol as protocol
 
 SEQUENCE_ONTOLOGY_PREFIX = "SO"
 
+# Extension of the compiled ontology cache files
+CACHE_EXTENSION = ".ontology"
+# Bumped whenever the layout of the cache files changes
+_CACHE_FORMAT_VERSION = 2
+# The type of the arrays of term indexes
+_INDEX_TYPECODE = "i"
+
+
+def _flatten(lists):
+    """
+    Returns the (offsets, values) arrays of the specified lists of term
+    indexes, where list i is values[offsets[i]:offsets[i + 1]].
+    """
+    offsets = array.array(_INDEX_TYPECODE, [0])
+    values = array.array(_INDEX_TYPECODE)
+    for indexes in lists:
+        values.extend(indexes)
+        offsets.append(len(values))
+    return offsets, values
+
 
 class OboReader(obo_parser.OBOReader):
     """
@@ -43,25 +66,152 @@ class Ontology(object):
         self._dataUrl = None
         # There can be duplicate names, so we need to store a list of IDs.
         self._nameIdMap = collections.defaultdict(list)
+        self._idNameMap = {}
+        # The is_a parents of each term that are defined in the ontology
+        self._parentIdsMap = {}
+        # The transitive closure of the is_a relation, over the indexes
+        # of the terms in the sorted list of IDs. The ancestors of term i
+        # (including itself) are the sorted indexes
+        # _ancestors[_ancestorOffsets[i]:_ancestorOffsets[i + 1]], and its
+        # children are stored in the same way.
+        self._termIds = []
+        self._termIndexes = {}
+        self._ancestorOffsets = array.array(_INDEX_TYPECODE)
+        self._ancestors = array.array(_INDEX_TYPECODE)
+        self._childOffsets = array.array(_INDEX_TYPECODE)
+        self._children = array.array(_INDEX_TYPECODE)
 
     def _readFile(self):
         if not os.path.exists(self._dataUrl):
             raise exceptions.FileOpenFailedException(self._dataUrl)
         reader = OboReader(obo_file=self._dataUrl)
-        ids = set()
+        parentIdsMap = {}
         for record in reader:
-            if record.id in ids:
+            if record.id in self._idNameMap:
                 raise exceptions.OntologyFileFormatException(
                     self._dataUrl, "Duplicate ID {}".format(record.id))
-            ids.add(record.id)
+            self._idNameMap[record.id] = record.name
             self._nameIdMap[record.name].append(record.id)
+            parentIdsMap[record.id] = record.get_parent_ids()
         self._sourceVersion = reader.format_version
-        if len(ids) == 0:
+        if len(self._idNameMap) == 0:
             raise exceptions.OntologyFileFormatException(
                 self._dataUrl, "No valid records found.")
+        for termId, parentIds in parentIdsMap.items():
+            self._parentIdsMap[termId] = [
+                parentId for parentId in parentIds
+                if parentId in self._idNameMap]
         # To get prefix, pull out an ID and parse it.
         self._ontologyPrefix = record.id.split(":")[0]
         self._sourceVersion = reader.data_version
+        self._buildClosureIndex()
+
+    def _indexTerms(self):
+        self._termIds = sorted(self._idNameMap)
+        self._termIndexes = dict(
+            (termId, index) for index, termId in enumerate(self._termIds))
+
+    def _getParentIndexes(self):
+        return [
+            [self._termIndexes[parentId]
+             for parentId in self._parentIdsMap[termId]]
+            for termId in self._termIds]
+
+    def _buildClosureIndex(self):
+        """
+        Computes the ancestors and children of every term. Ancestors are
+        stored sparsely, so the index grows with the number of ancestors
+        of the terms rather than with the square of the number of terms.
+        """
+        self._indexTerms()
+        parentIndexes = self._getParentIndexes()
+        ancestorSets = [None] * len(self._termIds)
+
+        def getAncestors(index):
+            if ancestorSets[index] is None:
+                # Guard against is_a cycles in malformed files
+                ancestorSets[index] = frozenset()
+                ancestors = set([index])
+                for parentIndex in parentIndexes[index]:
+                    ancestors |= getAncestors(parentIndex)
+                ancestorSets[index] = frozenset(ancestors)
+            return ancestorSets[index]
+
+        self._ancestorOffsets, self._ancestors = _flatten(
+            sorted(getAncestors(index)) for index in range(len(ancestorSets)))
+        self._buildChildIndex(parentIndexes)
+
+    def _buildChildIndex(self, parentIndexes):
+        children = [[] for _ in parentIndexes]
+        for index, parents in enumerate(parentIndexes):
+            for parentIndex in parents:
+                children[parentIndex].append(index)
+        self._childOffsets, self._children = _flatten(children)
+
+    def _getSourceKey(self):
+        """
+        Returns the modification time and size of the OBO file, which
+        identify the version of it that a cache was compiled from.
+        """
+        stat = os.stat(self._dataUrl)
+        return [stat.st_mtime, stat.st_size]
+
+    def writeCache(self, cachePath):
+        """
+        Writes this ontology in a compact binary form to the specified
+        path: its term IDs and names, the is_a edges between them as
+        indexes into the list of IDs, and the closure index, so that it
+        need not be computed again. The cache is keyed by the
+        modification time and size of the OBO file, so it is ignored
+        once the file changes.
+        """
+        cache = {
+            "version": _CACHE_FORMAT_VERSION,
+            "source": self._getSourceKey(),
+            "sourceVersion": self._sourceVersion,
+            "ontologyPrefix": self._ontologyPrefix,
+            "ids": self._termIds,
+            "names": [self._idNameMap[termId] for termId in self._termIds],
+            "parents": self._getParentIndexes(),
+            "ancestorOffsets": self._ancestorOffsets.tostring(),
+            "ancestors": self._ancestors.tostring(),
+        }
+        tempPath = cachePath + ".tmp"
+        with open(tempPath, "wb") as cacheFile:
+            marshal.dump(cache, cacheFile)
+        os.rename(tempPath, cachePath)
+
+    def _readCache(self, cachePath):
+        """
+        Populates this ontology from the cache at the specified path,
+        which is a single unmarshal. Returns False, leaving the ontology
+        empty, if there is no cache or it does not match the OBO file.
+        """
+        try:
+            with open(cachePath, "rb") as cacheFile:
+                cache = marshal.load(cacheFile)
+        except (IOError, EOFError, ValueError, TypeError):
+            return False
+        if (not isinstance(cache, dict) or
+                cache.get("version") != _CACHE_FORMAT_VERSION or
+                cache.get("source") != self._getSourceKey()):
+            return False
+        termIds = cache["ids"]
+        parentIndexes = cache["parents"]
+        for termId, name, parents in zip(
+                termIds, cache["names"], parentIndexes):
+            self._idNameMap[termId] = name
+            self._nameIdMap[name].append(termId)
+            self._parentIdsMap[termId] = [termIds[index] for index in parents]
+        self._sourceVersion = cache["sourceVersion"]
+        self._ontologyPrefix = cache["ontologyPrefix"]
+        self._indexTerms()
+        self._ancestorOffsets = array.array(_INDEX_TYPECODE)
+        self._ancestorOffsets.fromstring(cache["ancestorOffsets"])
+        self._ancestors = array.array(_INDEX_TYPECODE)
+        self._ancestors.fromstring(cache["ancestors"])
+        self._buildChildIndex(parentIndexes)
+        return True
 
     def populateFromFile(self, dataUrl):
         """
@@ -72,13 +222,18 @@ class Ontology(object):
         self._dataUrl = dataUrl
         self._readFile()
 
-    def populateFromRow(self, ontologyRecord):
+    def populateFromRow(self, ontologyRecord, cachePath=None):
         """
         Populates this Ontology using values in the specified DB row.
+        The compiled cache at the specified path is used if it is up to
+        date; otherwise the OBO file is parsed.
         """
         self._id = ontologyRecord.id
         self._dataUrl = ontologyRecord.dataurl
-        self._readFile()
+        if not os.path.exists(self._dataUrl):
+            raise exceptions.FileOpenFailedException(self._dataUrl)
+        if cachePath is None or not self._readCache(cachePath):
+            self._readFile()
         # TODO sanity check the stored values against what we have just read.
 
     def getId(self):
@@ -111,6 +266,53 @@ class Ontology(object):
         """
         return self._nameIdMap[termName]
 
+    def isA(self, termId, ancestorId):
+        """
+        Returns True if the term with the specified ID is the specified
+        ancestor term or is related to it by a chain of is_a links.
+        """
+        index = self._termIndexes.get(termId)
+        ancestorIndex = self._termIndexes.get(ancestorId)
+        if index is None or ancestorIndex is None:
+            return termId == ancestorId
+        start = self._ancestorOffsets[index]
+        end = self._ancestorOffsets[index + 1]
+        position = bisect.bisect_left(
+            self._ancestors, ancestorIndex, start, end)
+        return position < end and self._ancestors[position] == ancestorIndex
+
+    def getDescendantIds(self, termId):
+        """
+        Returns the IDs of the specified term and all the terms below it
+        in the is_a hierarchy. If the term ID is not found, return the
+        empty list.
+        """
+        index = self._termIndexes.get(termId)
+        if index is None:
+            return []
+        descendants = set([index])
+        stack = [index]
+        while len(stack) > 0:
+            index = stack.pop()
+            for childIndex in self._children[
+                    self._childOffsets[index]:self._childOffsets[index + 1]]:
+                if childIndex not in descendants:
+                    descendants.add(childIndex)
+                    stack.append(childIndex)
+        return [self._termIds[i] for i in sorted(descendants)]
+
+    def getDescendantNames(self, termName):
+        """
+        Returns the names of the specified term and all the terms below it
+        in the is_a hierarchy. If the term name is not found, the list
+        holds just that name.
+        """
+        names = set([termName])
+        for termId in self.getTermIds(termName):
+            for descendantId in self.getDescendantIds(termId):
+                names.add(self._idNameMap[descendantId])
+        return sorted(names)
+
     def getGaTermByName(self, name):
         """
         Returns a GA4GH OntologyTerm object by name.
@@ -6,6 +6,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import numpy
+
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.sqlite_backend as sqlite_backend
@@ -27,6 +29,22 @@ import ga4gh.schemas.protocol as protocol
 """
 
 
+# longer lists of names are joined from a temporary table
+_maxBoundNames = 100
+
+
+def _nameColumns(names):
+    """
+    Returns a dictionary mapping each of the specified names to the
+    matrix column(s) holding its values; a name given more than once
+    fills each of its columns.
+    """
+    columns = {}
+    for column, name in enumerate(names):
+        columns.setdefault(name, []).append(column)
+    return columns
+
+
 class AbstractExpressionLevel(datamodel.DatamodelObject):
     """
     An abstract base class of a expression level
@@ -45,6 +63,12 @@ class AbstractExpressionLevel(datamodel.DatamodelObject):
         self._confIntervalLow = 0.0
         self._confIntervalHigh = 0.0
 
+    def getName(self):
+        return self._name
+
+    def getExpression(self):
+        return self._expression
+
     def toProtocolElement(self):
         protocolElement = protocol.ExpressionLevel()
         protocolElement.id = self.getId()
@@ -78,9 +102,6 @@ class SqliteExpressionLevel(AbstractExpressionLevel):
         self._confIntervalLow = record["conf_low"]
         self._confIntervalHigh = record["conf_hi"]
 
-    def getName(self):
-        return self._name
-
 
 class AbstractRnaQuantificationSet(datamodel.DatamodelObject):
     """
@@ -135,6 +156,28 @@ class AbstractRnaQuantificationSet(datamodel.DatamodelObject):
         self._rnaQuantificationIdMap[id_] = rnaQuantification
         self._rnaQuantificationIds.append(id_)
 
+    def getExpressionMatrix(self, names, threshold=0.0):
+        """
+        Returns the expression of each of the specified feature names in
+        each RnaQuantification of this set as a numpy array, with a row
+        for each RnaQuantification in the order of
+        getRnaQuantifications() and a column for each name. Entries are
+        NaN where a quantification has no expression level for a name
+        over the threshold.
+        """
+        matrix = numpy.full(
+            (len(self._rnaQuantificationIds), len(names)), numpy.nan)
+        columns = _nameColumns(names)
+        for row, rnaQuantification in enumerate(
+                self.getRnaQuantifications()):
+            for expressionLevel in rnaQuantification.getExpressionLevels(
+                    threshold=threshold, names=names):
+                if expressionLevel.getName() in columns and \
+                        expressionLevel.getExpression() > threshold:
+                    matrix[row, columns[expressionLevel.getName()]] = \
+                        expressionLevel.getExpression()
+        return matrix
+
     def toProtocolElement(self):
         """
         Converts this rnaQuant into its GA4GH protocol equivalent.
@@ -183,6 +226,25 @@ class SqliteRnaQuantificationSet(AbstractRnaQuantificationSet):
         self._db = SqliteRnaBackend(self._dbFilePath)
         self.addRnaQuants()
 
+    def getExpressionMatrix(self, names, threshold=0.0):
+        """
+        Returns the expression matrix of the specified names, as
+        AbstractRnaQuantificationSet.getExpressionMatrix does, reading
+        the levels of all quantifications in one query.
+        """
+        rows = dict(
+            (rnaQuantification.getLocalId(), row) for row, rnaQuantification
+            in enumerate(self.getRnaQuantifications()))
+        matrix = numpy.full((len(rows), len(names)), numpy.nan)
+        columns = _nameColumns(names)
+        with self._db as dataSource:
+            for rnaQuantificationId, name, expression in \
+                    dataSource.searchExpressionMatrixInDb(names, threshold):
+                if rnaQuantificationId in rows:
+                    matrix[rows[rnaQuantificationId], columns[name]] = \
+                        expression
+        return matrix
+
     def addRnaQuants(self):
         with self._db as dataSource:
             rnaQuantsReturned = dataSource.searchRnaQuantificationsInDb()
@@ -382,6 +444,50 @@ class SqliteRnaBackend(sqlite_backend.SqliteBackedDataSource):
             raise exceptions.RnaQuantificationNotFoundException(
                 rnaQuantificationId)
 
+    def _bindNames(self, names):
+        """
+        Returns the (tables, condition, args) SQL fragments restricting
+        the Expression rows of a query to the specified names. Short
+        lists are bound as an IN list; longer ones are loaded into a
+        temporary table of this connection and joined, which avoids
+        SQLite's limit on statement parameters and probes the name
+        indexes once per name.
+        """
+        if len(names) == 0:
+            return "Expression", "", []
+        if len(names) <= _maxBoundNames:
+            condition = " AND Expression.name IN ({})".format(
+                ",".join("?" * len(names)))
+            return "Expression", condition, list(names)
+        self._dbconn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS QueryName "
+            "(name TEXT PRIMARY KEY)")
+        self._dbconn.execute("DELETE FROM temp.QueryName")
+        self._dbconn.executemany(
+            "INSERT OR IGNORE INTO temp.QueryName VALUES (?)",
+            [(name,) for name in names])
+        # CROSS JOIN keeps the names as the outer loop
+        tables = (
+            "temp.QueryName CROSS JOIN Expression "
+            "ON Expression.name = QueryName.name")
+        return tables, "", []
+
+    def expressionLevelsSql(
+            self, rnaQuantId, names=[], threshold=0.0, startIndex=0,
+            maxResults=0):
+        """
+        Returns the (sql, args) of the query run by
+        searchExpressionLevelsInDb.
+        """
+        tables, namesCondition, namesArgs = self._bindNames(names)
+        sql = (
+            "SELECT Expression.* FROM {} WHERE "
+            "Expression.rna_quantification_id = ? "
+            "AND Expression.expression > ?{}").format(tables, namesCondition)
+        sql += sqlite_backend.limitsSql(
+            startIndex=startIndex, maxResults=maxResults)
+        return sql, [rnaQuantId, threshold] + namesArgs
+
     def searchExpressionLevelsInDb(
             self, rnaQuantId, names=[], threshold=0.0, startIndex=0,
             maxResults=0):
@@ -390,21 +496,37 @@ class SqliteRnaBackend(sqlite_backend.SqliteBackedDataSource):
         :param threshold: float minimum expression values to return
         :return an array of dictionaries, representing the returned data.
         """
-        sql = ("SELECT * FROM Expression WHERE "
-               "rna_quantification_id = ? "
-               "AND expression > ? ")
-        sql_args = (rnaQuantId, threshold)
-        if len(names) > 0:
-            sql += "AND name in ("
-            sql += ",".join(['?' for name in names])
-            sql += ") "
-            for name in names:
-                sql_args += (name,)
-        sql += sqlite_backend.limitsSql(
+        sql, sql_args = self.expressionLevelsSql(
+            rnaQuantId, names=names, threshold=threshold,
             startIndex=startIndex, maxResults=maxResults)
         query = self._dbconn.execute(sql, sql_args)
         return sqlite_backend.iterativeFetch(query)
 
+    def expressionMatrixSql(self, names, threshold=0.0):
+        """
+        Returns the (sql, args) of the query run by
+        searchExpressionMatrixInDb.
+        """
+        tables, namesCondition, namesArgs = self._bindNames(names)
+        sql = (
+            "SELECT Expression.rna_quantification_id, Expression.name, "
+            "Expression.expression FROM {} "
+            "WHERE Expression.expression > ?{}").format(tables, namesCondition)
+        return sql, [threshold] + namesArgs
+
+    def searchExpressionMatrixInDb(self, names, threshold=0.0):
+        """
+        :param names: list of feature names to return levels of
+        :param threshold: float minimum expression values to return
+        :return an iterator over (rna_quantification_id, name, expression)
+            tuples of the levels of the names in all quantifications.
+        """
+        if len(names) == 0:
+            return
+        sql, sql_args = self.expressionMatrixSql(names, threshold)
+        for row in self._dbconn.execute(sql, sql_args):
+            yield tuple(row)
+
     def getExpressionLevelById(self, expressionId):
         """
         :param expressionId: the ExpressionLevel ID
@@ -7,9 +7,14 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import json
+import os
 import random
+import sqlite3
+import string
+import sys
 
 import ga4gh.server.datamodel as datamodel
+import ga4gh.server.gff3 as gff3
 import ga4gh.server.sqlite_backend as sqlite_backend
 import ga4gh.server.exceptions as exceptions
 
@@ -58,6 +63,53 @@ _featureColumns = [
     ('transcript_name', 'TEXT'),  # as found in GFF3 attributes
     ('attributes', 'TEXT')]  # JSON encoding of attributes dict
 
+# rows fetched from the cursor at a time when streaming search results
+_featureFetchBatchSize = 100
+
+_featureTableSql = (
+    "CREATE TABLE FEATURE( "
+    "id INTEGER PRIMARY KEY NOT NULL, "
+    "parent_id INTEGER, "
+    "child_ids TEXT, "
+    "reference_name TEXT, "
+    "source TEXT, "
+    "type TEXT, "
+    "start INT, "
+    "end INT, "
+    "score REAL, "
+    "strand TEXT, "
+    "name TEXT,"
+    "gene_name TEXT,"
+    "transcript_name TEXT,"
+    "attributes TEXT);")
+
+
+# SQLite's lower() only folds ASCII letters, so bounds compared against
+# it must be lowered the same way.
+_asciiLowercase = dict(
+    (ord(c), ord(c.lower())) for c in string.ascii_uppercase)
+
+
+def _namePredicate(column, value, prefix=False):
+    """
+    Returns an SQL predicate and its arguments matching the specified
+    name or symbol. The value must equal the column exactly unless
+    prefix is set, in which case it is a case-insensitive prefix of the
+    column, answered from the lower() indexes written by Gff3DbImporter.
+    """
+    if not prefix:
+        return "AND {} = ? ".format(column), (value,)
+    lowerBound = unicode(value).translate(_asciiLowercase)
+    # The smallest string greater than every string starting with
+    # lowerBound, if there is one
+    upperBound = lowerBound.rstrip(unichr(sys.maxunicode))
+    if upperBound == '':
+        return "AND lower({}) >= ? ".format(column), (lowerBound,)
+    upperBound = upperBound[:-1] + unichr(ord(upperBound[-1]) + 1)
+    return (
+        "AND lower({0}) >= ? AND lower({0}) < ? ".format(column),
+        (lowerBound, upperBound))
+
 
 class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
     """
@@ -83,14 +135,46 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
         """
         # TODO: Optimize by refactoring out string concatenation
         sql = ""
-        sql_rows = "SELECT * FROM FEATURE WHERE id > 1 "
+        sql_rows = "SELECT * FROM FEATURE WHERE 1 "
         sql_args = ()
+        depth = kwargs.get('depth', 1)
+        subtree = bool(kwargs.get('parentId')) and depth != 1
+        if subtree:
+            # Walk parent_id links down from the requested parent in a
+            # single statement; the remaining filters apply to the rows
+            # of the whole subtree.
+            if depth > 1:
+                sql_rows = (
+                    "WITH RECURSIVE subtree(id, level) AS ("
+                    "SELECT id, 1 FROM FEATURE WHERE parent_id = ? "
+                    "UNION ALL "
+                    "SELECT FEATURE.id, subtree.level + 1 "
+                    "FROM FEATURE JOIN subtree "
+                    "ON FEATURE.parent_id = subtree.id "
+                    "WHERE subtree.level < ?) ")
+                sql_args += (kwargs['parentId'], depth)
+            else:
+                sql_rows = (
+                    "WITH RECURSIVE subtree(id) AS ("
+                    "SELECT id FROM FEATURE WHERE parent_id = ? "
+                    "UNION "
+                    "SELECT FEATURE.id "
+                    "FROM FEATURE JOIN subtree "
+                    "ON FEATURE.parent_id = subtree.id) ")
+                sql_args += (kwargs['parentId'],)
+            sql_rows += (
+                "SELECT FEATURE.* FROM subtree JOIN FEATURE "
+                "ON FEATURE.id = subtree.id WHERE 1 ")
+        prefix = kwargs.get('prefix', False)
         if 'name' in kwargs and kwargs['name']:
-            sql += "AND name = ? "
-            sql_args += (kwargs.get('name'),)
+            predicate, args = _namePredicate('name', kwargs['name'], prefix)
+            sql += predicate
+            sql_args += args
         if 'geneSymbol' in kwargs and kwargs['geneSymbol']:
-            sql += "AND gene_name = ? "
-            sql_args += (kwargs.get('geneSymbol'),)
+            predicate, args = _namePredicate(
+                'gene_name', kwargs['geneSymbol'], prefix)
+            sql += predicate
+            sql_args += args
         if 'start' in kwargs and kwargs['start'] is not None:
             sql += "AND end > ? "
             sql_args += (kwargs.get('start'),)
@@ -100,7 +184,7 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
         if 'referenceName' in kwargs and kwargs['referenceName']:
             sql += "AND reference_name = ?"
             sql_args += (kwargs.get('referenceName'),)
-        if 'parentId' in kwargs and kwargs['parentId']:
+        if 'parentId' in kwargs and kwargs['parentId'] and not subtree:
             sql += "AND parent_id = ? "
             sql_args += (kwargs['parentId'],)
         if kwargs.get('featureTypes') is not None \
@@ -110,16 +194,27 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
             sql += ") "
             sql_args += tuple(kwargs.get('featureTypes'))
         sql_rows += sql
-        sql_rows += " ORDER BY reference_name, start, end ASC "
+        # id breaks ties so that LIMIT/OFFSET pages are stable
+        sql_rows += " ORDER BY reference_name, start, end, FEATURE.id ASC "
         return sql_rows, sql_args
 
-    def searchFeaturesInDb(
+    def searchFeaturesInDb(self, *args, **kwargs):
+        """
+        Perform a full features query in database, taking the arguments
+        of iterativeSearchFeaturesInDb.
+
+        :return an array of dictionaries, representing the returned data.
+        """
+        return list(self.iterativeSearchFeaturesInDb(*args, **kwargs))
+
+    def iterativeSearchFeaturesInDb(
             self, startIndex=0, maxResults=None,
             referenceName=None, start=None, end=None,
             parentId=None, featureTypes=None,
-            name=None, geneSymbol=None):
+            name=None, geneSymbol=None, depth=1, prefix=False):
         """
-        Perform a full features query in database.
+        Perform a features query in database, fetching rows from the
+        cursor in batches as they are consumed.
 
         :param startIndex: int representing first record to return
         :param maxResults: int representing number of records to return
@@ -129,17 +224,21 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
         :param parentId: string restrict search by id of parent node.
         :param name: match features by name
         :param geneSymbol: match features by gene symbol
-        :return an array of dictionaries, representing the returned data.
+        :param depth: number of levels below parentId to return, where
+            1 is the direct children and 0 the whole subtree
+        :param prefix: whether name and geneSymbol are case-insensitive
+            prefixes rather than exact values
+        :return a generator of dictionaries, representing the returned data.
         """
         # TODO: Refactor out common bits of this and the above count query.
         sql, sql_args = self.featuresQuery(
             startIndex=startIndex, maxResults=maxResults,
             referenceName=referenceName, start=start, end=end,
             parentId=parentId, featureTypes=featureTypes,
-            name=name, geneSymbol=geneSymbol)
+            name=name, geneSymbol=geneSymbol, depth=depth, prefix=prefix)
         sql += sqlite_backend.limitsSql(startIndex, maxResults)
         query = self._dbconn.execute(sql, sql_args)
-        return sqlite_backend.sqliteRowsToDicts(query.fetchall())
+        return sqlite_backend.iterativeFetch(query, _featureFetchBatchSize)
 
     def getFeatureById(self, featureId):
         """
@@ -157,6 +256,179 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
         return sqlite_backend.sqliteRowToDict(ret)
 
 
+def _dbSerialize(pyData):
+    return json.dumps(pyData, separators=(',', ':'))
+
+
+def _gaFeatureBody(
+        referenceName, start, end, name, strand, featureType, attributes):
+    """
+    Returns a protocol.Feature holding the fields of a feature that do
+    not depend on the feature set serving it. The feature type carries
+    only its term name; IDs are left for the feature set to fill in.
+
+    :param attributes: dict of lists of strings, as parsed from GFF3
+    """
+    gaFeature = protocol.Feature()
+    gaFeature.reference_name = pb.string(referenceName)
+    gaFeature.start = pb.int(start)
+    gaFeature.end = pb.int(end)
+    gaFeature.name = pb.string(name)
+    if strand == '-':
+        gaFeature.strand = protocol.NEG_STRAND
+    else:
+        # default to positive strand
+        gaFeature.strand = protocol.POS_STRAND
+    gaFeature.feature_type.term = pb.string(featureType)
+    # TODO: Identify which values are ExternalIdentifiers and OntologyTerms
+    for key in attributes:
+        for v in attributes[key]:
+            gaFeature.attributes.attr[key].values.add().string_value = v
+    if 'gene_name' in attributes and len(attributes['gene_name']) > 0:
+        gaFeature.gene_symbol = pb.string(attributes['gene_name'][0])
+    return gaFeature
+
+
+class Gff3DbImporter(object):
+    """
+    Converts a GFF3 file into the SQLite feature database read by
+    Gff3DbBackend.
+
+    The GFF3 file is parsed one line at a time and rows are written in
+    large batches inside a single transaction, so memory use is bounded
+    by the batch size rather than by the size of the file. Parent/child
+    links are recorded in a temporary table while loading and resolved
+    afterwards in SQL; indexes are built once all rows are in place.
+    Feature IDs are assigned sequentially in file order.
+    """
+    def __init__(self, gff3File, dbFile, batchSize=10000):
+        """
+        :param gff3File: source GFF3 filename (can be compressed)
+        :param dbFile: destination sqlite filename; must not exist yet
+        :param batchSize: number of rows sent to the DB per executemany
+        """
+        self._gff3File = gff3File
+        self._dbFile = dbFile
+        self._batchSize = batchSize
+        self._featureRows = []
+        self._parentRows = []
+
+    def run(self):
+        """
+        Runs the import, returning the number of features written.
+        """
+        dbconn = sqlite3.connect(self._dbFile, isolation_level=None)
+        try:
+            cursor = dbconn.cursor()
+            # Durability is pointless until the load completes, as a
+            # partially written file is removed below anyway.
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.execute("BEGIN")
+            cursor.execute(_featureTableSql)
+            cursor.execute(
+                "CREATE TEMP TABLE feature_parent ("
+                "feature_id INTEGER, parent_name TEXT)")
+            numFeatures = self._loadFeatures(cursor)
+            self._linkFeatures(cursor)
+            self._createIndices(cursor)
+            cursor.execute("COMMIT")
+        except:
+            dbconn.close()
+            os.unlink(self._dbFile)
+            raise
+        dbconn.close()
+        return numFeatures
+
+    def _flush(self, cursor):
+        if len(self._featureRows) > 0:
+            cursor.executemany(
+                "INSERT INTO FEATURE VALUES "
+                "(?,?,?,?,?,?,?,?,?,?,?,?,?,?)", self._featureRows)
+            self._featureRows = []
+        if len(self._parentRows) > 0:
+            cursor.executemany(
+                "INSERT INTO feature_parent VALUES (?,?)", self._parentRows)
+            self._parentRows = []
+
+    def _loadFeatures(self, cursor):
+        parser = gff3.Gff3Parser(self._gff3File)
+        numFeatures = 0
+        for feature in parser.iterFeatures():
+            numFeatures += 1
+            featureId = numFeatures
+            for parentName in feature.attributes.get("Parent", []):
+                self._parentRows.append((featureId, parentName))
+            self._featureRows.append((
+                featureId,
+                '',
+                '[]',
+                feature.seqname,
+                feature.source,
+                feature.type,
+                feature.start,
+                feature.end,
+                feature.score,
+                feature.strand,
+                feature.featureName,
+                feature.attributes.get("gene_name", [None])[0],
+                feature.attributes.get("transcript_name", [None])[0],
+                _dbSerialize(feature.attributes)))
+            if len(self._featureRows) >= self._batchSize:
+                self._flush(cursor)
+        self._flush(cursor)
+        return numFeatures
+
+    def _linkFeatures(self, cursor):
+        """
+        Fills in the parent_id and child_ids columns from the GFF3
+        Parent attributes recorded during the load. A GFF3 feature may
+        be disjoint (several rows sharing a name); every part of a
+        parent lists the child, and a child points at the first part
+        of its first parent.
+        """
+        cursor.execute("CREATE INDEX name_index ON FEATURE (name)")
+        cursor.execute(
+            "CREATE INDEX temp.feature_parent_name_index "
+            "ON feature_parent (parent_name)")
+        cursor.execute(
+            "CREATE INDEX temp.feature_parent_id_index "
+            "ON feature_parent (feature_id)")
+        cursor.execute(
+            "SELECT link.parent_name FROM feature_parent AS link "
+            "LEFT JOIN FEATURE AS parent ON parent.name = link.parent_name "
+            "WHERE parent.id IS NULL LIMIT 1")
+        missing = cursor.fetchone()
+        if missing is not None:
+            raise gff3.GFF3Exception(
+                "Parent feature does not exist: {}".format(missing[0]),
+                self._gff3File)
+        cursor.execute(
+            "UPDATE FEATURE SET parent_id = ("
+            "SELECT parent.id FROM feature_parent AS link "
+            "JOIN FEATURE AS parent ON parent.name = link.parent_name "
+            "WHERE link.feature_id = FEATURE.id "
+            "ORDER BY link.rowid, parent.id LIMIT 1) "
+            "WHERE id IN (SELECT feature_id FROM feature_parent)")
+        cursor.execute(
+            "UPDATE FEATURE SET child_ids = '[' || ("
+            "SELECT group_concat(DISTINCT link.feature_id) "
+            "FROM feature_parent AS link "
+            "WHERE link.parent_name = FEATURE.name) || ']' "
+            "WHERE name IN (SELECT parent_name FROM feature_parent)")
+        cursor.execute("DROP TABLE feature_parent")
+
+    def _createIndices(self, cursor):
+        cursor.execute(
+            "CREATE INDEX idx1 ON FEATURE (start, end, reference_name)")
+        cursor.execute("CREATE INDEX parent_index ON FEATURE (parent_id)")
+        cursor.execute(
+            "CREATE INDEX gene_name_index ON FEATURE (gene_name)")
+        for column in ['name', 'gene_name']:
+            cursor.execute(
+                "CREATE INDEX {0}_lower_index ON FEATURE (lower({0}))".format(
+                    column))
+
+
 class AbstractFeatureSet(datamodel.DatamodelObject):
     """
     A set of sequence features annotations
@@ -273,7 +545,8 @@ class SimulatedFeatureSet(AbstractFeatureSet):
     def getFeatures(self, referenceName=None, start=None, end=None,
                     startIndex=None, maxResults=None,
                     featureTypes=None, parentId=None,
-                    name=None, geneSymbol=None, numFeatures=10):
+                    name=None, geneSymbol=None, depth=1, prefix=False,
+                    numFeatures=10):
         """
         Returns a set number of simulated features.
 
@@ -286,6 +559,8 @@ class SimulatedFeatureSet(AbstractFeatureSet):
         :param parentId: optional parentId to limit query.
         :param name: the name of the feature
         :param geneSymbol: the symbol for the gene the features are on
+        :param depth: number of hierarchy levels below parentId to return
+        :param prefix: whether name and geneSymbol are prefixes
         :param numFeatures: number of features to generate in the return.
             10 is a reasonable (if arbitrary) default.
         :return: Yields feature list
@@ -316,6 +591,7 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         self._ontology = None
         self._dbFilePath = None
         self._db = None
+        self._featureTypeTerms = {}
 
     def setOntology(self, ontology):
         """
@@ -372,12 +648,27 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
             gaFeature = self._gaFeatureForFeatureDbRecord(featureReturned)
             return gaFeature
 
+    def _getGaFeatureType(self, name):
+        """
+        Returns the OntologyTerm for the specified feature type name,
+        memoised as a feature set uses only a handful of types.
+        """
+        term = self._featureTypeTerms.get(name)
+        if term is None:
+            term = self._ontology.getGaTermByName(name)
+            self._featureTypeTerms[name] = term
+        return term
+
     def _gaFeatureForFeatureDbRecord(self, feature):
         """
         :param feature: The DB Row representing a feature
         :return: the corresponding GA4GH protocol.Feature object
         """
-        gaFeature = protocol.Feature()
+        gaFeature = _gaFeatureBody(
+            feature.get('reference_name'), feature.get('start'),
+            feature.get('end'), feature.get('name'),
+            feature.get('strand', ''), feature['type'],
+            json.loads(feature['attributes']))
         gaFeature.id = self.getCompoundIdForFeatureId(feature['id'])
         if feature.get('parent_id'):
             gaFeature.parent_id = self.getCompoundIdForFeatureId(
@@ -385,33 +676,17 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         else:
             gaFeature.parent_id = ""
         gaFeature.feature_set_id = self.getId()
-        gaFeature.reference_name = pb.string(feature.get('reference_name'))
-        gaFeature.start = pb.int(feature.get('start'))
-        gaFeature.end = pb.int(feature.get('end'))
-        gaFeature.name = pb.string(feature.get('name'))
-        if feature.get('strand', '') == '-':
-            gaFeature.strand = protocol.NEG_STRAND
-        else:
-            # default to positive strand
-            gaFeature.strand = protocol.POS_STRAND
         gaFeature.child_ids.extend(map(
                 self.getCompoundIdForFeatureId,
                 json.loads(feature['child_ids'])))
         gaFeature.feature_type.CopyFrom(
-            self._ontology.getGaTermByName(feature['type']))
-        attributes = json.loads(feature['attributes'])
-        # TODO: Identify which values are ExternalIdentifiers and OntologyTerms
-        for key in attributes:
-            for v in attributes[key]:
-                gaFeature.attributes.attr[key].values.add().string_value = v
-        if 'gene_name' in attributes and len(attributes['gene_name']) > 0:
-            gaFeature.gene_symbol = pb.string(attributes['gene_name'][0])
+            self._getGaFeatureType(feature['type']))
         return gaFeature
 
     def getFeatures(self, referenceName=None, start=None, end=None,
                     startIndex=None, maxResults=None,
                     featureTypes=None, parentId=None,
-                    name=None, geneSymbol=None):
+                    name=None, geneSymbol=None, depth=1, prefix=False):
         """
         method passed to runSearchRequest to fulfill the request
         :param str referenceName: name of reference (ex: "chr1")
@@ -419,19 +694,32 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         :param end: castable to int, end position on reference
         :param startIndex: none or castable to int
         :param maxResults: none or castable to int
-        :param featureTypes: array of str
+        :param featureTypes: array of str; a type also matches the types
+            below it in the ontology's is_a hierarchy
         :param parentId: none or featureID of parent
         :param name: the name of the feature
         :param geneSymbol: the symbol for the gene the features are on
+        :param depth: number of hierarchy levels below parentId to return;
+            0 returns the whole subtree
+        :param prefix: whether name and geneSymbol are case-insensitive
+            prefixes rather than exact values
         :return: yields a protocol.Feature at a time
         """
-        with self._db as dataSource:
-            features = dataSource.searchFeaturesInDb(
+        if featureTypes and self._ontology is not None:
+            featureTypes = sorted(set(
+                descendantName for featureType in featureTypes
+                for descendantName in self._ontology.getDescendantNames(
+                    featureType)))
+        # The connection stays open while the caller holds the generator,
+        # so each search gets its own rather than sharing self._db's.
+        with Gff3DbBackend(self._dbFilePath) as dataSource:
+            features = dataSource.iterativeSearchFeaturesInDb(
                 startIndex, maxResults,
                 referenceName=referenceName,
                 start=start, end=end,
                 parentId=parentId, featureTypes=featureTypes,
-                name=name, geneSymbol=geneSymbol)
+                name=name, geneSymbol=geneSymbol, depth=depth,
+                prefix=prefix)
             for feature in features:
                 gaFeature = self._gaFeatureForFeatureDbRecord(feature)
                 yield gaFeature
@@ -766,10 +766,20 @@ class SqlDataRepository(AbstractDataRepository):
         # TODO we need to create a proper ID when we're doing ID generation
         # for the rest of the container objects.
 
+    def getOntologyCachePath(self, ontologyName):
+        """
+        Returns the path of the compiled cache of the specified ontology,
+        in a directory next to the registry database.
+        """
+        return os.path.join(
+            self._dbFilename + ".ontologies",
+            ontologyName + ontologies.CACHE_EXTENSION)
+
     def _readOntologyTable(self):
         for ont in models.Ontology.select():
             ontology = ontologies.Ontology(ont.name)
-            ontology.populateFromRow(ont)
+            ontology.populateFromRow(
+                ont, self.getOntologyCachePath(ont.name))
             self.addOntology(ontology)
 
     def removeOntology(self, ontology):
@@ -1202,7 +1212,10 @@ class SqlDataRepository(AbstractDataRepository):
     def _readContinuousSetTable(self):
         for continuousSetRecord in models.ContinuousSet.select():
             dataset = self.getDataset(continuousSetRecord.datasetid.id)
-            continuousSet = continuous.FileContinuousSet(
+            continuousSetClass = continuous.FileContinuousSet
+            if continuous.isTrackPath(continuousSetRecord.dataurl):
+                continuousSetClass = continuous.TrackContinuousSet
+            continuousSet = continuousSetClass(
                     dataset, continuousSetRecord.name)
             continuousSet.setReferenceSet(
                 self.getReferenceSet(
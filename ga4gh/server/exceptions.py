@@ -117,11 +117,28 @@ class BadRequestIntegerException(BadRequestException):
                 attrName, intString)
 
 
+class BadRequestBooleanException(BadRequestException):
+    def __init__(self, attrName, boolString):
+        self.message = \
+            "{} argument '{}' could not be parsed as a boolean".format(
+                attrName, boolString)
+
+
 class BadPageSizeException(BadRequestException):
     def __init__(self, pageSize):
         self.message = "Request page size '{}' is invalid".format(pageSize)
 
 
+class BadFeatureDepthException(BadRequestException):
+    def __init__(self, depth):
+        self.message = "Feature search depth '{}' is invalid".format(depth)
+
+
+class BadContinuousSummaryException(BadRequestException):
+    def __init__(self, message):
+        self.message = "Invalid continuous summary: {}".format(message)
+
+
 class BadPageTokenException(BadRequestException):
     message = "Request page token invalid"
 
@@ -145,6 +162,11 @@ class InvalidJsonException(BadRequestException):
         self.message = "Cannot parse JSON: '{}'".format(jsonString)
 
 
+class BadBatchRequestException(BadRequestException):
+    def __init__(self, message):
+        self.message = "Invalid batch request: {}".format(message)
+
+
 class Validator(object):
     """
     Check that a JSON dictionary is a valid representation of a protocol
@@ -578,6 +600,16 @@ class OntologyFileFormatException(DataException):
             filename, message)
 
 
+class ContinuousFileFormatException(DataException):
+    """
+    Exception thrown when an error occurs converting a wiggle or
+    bedGraph file into a continuous track.
+    """
+    def __init__(self, filename, message):
+        self.message = "Error processing continuous data file '{}': {}".format(
+            filename, message)
+
+
 class MalformedException(DataException):
     """
     A base exception class for exceptions thrown when faulty VCF file
@@ -9,6 +9,9 @@ from __future__ import unicode_literals
 
 import os
 import datetime
+import json
+import multiprocessing.pool
+import threading
 import socket
 import urlparse
 import functools
@@ -27,7 +30,9 @@ from werkzeug.contrib.cache import FileSystemCache
 
 import ga4gh.server
 import ga4gh.server.backend as backend
+import ga4gh.server.compression as compression
 import ga4gh.server.datamodel as datamodel
+import ga4gh.server.datamodel.genotype_phenotype as genotype_phenotype
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.datarepo as datarepo
 import ga4gh.server.auth as auth
@@ -36,8 +41,36 @@ import ga4gh.server.network as network
 import ga4gh.schemas.protocol as protocol
 
 MIMETYPE = "application/json"
+EXPORT_MIMETYPE = "application/x-ndjson"
 SEARCH_ENDPOINT_METHODS = ['POST', 'OPTIONS']
 SECRET_KEY_LENGTH = 24
+# The endpoints that read bulk data rather than metadata, which the
+# prefork server can serve from their own pool of threads
+BULK_DATA_PATHS = frozenset([
+    '/listreferencebases',
+    '/reads/search',
+    '/variants/search',
+    '/variantannotations/search',
+    '/features/search',
+    '/continuous/search',
+    '/expressionlevels/search',
+    '/phenotypes/search',
+    '/featurephenotypeassociations/search',
+    '/batch',
+    '/reads/export',
+    '/variants/export',
+    '/features/export',
+])
+# The names of the view functions of the API endpoints
+API_ENDPOINTS = set()
+# The ((pid, size), pool) of the threads running the sub-requests of
+# batches; see getBatchPool
+_batchPool = (None, None)
+_batchPoolLock = threading.Lock()
+# The API endpoints that cannot be called in a batch, as their responses
+# are not buffered
+NON_BATCH_ENDPOINTS = frozenset([
+    'runBatch', 'exportReads', 'exportVariants', 'exportFeatures'])
 
 app = flask.Flask(__name__)
 assert not hasattr(app, 'urls')
@@ -90,10 +123,29 @@ class ServerStatus(object):
         # TODO what other config keys are appropriate to export here?
         keys = [
             'DEBUG', 'REQUEST_VALIDATION',
-            'DEFAULT_PAGE_SIZE', 'MAX_RESPONSE_LENGTH', 'LANDING_MESSAGE_HTML'
+            'DEFAULT_PAGE_SIZE', 'MAX_RESPONSE_LENGTH', 'LANDING_MESSAGE_HTML',
+            'G2P_QUERY_CACHE_MAX_SIZE', 'G2P_QUERY_CACHE_TIME_TO_LIVE',
+            'RESPONSE_CACHE_MAX_SIZE', 'RESPONSE_COMPRESSION_ENCODINGS',
+            'RESPONSE_COMPRESSION_MIN_SIZE', 'GZIP_COMPRESSION_LEVEL',
+            'ZSTD_COMPRESSION_LEVEL', 'BATCH_MAX_REQUESTS',
+            'BATCH_MAX_THREADS', 'EXPORT_CHECKPOINT_INTERVAL'
         ]
         return [(k, app.config[k]) for k in keys]
 
+    def getG2pQueryCacheStatistics(self):
+        """
+        Returns the hit, miss and entry counts of the genotype-phenotype
+        search results cache.
+        """
+        return genotype_phenotype.associationQueryCache.getStatistics()
+
+    def getResponseCacheStatistics(self):
+        """
+        Returns the hit, miss and entry counts of the metadata response
+        cache.
+        """
+        return app.backend.getResponseCache().getStatistics()
+
     def getPreciseUptime(self):
         """
         Returns the server precisely.
@@ -200,6 +252,15 @@ class ServerStatus(object):
             datasetId).getRnaQuantificationSets()
 
 
+def isBulkDataPath(path):
+    """
+    Returns True if the specified request path is that of an endpoint
+    reading bulk data.
+    """
+    path = path.split('?', 1)[0].rstrip('/')
+    return path in BULK_DATA_PATHS or path.endswith('/expressionmatrix')
+
+
 def reset():
     """
     Resets the flask app; used in testing
@@ -264,6 +325,9 @@ def _configure_backend(app):
     theBackend.setRequestValidation(app.config["REQUEST_VALIDATION"])
     theBackend.setDefaultPageSize(app.config["DEFAULT_PAGE_SIZE"])
     theBackend.setMaxResponseLength(app.config["MAX_RESPONSE_LENGTH"])
+    theBackend.setResponseCacheMaxSize(app.config["RESPONSE_CACHE_MAX_SIZE"])
+    theBackend.setExportCheckpointInterval(
+        app.config["EXPORT_CHECKPOINT_INTERVAL"])
     return theBackend
 
 
@@ -286,6 +350,14 @@ def configure(configFile=None, baseConfig="ProductionConfig",
     # Setup file handle cache max size
     datamodel.fileHandleCache.setMaxCacheSize(
         app.config["FILE_HANDLE_CACHE_MAX_SIZE"])
+    # Setup the G2P graphs and search results cache, which must not
+    # outlive the data repository they were loaded from
+    genotype_phenotype.clearRdfGraphs()
+    genotype_phenotype.associationQueryCache.clear()
+    genotype_phenotype.associationQueryCache.setMaxCacheSize(
+        app.config["G2P_QUERY_CACHE_MAX_SIZE"])
+    genotype_phenotype.associationQueryCache.setTimeToLive(
+        app.config["G2P_QUERY_CACHE_TIME_TO_LIVE"])
     # Setup CORS
     try:
         cors.CORS(app, allow_headers='Content-Type')
@@ -361,8 +433,28 @@ def configure(configFile=None, baseConfig="ProductionConfig",
 def getFlaskResponse(responseString, httpStatus=200):
     """
     Returns a Flask response object for the specified data and HTTP status.
+    Cached responses carry an ETag; if the client already holds the
+    response, as indicated by a matching If-None-Match header, a body-less
+    304 (Not Modified) response is returned instead.
     """
-    return flask.Response(responseString, status=httpStatus, mimetype=MIMETYPE)
+    etag = getattr(responseString, "etag", None)
+    if etag is None or httpStatus != 200:
+        return flask.Response(
+            responseString, status=httpStatus, mimetype=MIMETYPE)
+    response = flask.Response(
+        responseString, status=httpStatus, mimetype=MIMETYPE)
+    response.set_etag(etag)
+    if flask.has_request_context():
+        # The client may hold any encoding of the response
+        for encoding in [None] + compression.getAvailableEncodings():
+            tag = etag
+            if encoding is not None:
+                tag = compression.getEncodedEtag(etag, encoding)
+            if flask.request.if_none_match.contains(tag):
+                response = flask.Response(status=304)
+                response.set_etag(tag)
+                break
+    return response
 
 
 def handleHttpPost(request, endpoint):
@@ -379,6 +471,20 @@ def handleHttpPost(request, endpoint):
     return getFlaskResponse(responseStr)
 
 
+def handleHttpExport(request, endpoint):
+    """
+    Handles the specified HTTP POST request to an export endpoint, whose
+    response is streamed as newline-delimited JSON.
+    """
+    if request.mimetype and request.mimetype != MIMETYPE:
+        raise exceptions.UnsupportedMediaTypeException()
+    request = request.get_data()
+    if request == '' or request is None:
+        request = '{}'
+    chunks = endpoint(request)
+    return flask.Response(chunks, mimetype=EXPORT_MIMETYPE)
+
+
 def handleList(endpoint, request):
     """
     Handles the specified HTTP GET request, mapping to a list request
@@ -405,17 +511,25 @@ def handleHttpOptions():
     return response
 
 
+def toServerException(exception):
+    """
+    Returns the specified exception if it is a server exception, or else
+    logs it and returns a ServerError to be sent back to the client.
+    """
+    if isinstance(exception, exceptions.BaseServerException):
+        return exception
+    with app.test_request_context():
+        app.log_exception(exception)
+    return exceptions.getServerError(exception)
+
+
 @app.errorhandler(Exception)
 def handleException(exception):
     """
     Handles an exception that occurs somewhere in the process of handling
     a request.
     """
-    serverException = exception
-    if not isinstance(exception, exceptions.BaseServerException):
-        with app.test_request_context():
-            app.log_exception(exception)
-        serverException = exceptions.getServerError(exception)
+    serverException = toServerException(exception)
     error = serverException.toProtocolElement()
     # If the exception is being viewed by a web browser, we can render a nicer
     # view.
@@ -455,6 +569,43 @@ def startLogin():
     return flask.redirect(result.url)
 
 
+@app.after_request
+def compressResponse(response):
+    """
+    Compresses the response with the preferred content coding that the
+    client accepts, if it is of a compressible type and at least
+    RESPONSE_COMPRESSION_MIN_SIZE bytes long. Streamed responses, whose
+    size is not known, are compressed as they are streamed.
+    """
+    encodings = app.config.get("RESPONSE_COMPRESSION_ENCODINGS")
+    if (not encodings or response.status_code != 200 or
+            response.mimetype not in compression.COMPRESSIBLE_MIMETYPES or
+            "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = compression.negotiateEncoding(
+        flask.request.accept_encodings, encodings)
+    if encoding is None:
+        return response
+    level = app.config[
+        "ZSTD_COMPRESSION_LEVEL" if encoding == compression.ZSTD
+        else "GZIP_COMPRESSION_LEVEL"]
+    if response.is_streamed:
+        response.response = compression.compressChunks(
+            response.response, encoding, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config["RESPONSE_COMPRESSION_MIN_SIZE"]:
+            return response
+        response.set_data(compression.compress(data, encoding, level))
+    response.headers["Content-Encoding"] = encoding
+    etag, _ = response.get_etag()
+    if etag is not None:
+        response.set_etag(compression.getEncodedEtag(etag, encoding))
+    return response
+
+
 @app.before_request
 def checkAuthentication():
     """
@@ -503,6 +654,48 @@ def handleFlaskListRequest(id_, flaskRequest, endpoint):
     return handleList(endpoint, flaskRequest)
 
 
+def getIntegerArgument(name, default):
+    """
+    Returns the value of the specified query string argument of the
+    current request as an integer, or default if it is not present.
+    """
+    value = flask.request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise exceptions.BadRequestIntegerException(name, value)
+
+
+def getBooleanArgument(name, default):
+    """
+    Returns the value of the specified query string argument of the
+    current request as a boolean, or default if it is not present.
+    """
+    value = flask.request.args.get(name)
+    if value is None:
+        return default
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    raise exceptions.BadRequestBooleanException(name, value)
+
+
+def handleFlaskExportRequest(flaskRequest, endpoint):
+    """
+    Handles the specified flask request for one of the export URLs.
+    Invokes the specified endpoint to generate the streamed response.
+    """
+    if flaskRequest.method == "POST":
+        return handleHttpExport(flaskRequest, endpoint)
+    elif flaskRequest.method == "OPTIONS":
+        return handleHttpOptions()
+    else:
+        raise exceptions.MethodNotAllowedException()
+
+
 def handleFlaskPostRequest(flaskRequest, endpoint):
     """
     Handles the specified flask request for one of the POST URLS
@@ -516,6 +709,118 @@ def handleFlaskPostRequest(flaskRequest, endpoint):
         raise exceptions.MethodNotAllowedException()
 
 
+def parseBatchRequest(requestStr):
+    """
+    Parses the specified batch request, which is a JSON object whose
+    requests attribute lists the sub-requests as objects with a method
+    (GET or POST; the default is POST), a path, which may include a query
+    string, and, for POST requests, an optional body. Returns a list of
+    (method, path, body) tuples, where body is a JSON string.
+    """
+    try:
+        batch = json.loads(requestStr or '{}')
+    except ValueError:
+        raise exceptions.InvalidJsonException(requestStr)
+    if not isinstance(batch, dict) or \
+            not isinstance(batch.get('requests'), list):
+        raise exceptions.BadBatchRequestException(
+            "requests must be a list")
+    maxRequests = app.config["BATCH_MAX_REQUESTS"]
+    if len(batch['requests']) > maxRequests:
+        raise exceptions.BadBatchRequestException(
+            "at most {} requests are allowed".format(maxRequests))
+    subRequests = []
+    for subRequest in batch['requests']:
+        if not isinstance(subRequest, dict) or \
+                not isinstance(subRequest.get('path'), basestring):
+            raise exceptions.BadBatchRequestException(
+                "each request must have a path")
+        method = subRequest.get('method', 'POST')
+        if method not in ('GET', 'POST'):
+            raise exceptions.BadBatchRequestException(
+                "unsupported method '{}'".format(method))
+        subRequests.append((
+            method, subRequest['path'],
+            json.dumps(subRequest.get('body', {}))))
+    return subRequests
+
+
+def runBatchSubRequest(subRequest, headers):
+    """
+    Runs the specified (method, path, body) sub-request of a batch through
+    the view function of its API endpoint, and returns the (status, body)
+    pair of its response. Errors are returned as the response, as they
+    would be for a request of their own.
+    """
+    method, path, body = subRequest
+    try:
+        with app.test_request_context(
+                path, method=method, data=body, content_type=MIMETYPE,
+                headers=headers):
+            routingException = flask.request.routing_exception
+            if isinstance(
+                    routingException, werkzeug.exceptions.MethodNotAllowed):
+                raise exceptions.MethodNotAllowedException()
+            endpoint = flask.request.endpoint
+            if routingException is not None or \
+                    endpoint not in API_ENDPOINTS or \
+                    endpoint in NON_BATCH_ENDPOINTS:
+                raise exceptions.PathNotFoundException()
+            response = app.view_functions[endpoint](
+                **flask.request.view_args)
+            return response.status_code, response.get_data()
+    except Exception as exception:
+        serverException = toServerException(exception)
+        error = serverException.toProtocolElement()
+        return serverException.httpStatus, protocol.toJson(error)
+
+
+def getBatchPool():
+    """
+    Returns the pool of BATCH_MAX_THREADS threads that run the
+    sub-requests of batches, creating it if the calling process has none.
+    The threads are long-lived, so they reuse the file handles they open.
+    """
+    global _batchPool
+    key = (os.getpid(), app.config["BATCH_MAX_THREADS"])
+    with _batchPoolLock:
+        poolKey, pool = _batchPool
+        if poolKey != key:
+            if pool is not None and poolKey[0] == key[0]:
+                # BATCH_MAX_THREADS has changed: let the old pool's
+                # threads finish their work and exit
+                pool.close()
+            # Otherwise the pool, if any, was created by the parent
+            # process; its threads were not copied by the fork, so it is
+            # dropped without being closed
+            pool = multiprocessing.pool.ThreadPool(key[1])
+            _batchPool = key, pool
+        return pool
+
+
+def handleBatchRequest(flaskRequest):
+    """
+    Handles the specified batch request, running its sub-requests
+    concurrently on the threads of the batch pool. The response lists the
+    status and body of the response to each sub-request, in the order of
+    the sub-requests.
+    """
+    if flaskRequest.mimetype and flaskRequest.mimetype != MIMETYPE:
+        raise exceptions.UnsupportedMediaTypeException()
+    subRequests = parseBatchRequest(flaskRequest.get_data())
+    # Sub-requests are authorized like requests of their own
+    headers = {}
+    if 'Authorization' in flaskRequest.headers:
+        headers['Authorization'] = flaskRequest.headers['Authorization']
+    results = getBatchPool().map(
+        functools.partial(runBatchSubRequest, headers=headers), subRequests)
+    # The bodies are JSON already, so they are spliced in as they are
+    responseStr = '{{"responses": [{}]}}'.format(', '.join(
+        '{{"status": {}, "body": {}}}'.format(status, body.decode('utf-8'))
+        for status, body in results))
+    return getFlaskResponse(responseStr)
+
+
 class DisplayedRoute(object):
     """
     Registers that a route should be displayed on the html page
@@ -534,6 +839,7 @@ class DisplayedRoute(object):
         app.urls.append((methodDisplay, pathDisplay))
 
     def __call__(self, func):
+        API_ENDPOINTS.add(func.func_name)
         if self.methods is None:
             app.add_url_rule(self.path, func.func_name, func)
         else:
@@ -660,6 +966,13 @@ def searchReads():
         flask.request, app.backend.runSearchReads)
 
 
+@DisplayedRoute('/reads/export', postMethod=True)
+@requires_auth
+def exportReads():
+    return handleFlaskExportRequest(
+        flask.request, app.backend.runExportReads)
+
+
 @DisplayedRoute('/referencesets/search', postMethod=True)
 def searchReferenceSets():
     return handleFlaskPostRequest(
@@ -684,6 +997,13 @@ def searchVariants():
         flask.request, app.backend.runSearchVariants)
 
 
+@DisplayedRoute('/variants/export', postMethod=True)
+@requires_auth
+def exportVariants():
+    return handleFlaskExportRequest(
+        flask.request, app.backend.runExportVariants)
+
+
 @DisplayedRoute('/variantannotationsets/search', postMethod=True)
 def searchVariantAnnotationSets():
     return handleFlaskPostRequest(
@@ -713,8 +1033,26 @@ def searchFeatureSets():
 @DisplayedRoute('/features/search', postMethod=True)
 @requires_auth
 def searchFeatures():
+    # The optional depth query parameter returns the subtree below the
+    # request's parent_id in one search (0 for all levels); prefix makes
+    # name and gene_symbol match case-insensitive prefixes.
+    depth = getIntegerArgument('depth', 1)
+    prefix = getBooleanArgument('prefix', False)
     return handleFlaskPostRequest(
-        flask.request, app.backend.runSearchFeatures)
+        flask.request,
+        functools.partial(
+            app.backend.runSearchFeatures, depth=depth, prefix=prefix))
+
+
+@DisplayedRoute('/features/export', postMethod=True)
+@requires_auth
+def exportFeatures():
+    depth = getIntegerArgument('depth', 1)
+    prefix = getBooleanArgument('prefix', False)
+    return handleFlaskExportRequest(
+        flask.request,
+        functools.partial(
+            app.backend.runExportFeatures, depth=depth, prefix=prefix))
 
 
 @DisplayedRoute('/continuoussets/search', postMethod=True)
@@ -727,8 +1065,14 @@ def searchContinuousSets():
 @DisplayedRoute('/continuous/search', postMethod=True)
 @requires_auth
 def searchContinuous():
-    return handleFlaskPostRequest(
-        flask.request, app.backend.runSearchContinuous)
+    # Optional query parameters binSize or bins, with summary, ask for
+    # summaries of bins of the range rather than base level values.
+    endpoint = functools.partial(
+        app.backend.runSearchContinuous,
+        binSize=getIntegerArgument('binSize', None),
+        numBins=getIntegerArgument('bins', None),
+        summaryType=flask.request.args.get('summary', 'mean'))
+    return handleFlaskPostRequest(flask.request, endpoint)
 
 
 @DisplayedRoute('/biosamples/search', postMethod=True)
@@ -809,7 +1153,7 @@ def getVariantSet(id):
 
 
 @DisplayedRoute(
-    '/variants/<no(search):id>',
+    '/variants/<no(search,export):id>',
     pathDisplay='/variants/<id>')
 @requires_auth
 def getVariant(id):
@@ -852,7 +1196,7 @@ def getFeatureSet(id):
 
 
 @DisplayedRoute(
-    '/features/<no(search):id>',
+    '/features/<no(search,export):id>',
     pathDisplay='/features/<id>')
 @requires_auth
 def getFeature(id):
@@ -878,6 +1222,16 @@ def getRnaQuantificationSet(id):
         id, flask.request, app.backend.runGetRnaQuantificationSet)
 
 
+@DisplayedRoute('/rnaquantificationsets/<id>/expressionmatrix')
+@requires_auth
+def getExpressionMatrix(id):
+    # The feature names are given as repeated name query parameters.
+    endpoint = functools.partial(
+        app.backend.runGetExpressionMatrix,
+        names=flask.request.args.getlist('name'))
+    return handleFlaskGetRequest(id, flask.request, endpoint)
+
+
 @DisplayedRoute(
     '/rnaquantifications/<no(search):id>',
     pathDisplay='/rnaquantifications/<id>')
@@ -997,6 +1351,17 @@ def searchPhenotypeAssociationSets():
         flask.request, app.backend.runSearchPhenotypeAssociationSets)
 
 
+@DisplayedRoute('/batch', postMethod=True)
+@requires_auth
+def runBatch():
+    if flask.request.method == "POST":
+        return handleBatchRequest(flask.request)
+    elif flask.request.method == "OPTIONS":
+        return handleHttpOptions()
+    else:
+        raise exceptions.MethodNotAllowedException()
+
+
 # The below methods ensure that JSON is returned for various errors
 # instead of the default, html
 
@@ -285,9 +285,9 @@ class Gff3Parser(object):
 
     GFF3_NUM_COLS = 9
 
-    def _parseRecord(self, gff3Set, line):
+    def _parseFeature(self, line):
         """
-        Parse one record.
+        Parse one record into an unlinked Feature.
         """
         row = line.split("\t")
         if len(row) != self.GFF3_NUM_COLS:
@@ -295,14 +295,19 @@ class Gff3Parser(object):
                 "Wrong number of columns, expected {}, got {}".format(
                     self.GFF3_NUM_COLS, len(row)),
                 self.fileName, self.lineNumber)
-        feature = Feature(
+        return Feature(
             urllib.unquote(row[0]),
             urllib.unquote(row[1]),
             urllib.unquote(row[2]),
             int(row[3]), int(row[4]),
             row[5], row[6], row[7],
             self._parseAttrs(row[8]))
-        gff3Set.add(feature)
+
+    def _parseRecord(self, gff3Set, line):
+        """
+        Parse one record.
+        """
+        gff3Set.add(self._parseFeature(line))
 
     # spaces or comment line
     IGNORED_LINE_RE = re.compile("(^[ ]*$)|(^[ ]*#.*$)")
@@ -338,3 +343,22 @@ class Gff3Parser(object):
             fh.close()
         gff3Set.linkChildFeaturesToParents()
         return gff3Set
+
+    def iterFeatures(self):
+        """
+        Parses the file one line at a time, yielding each Feature as it
+        is read. Unlike parse(), no Gff3Set is built and features are not
+        linked to their parents or children, so memory use is independent
+        of the size of the file.
+        """
+        fh = self._open()
+        try:
+            for line in fh:
+                self.lineNumber += 1
+                line = line[0:-1]
+                if self.lineNumber == 1:
+                    self._checkHeader(line)
+                elif not self._isIgnoredLine(line):
+                    yield self._parseFeature(line)
+        finally:
+            fh.close()
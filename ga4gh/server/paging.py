@@ -216,6 +216,7 @@ class VariantAnnotationsIntervalIterator(IntervalIterator):
             self._effects = []
         else:
             self._effects = self._request.effects
+        self._ontology = parentContainer.getOntology()
 
     def _search(self, start, end):
         return self._parentContainer.getVariantAnnotations(
@@ -270,11 +271,14 @@ class VariantAnnotationsIntervalIterator(IntervalIterator):
 
     def _checkIdEquality(self, requestedEffect, effect):
         """
-        Tests whether a requested effect and an effect
-        present in an annotation are equal.
+        Tests whether an effect present in an annotation is the
+        requested effect or one below it in the ontology.
         """
-        return self._idPresent(requestedEffect) and (
-            effect.term_id == requestedEffect.term_id)
+        if not self._idPresent(requestedEffect):
+            return False
+        if self._ontology is None:
+            return effect.term_id == requestedEffect.term_id
+        return self._ontology.isA(effect.term_id, requestedEffect.term_id)
 
     def _idPresent(self, requestedEffect):
         return requestedEffect.term_id != ""
@@ -306,7 +310,10 @@ class SequenceIterator(object):
     """
     Implements generator logic for types which accept a single number
     to indicate which index the iteration is currently on.
-    Implements look-ahead logic for backing stores.
+    Implements look-ahead logic for backing stores. _search may return
+    a list or a generator; objects are only drawn from it one ahead of
+    those returned, so a consumer that stops early stops the search.
+    A page size of 0 returns all the remaining objects.
     """
     def __init__(self, request):
         self._request = request
@@ -317,13 +324,12 @@ class SequenceIterator(object):
         if self._maxResults:
             self._maxResults += 1
         self._nextPageTokenIndex = 0
-        self._objectIndex = 0
         if self._request.page_token:
             self._nextPageTokenIndex, = _parsePageToken(
                 self._request.page_token, 1)
-        self._numToReturn = self._request.page_size
-        self._objectList = self._search()
-        self._objectListLength = len(self._objectList)
+        self._numToReturn = self._request.page_size or None
+        self._objectIterator = iter(self._search())
+        self._nextObject = next(self._objectIterator, None)
 
     def _initialize(self):
         """
@@ -346,17 +352,17 @@ class SequenceIterator(object):
         raise NotImplementedError()
 
     def next(self):
-        if (self._numToReturn <= 0 or self._objectIndex >=
-                self._objectListLength):
+        if self._numToReturn == 0 or self._nextObject is None:
             raise StopIteration()
-        obj = self._objectList[self._objectIndex]
+        obj = self._nextObject
+        self._nextObject = next(self._objectIterator, None)
         self._nextPageTokenIndex += 1
         nextPageToken = str(self._nextPageTokenIndex)
-        if self._objectIndex == self._objectListLength - 1:
+        if self._nextObject is None:
             nextPageToken = None
         preparedObj = self._prepare(obj)
-        self._objectIndex += 1
-        self._numToReturn -= 1
+        if self._numToReturn is not None:
+            self._numToReturn -= 1
         return preparedObj, nextPageToken
 
     def __iter__(self):
@@ -391,9 +397,11 @@ class FeaturesIterator(SequenceIterator):
     """
     Iterates through features
     """
-    def __init__(self, request, featureSet, parentId):
+    def __init__(self, request, featureSet, parentId, depth=1, prefix=False):
         self._featureSet = featureSet
         self._parentId = parentId
+        self._depth = depth
+        self._prefix = prefix
         super(FeaturesIterator, self).__init__(request)
 
     def _initialize(self):
@@ -406,7 +414,7 @@ class FeaturesIterator(SequenceIterator):
         self._maxResults = self._request.page_size
 
     def _search(self):
-        iterator = list(self._featureSet.getFeatures(
+        iterator = self._featureSet.getFeatures(
             self._request.reference_name,
             self._start,
             self._end,
@@ -415,39 +423,54 @@ class FeaturesIterator(SequenceIterator):
             self._request.feature_types,
             self._parentId,
             self._request.name,
-            self._request.gene_symbol))
+            self._request.gene_symbol,
+            depth=self._depth, prefix=self._prefix)
         return iterator
 
     def _prepare(self, obj):
         return obj
 
 
-class ContinuousIterator(SequenceIterator):
+class ContinuousIterator(object):
     """
-    Iterates through continuous data
+    Iterates through continuous data. Page tokens hold the start
+    position of the next object, so each page reads only as far into
+    the continuous set as the objects it returns.
     """
-    def __init__(self, request, continuousSet):
+    def __init__(self, request, continuousSet, binSize=None, numBins=None,
+                 summaryType='mean'):
+        self._request = request
         self._continuousSet = continuousSet
-        super(ContinuousIterator, self).__init__(request)
-
-    def _initialize(self):
-        if self._request.start == self._request.end == 0:
-            self._start = self._end = None
+        if request.start == request.end == 0:
+            start = end = None
         else:
-            self._start = self._request.start
-            self._end = self._request.end
-        self._startIndex = self._request.page_token
-        self._maxResults = self._request.page_size
+            start = request.start
+            end = request.end
+        pageStart = None
+        if request.page_token:
+            pageStart, = _parsePageToken(request.page_token, 1)
+        self._numToReturn = request.page_size
+        self._searchIterator = continuousSet.getContinuous(
+            request.reference_name, start, end, binSize=binSize,
+            numBins=numBins, summaryType=summaryType, pageStart=pageStart)
+        self._nextObject = next(self._searchIterator, None)
 
-    def _search(self):
-        iterator = list(self._continuousSet.getContinuous(
-            self._request.reference_name,
-            self._start,
-            self._end))
-        return iterator
+    def next(self):
+        """
+        Returns the next (continuous, nextPageToken) pair.
+        """
+        if self._numToReturn <= 0 or self._nextObject is None:
+            raise StopIteration()
+        obj = self._nextObject
+        self._nextObject = next(self._searchIterator, None)
+        nextPageToken = None
+        if self._nextObject is not None:
+            nextPageToken = str(self._nextObject.start)
+        self._numToReturn -= 1
+        return obj, nextPageToken
 
-    def _prepare(self, obj):
-        return obj
+    def __iter__(self):
+        return self
 
 
 class PeerIterator(SequenceIterator):
@@ -0,0 +1,424 @@
+"""
+A pre-forking WSGI server for production use. The data repository is
+loaded once in the master process, which then forks workers that share
+it copy-on-write.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import Queue
+import errno
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+import werkzeug.serving
+
+import ga4gh.server.datamodel as datamodel
+import ga4gh.server.datamodel.genotype_phenotype as genotype_phenotype
+
+
+log = logging.getLogger(__name__)
+
+
+def reinitializeAfterFork():
+    """
+    Re-opens the file handles and database connections that a worker
+    inherits from the master process, as these must not be shared
+    between processes.
+    """
+    datamodel.fileHandleCache.clear()
+    genotype_phenotype.reopenRdfStores()
+    # The registry database is accessed through thread-local connections,
+    # which the worker threads open for themselves.
+
+
+class _ReplayingFile(object):
+    """
+    A file object of a connection that first returns the bytes that were
+    read from the connection before the file was made.
+    """
+    def __init__(self, data, socketFile):
+        self._data = data
+        self._socketFile = socketFile
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data, self._data = self._data, b""
+            return data + self._socketFile.read()
+        data, self._data = self._data[:size], self._data[size:]
+        if len(data) < size:
+            data += self._socketFile.read(size - len(data))
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = -1
+        end = self._data.find(b"\n") + 1 or len(self._data)
+        if size >= 0:
+            end = min(end, size)
+        data, self._data = self._data[:end], self._data[end:]
+        if data.endswith(b"\n") or len(data) == size or self._data:
+            return data
+        # The line goes on past the replayed bytes
+        if size >= 0:
+            size -= len(data)
+        return data + self._socketFile.readline(size)
+
+    def readlines(self, sizehint=0):
+        return list(iter(self.readline, b""))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def __getattr__(self, name):
+        return getattr(self._socketFile, name)
+
+
+class _ReplayingConnection(object):
+    """
+    A connection whose first bytes have already been read from its
+    socket; its files for reading return these bytes first.
+    """
+    def __init__(self, connection, data):
+        self._connection = connection
+        self._data = data
+
+    def makefile(self, mode="r", bufsize=-1):
+        socketFile = self._connection.makefile(mode, bufsize)
+        if "r" in mode and self._data:
+            data, self._data = self._data, b""
+            return _ReplayingFile(data, socketFile)
+        return socketFile
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class PreforkServer(object):
+    """
+    Serves a WSGI application from a number of forked worker processes,
+    each of which handles requests on a fixed number of threads. All
+    workers accept connections on a socket bound by the master.
+
+    If bulkThreads is non-zero, each worker instead runs a dispatch loop,
+    which accepts connections and reads their request lines without
+    tying up a thread. It then queues each connection for one of two
+    pools: the requests that isBulkRequest(path) is True for are served
+    by bulkThreads threads, the others by threads threads. Slow bulk
+    data queries so cannot starve the cheap metadata endpoints.
+
+    The master re-forks workers that exit, which they do after serving
+    maxRequests requests if this is non-zero. On SIGHUP the master calls
+    the reload function, which is expected to reload the data, and
+    replaces the workers with new ones; the old workers finish the
+    requests they are serving, for at most gracefulTimeout seconds.
+    SIGTERM and SIGINT shut the server down in the same way.
+    """
+    pollInterval = 0.5
+    # Connections that do not send a request line within this many
+    # seconds are closed by the dispatch loop
+    requestLineTimeout = 30
+    maxRequestLineLength = 65536
+
+    def __init__(self, app, host, port, workers=2, threads=1,
+                 maxRequests=0, gracefulTimeout=30, sslContext=None,
+                 reloadFunction=None, bulkThreads=0, isBulkRequest=None):
+        if workers < 1:
+            raise ValueError("There must be at least one worker")
+        if threads < 1:
+            raise ValueError("There must be at least one thread per worker")
+        if maxRequests < 0:
+            raise ValueError("The maximum number of requests must be >= 0")
+        if bulkThreads < 0:
+            raise ValueError("The number of bulk threads must be >= 0")
+        if bulkThreads > 0 and isBulkRequest is None:
+            raise ValueError("Bulk threads need a request classifier")
+        if bulkThreads > 0 and sslContext is not None:
+            # The request line of a TLS connection can only be read after
+            # a blocking handshake
+            raise ValueError("Bulk threads cannot be used with TLS")
+        self._app = app
+        self._numWorkers = workers
+        self._numThreads = threads
+        self._numBulkThreads = bulkThreads
+        self._isBulkRequest = isBulkRequest
+        self._maxRequests = maxRequests
+        self._gracefulTimeout = gracefulTimeout
+        self._reloadFunction = reloadFunction
+        self._server = werkzeug.serving.BaseWSGIServer(
+            host, port, app, ssl_context=sslContext)
+        self._server.multithread = threads + bulkThreads > 1
+        self._server.multiprocess = True
+        # Workers wake up this often to check whether they should stop
+        self._server.timeout = self.pollInterval
+        self._server.socket.settimeout(self.pollInterval)
+        self._masterPid = os.getpid()
+        self._workers = set()
+        # Workers being shut down, mapped to the time they are killed at
+        self._retiringWorkers = {}
+        self._stopping = False
+        self._reloading = False
+        self._requestCount = 0
+        self._requestCountLock = threading.Lock()
+
+    def getAddress(self):
+        """
+        Returns the (host, port) pair the server is listening on.
+        """
+        return self._server.server_address
+
+    def serveForever(self):
+        """
+        Runs the master process until it receives SIGTERM or SIGINT.
+        """
+        signal.signal(signal.SIGTERM, self._handleStop)
+        signal.signal(signal.SIGINT, self._handleStop)
+        signal.signal(signal.SIGHUP, self._handleReload)
+        log.info(
+            "Serving on %s:%d with %d workers of %d threads",
+            self.getAddress()[0], self.getAddress()[1], self._numWorkers,
+            self._numThreads)
+        try:
+            while not self._stopping:
+                if self._reloading:
+                    self._reload()
+                self._reapWorkers()
+                self._killOverdueWorkers()
+                while len(self._workers) < self._numWorkers:
+                    self._spawnWorker()
+                time.sleep(self.pollInterval)
+            self._retireWorkers(self._workers)
+            self._workers = set()
+            while len(self._retiringWorkers) > 0:
+                self._reapWorkers()
+                self._killOverdueWorkers()
+                time.sleep(self.pollInterval / 10)
+        finally:
+            self._server.server_close()
+
+    def _handleStop(self, signum, frame):
+        self._stopping = True
+
+    def _handleReload(self, signum, frame):
+        self._reloading = True
+
+    def _reload(self):
+        self._reloading = False
+        log.info("Reloading")
+        if self._reloadFunction is not None:
+            try:
+                self._reloadFunction()
+            except Exception:
+                # keep serving the data we have rather than going down
+                log.exception("Reload failed")
+                return
+        oldWorkers = self._workers
+        self._workers = set()
+        for _ in range(self._numWorkers):
+            self._spawnWorker()
+        self._retireWorkers(oldWorkers)
+
+    def _retireWorkers(self, workers):
+        deadline = time.time() + self._gracefulTimeout
+        for pid in workers:
+            self._signalWorker(pid, signal.SIGTERM)
+            self._retiringWorkers[pid] = deadline
+
+    def _killOverdueWorkers(self):
+        now = time.time()
+        for pid, deadline in self._retiringWorkers.items():
+            if now >= deadline:
+                log.warning("Killing worker %d", pid)
+                self._signalWorker(pid, signal.SIGKILL)
+
+    def _signalWorker(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as error:
+            if error.errno != errno.ESRCH:
+                raise
+
+    def _reapWorkers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as error:
+                if error.errno == errno.ECHILD:
+                    return
+                raise
+            if pid == 0:
+                return
+            self._workers.discard(pid)
+            self._retiringWorkers.pop(pid, None)
+
+    def _spawnWorker(self):
+        pid = os.fork()
+        if pid != 0:
+            self._workers.add(pid)
+            return
+        status = 0
+        try:
+            self._runWorker()
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            # Never return into the master's code
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def _runWorker(self):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._handleStop)
+        # Interrupts from the terminal reach the whole process group;
+        # the master shuts the workers down in an orderly way
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        reinitializeAfterFork()
+        self._server.app = self._countRequests
+        if self._numBulkThreads > 0:
+            threads = self._createDispatchingThreads()
+        else:
+            threads = [
+                threading.Thread(target=self._serveRequests)
+                for _ in range(self._numThreads)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # A join without a timeout would not let signals through
+            while thread.is_alive():
+                thread.join(self.pollInterval)
+
+    def _countRequests(self, environ, startResponse):
+        with self._requestCountLock:
+            self._requestCount += 1
+        return self._app(environ, startResponse)
+
+    def _isWorkerDone(self):
+        return (
+            self._stopping or
+            os.getppid() != self._masterPid or
+            0 < self._maxRequests <= self._requestCount)
+
+    def _serveRequests(self):
+        while not self._isWorkerDone():
+            self._server.handle_request()
+
+    def _createDispatchingThreads(self):
+        metadataQueue = Queue.Queue()
+        bulkQueue = Queue.Queue()
+        threads = [
+            threading.Thread(
+                target=self._dispatchConnections,
+                args=(metadataQueue, bulkQueue))]
+        for queue, numThreads in [
+                (metadataQueue, self._numThreads),
+                (bulkQueue, self._numBulkThreads)]:
+            threads.extend(
+                threading.Thread(
+                    target=self._processConnections, args=(queue,))
+                for _ in range(numThreads))
+        return threads
+
+    def _dispatchConnections(self, metadataQueue, bulkQueue):
+        """
+        Accepts connections and queues each for the pool its request is
+        for once its request line has arrived. On stopping, tells the
+        threads of the pools to stop after serving the queued requests.
+        """
+        # Other workers may accept a connection first, so accepts must
+        # not block. The listening socket is shared with them, so this
+        # process's own socket object for it is made non-blocking rather
+        # than the shared one; the master's timeout has already made the
+        # shared file non-blocking.
+        listener = socket.fromfd(
+            self._server.socket.fileno(), self._server.address_family,
+            self._server.socket_type)
+        listener.setblocking(False)
+        # Connections waiting for their request line, mapped to their
+        # client address, the time they are dropped at, and the bytes
+        # read from them so far
+        pending = {}
+        while not self._isWorkerDone():
+            readable, _, _ = select.select(
+                [listener] + pending.keys(), [], [], self.pollInterval)
+            for connection in readable:
+                if connection is listener:
+                    try:
+                        connection, address = listener.accept()
+                    except socket.error:
+                        continue
+                    pending[connection] = (
+                        address, time.time() + self.requestLineTimeout, b"")
+                    continue
+                address, deadline, data = pending.pop(connection)
+                path, data = self._readRequestPath(connection, data)
+                if path is None:
+                    pending[connection] = (address, deadline, data)
+                elif path is False:
+                    self._server.shutdown_request(connection)
+                else:
+                    connection = _ReplayingConnection(connection, data)
+                    if self._isBulkRequest(path):
+                        bulkQueue.put((connection, address))
+                    else:
+                        metadataQueue.put((connection, address))
+            now = time.time()
+            for connection, (_, deadline, _) in pending.items():
+                if now >= deadline:
+                    del pending[connection]
+                    self._server.shutdown_request(connection)
+        listener.close()
+        for connection in pending:
+            self._server.shutdown_request(connection)
+        for queue, numThreads in [
+                (metadataQueue, self._numThreads),
+                (bulkQueue, self._numBulkThreads)]:
+            for _ in range(numThreads):
+                queue.put(None)
+
+    def _readRequestPath(self, connection, data):
+        """
+        Reads what has arrived of the request line of the specified
+        readable connection, of which the specified bytes were read
+        before. Returns the path in the request line, None if the line
+        has not fully arrived, or False if the client has closed the
+        connection; together with all the bytes read.
+        """
+        try:
+            received = connection.recv(
+                self.maxRequestLineLength - len(data))
+        except socket.error:
+            return False, data
+        if len(received) == 0:
+            return False, data
+        data += received
+        if b"\n" not in data and len(data) < self.maxRequestLineLength:
+            return None, data
+        words = data.split(b"\n", 1)[0].split()
+        # Malformed requests are left to the request handler to reject
+        path = words[1].decode("latin-1") if len(words) >= 2 else ""
+        return path, data
+
+    def _processConnections(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            connection, address = item
+            try:
+                self._server.finish_request(connection, address)
+            except Exception:
+                self._server.handle_error(connection, address)
+            finally:
+                self._server.shutdown_request(connection)
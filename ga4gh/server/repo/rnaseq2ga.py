@@ -2,14 +2,24 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import sqlite3
 import csv
+import itertools
+import multiprocessing
+import sqlite3
+import time
 
 import ga4gh.server.exceptions as exceptions
 
 
 SUPPORTED_RNA_INPUT_FORMATS = ["cufflinks", "kallisto", "rsem"]
 
+_EXPRESSION_INDICES = [
+    ("quantification_expression_index", "rna_quantification_id, expression"),
+    ("quantification_name_index",
+     "rna_quantification_id, name, expression"),
+    ("name_expression_index", "name, expression, rna_quantification_id"),
+]
+
 
 class RnaSqliteStore(object):
     """
@@ -65,6 +75,33 @@ class RnaSqliteStore(object):
             self._dbConn.commit()
             self._rnaValueList = []
 
+    def addRNAQuantifications(self, quantifications):
+        """
+        Adds the specified list of RNAQuantification datafields tuples to
+        the db in a single transaction.
+        """
+        sql = "INSERT INTO RnaQuantification VALUES (?,?,?,?,?,?,?)"
+        self._cursor.executemany(sql, quantifications)
+        self._dbConn.commit()
+
+    def removeRNAQuantifications(self, rnaQuantificationIds):
+        """
+        Removes the RNAQuantifications with the specified ids and their
+        Expressions from the db in a single transaction.
+        """
+        for table, column in [("Expression", "rna_quantification_id"),
+                              ("RnaQuantification", "id")]:
+            sql = "DELETE FROM {} WHERE {} = ?".format(table, column)
+            self._cursor.executemany(
+                sql, [(id_,) for id_ in rnaQuantificationIds])
+        self._dbConn.commit()
+
+    def rollback(self):
+        """
+        Discards the rows added since the last commit.
+        """
+        self._dbConn.rollback()
+
     def addExpression(self, datafields):
         """
         Adds an Expression to the db.  Datafields is a tuple in the order:
@@ -82,21 +119,48 @@ class RnaSqliteStore(object):
             self._dbConn.commit()
             self._expressionValueList = []
 
-    def createIndices(self):
+    def addExpressions(self, expressions):
         """
-        Index columns that are queried. The expression index can
-        take a long time.
+        Adds the specified list of Expression datafields tuples to the db
+        in a single transaction.
         """
-
-        sql = '''CREATE INDEX name_index
-                 ON Expression (name)'''
-        self._cursor.execute(sql)
+        sql = "INSERT INTO Expression VALUES (?,?,?,?,?,?,?,?,?,?)"
+        self._cursor.executemany(sql, expressions)
         self._dbConn.commit()
 
-        sql = '''CREATE INDEX expression_index
-                 ON Expression (expression)'''
-        self._cursor.execute(sql)
-        self._dbConn.commit()
+    def beginBulkLoad(self):
+        """
+        Tunes the connection for loading many rows: write-ahead logging,
+        which only syncs at checkpoints with synchronous=NORMAL, and a
+        larger page cache. endBulkLoad() must be called once loading is
+        done.
+        """
+        self._cursor.execute("PRAGMA journal_mode=WAL")
+        self._cursor.execute("PRAGMA synchronous=NORMAL")
+        self._cursor.execute("PRAGMA cache_size=-262144")  # 256MB
+
+    def endBulkLoad(self):
+        """
+        Indexes the loaded rows and restores the default rollback
+        journal, so that the server can open the database read-only.
+        """
+        self.createIndices()
+        self._cursor.execute("PRAGMA journal_mode=DELETE")
+        self._cursor.execute("PRAGMA synchronous=FULL")
+
+    def createIndices(self):
+        """
+        Index columns that are queried, with an index matched to each
+        query of SqliteRnaBackend: threshold searches and name searches
+        within a quantification, and the expression matrix query across
+        quantifications, which the last index covers. The indices can
+        take a long time to build.
+        """
+        for indexName, columns in _EXPRESSION_INDICES:
+            sql = "CREATE INDEX IF NOT EXISTS {} ON Expression ({})".format(
+                indexName, columns)
+            self._cursor.execute(sql)
+            self._dbConn.commit()
 
 
 class AbstractWriter(object):
@@ -138,6 +202,16 @@ class AbstractWriter(object):
         Reads the quantification results file and adds entries to the
         specified database.
         """
+        for datafields in self.readExpression(
+                rnaQuantificationId, quantfilename):
+            self._db.addExpression(datafields)
+        self._db.batchAddExpression()
+
+    def readExpression(self, rnaQuantificationId, quantfilename):
+        """
+        Reads the quantification results file, yielding the datafields
+        tuple of each Expression entry.
+        """
         isNormalized = self._isNormalized
         units = self._units
         with open(quantfilename, "r") as quantFile:
@@ -167,9 +241,8 @@ class AbstractWriter(object):
                 datafields = (expressionId, rnaQuantificationId, name,
                               expressionLevel, isNormalized, rawCount, score,
                               units, confidenceLow, confidenceHi)
-                self._db.addExpression(datafields)
+                yield datafields
                 expressionId += 1
-            self._db.batchAddExpression()
 
 
 class CufflinksWriter(AbstractWriter):
@@ -264,6 +337,37 @@ def writeExpressionTable(writer, data):
         writer.writeExpression(rnaQuantId, quantFilename)
 
 
+def _createWriter(rnaType, rnaDB, featureType, dataset=None):
+    if rnaType == "cufflinks":
+        writer = CufflinksWriter(rnaDB, featureType, dataset=dataset)
+    elif rnaType == "kallisto":
+        writer = KallistoWriter(rnaDB, featureType, dataset=dataset)
+    elif rnaType == "rsem":
+        writer = RsemWriter(rnaDB, featureType, dataset=dataset)
+    return writer
+
+
+def _getFeatureSetIds(dataset, featureSetNames):
+    featureSetIds = ""
+    if dataset and featureSetNames:
+        featureSetIdList = []
+        for annotationName in featureSetNames.split(","):
+            featureSet = dataset.getFeatureSetByName(annotationName)
+            featureSetIdList.append(featureSet.getId())
+        featureSetIds = ",".join(featureSetIdList)
+    return featureSetIds
+
+
+def _readQuantification(task):
+    """
+    Reads the expression entries of one quantification file; run in the
+    worker processes of bulkRnaseq2ga.
+    """
+    rnaType, featureType, rnaQuantId, quantFilename = task
+    writer = _createWriter(rnaType, None, featureType)
+    return list(writer.readExpression(rnaQuantId, quantFilename))
+
+
 def rnaseq2ga(quantificationFilename, sqlFilename, localName, rnaType,
               dataset=None, featureType="gene",
               description="", programs="", featureSetNames="",
@@ -278,30 +382,84 @@ def rnaseq2ga(quantificationFilename, sqlFilename, localName, rnaType,
     readGroupSetName = ""
     if readGroupSetNames:
         readGroupSetName = readGroupSetNames.strip().split(",")[0]
-    featureSetIds = ""
+    featureSetIds = _getFeatureSetIds(dataset, featureSetNames)
     readGroupIds = ""
-    if dataset:
-        featureSetIdList = []
-        if featureSetNames:
-            for annotationName in featureSetNames.split(","):
-                featureSet = dataset.getFeatureSetByName(annotationName)
-                featureSetIdList.append(featureSet.getId())
-            featureSetIds = ",".join(featureSetIdList)
-        # TODO: multiple readGroupSets
-        if readGroupSetName:
-            readGroupSet = dataset.getReadGroupSetByName(readGroupSetName)
-            readGroupIds = ",".join(
-                [x.getId() for x in readGroupSet.getReadGroups()])
+    # TODO: multiple readGroupSets
+    if dataset and readGroupSetName:
+        readGroupSet = dataset.getReadGroupSetByName(readGroupSetName)
+        readGroupIds = ",".join(
+            [x.getId() for x in readGroupSet.getReadGroups()])
     if rnaType not in SUPPORTED_RNA_INPUT_FORMATS:
         raise exceptions.UnsupportedFormatException(rnaType)
     rnaDB = RnaSqliteStore(sqlFilename)
-    if rnaType == "cufflinks":
-        writer = CufflinksWriter(rnaDB, featureType, dataset=dataset)
-    elif rnaType == "kallisto":
-        writer = KallistoWriter(rnaDB, featureType, dataset=dataset)
-    elif rnaType == "rsem":
-        writer = RsemWriter(rnaDB, featureType, dataset=dataset)
+    writer = _createWriter(rnaType, rnaDB, featureType, dataset=dataset)
     writeRnaseqTable(rnaDB, [localName], description, featureSetIds,
                      readGroupId=readGroupIds, programs=programs,
                      biosampleId=biosampleId)
     writeExpressionTable(writer, [(localName, quantificationFilename)])
+    rnaDB.createIndices()
+
+
+def bulkRnaseq2ga(quantifications, sqlFilename, rnaType, dataset=None,
+                  featureType="gene", description="", programs="",
+                  featureSetNames="", processes=None, progress=None):
+    """
+    Reads many RNA Quantifications in one of the formats supported by
+    rnaseq2ga and stores them in a sqlite database.
+
+    quantifications is a list of (localName, quantificationFilename,
+    biosampleId) tuples. The files are parsed in a pool of the specified
+    number of processes (one per CPU by default; 1 parses them in this
+    process) and each file's entries are written in one transaction,
+    with the database tuned for loading and indexed once at the end.
+    If given, progress is called after each file is written with the
+    number of files written, the total number of files, the number of
+    entries written and the entries written per second. Returns the
+    number of entries written. If any file cannot be loaded, none of
+    them are: the rows already written are removed before the error is
+    raised, and the database is restored to its usual settings and
+    indexed in either case.
+    """
+    if rnaType not in SUPPORTED_RNA_INPUT_FORMATS:
+        raise exceptions.UnsupportedFormatException(rnaType)
+    featureSetIds = _getFeatureSetIds(dataset, featureSetNames)
+    rnaDB = RnaSqliteStore(sqlFilename)
+    rnaDB.beginBulkLoad()
+    tasks = [
+        (rnaType, featureType, localName, quantificationFilename)
+        for localName, quantificationFilename, _ in quantifications]
+    pool = None
+    added = False
+    startTime = time.time()
+    numRows = 0
+    try:
+        rnaDB.addRNAQuantifications([
+            (localName, featureSetIds, description, localName, "", programs,
+             biosampleId)
+            for localName, _, biosampleId in quantifications])
+        added = True
+        if processes == 1:
+            results = itertools.imap(_readQuantification, tasks)
+        else:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(_readQuantification, tasks)
+        for numDone, expressions in enumerate(results, 1):
+            rnaDB.addExpressions(expressions)
+            numRows += len(expressions)
+            if progress is not None:
+                elapsed = time.time() - startTime
+                progress(
+                    numDone, len(tasks), numRows,
+                    numRows / elapsed if elapsed > 0 else 0.0)
+    except Exception:
+        rnaDB.rollback()
+        if added:
+            rnaDB.removeRNAQuantifications(
+                [localName for localName, _, _ in quantifications])
+        raise
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        rnaDB.endBulkLoad()
+    return numRows
@@ -0,0 +1,98 @@
+"""
+Cache of serialized responses for the endpoints serving metadata, which
+does not change while the data repository is loaded.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import hashlib
+import threading
+
+
+class SerializedResponse(unicode):
+    """
+    A serialized response together with the strong entity tag (ETag) of
+    its contents.
+    """
+    def __new__(cls, responseString):
+        response = super(SerializedResponse, cls).__new__(cls, responseString)
+        response.etag = hashlib.sha1(response.encode("utf-8")).hexdigest()
+        return response
+
+
+class ResponseCache(object):
+    """
+    LRU cache of serialized responses, keyed by endpoint and canonical
+    request. The cache keeps at most maxCacheSize responses; a size of 0
+    disables it. It is owned by a backend, so it lasts only as long as the
+    data repository it was filled from.
+    """
+
+    def __init__(self, maxCacheSize=1024):
+        self._cache = collections.OrderedDict()
+        self._maxCacheSize = maxCacheSize
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def setMaxCacheSize(self, size):
+        """
+        Sets the maximum number of responses in the cache
+        """
+        if size < 0:
+            raise ValueError("The size of the cache cannot be negative")
+        with self._lock:
+            self._maxCacheSize = size
+            while len(self._cache) > size:
+                self._cache.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns the SerializedResponse stored for the specified key, or
+        None if there is none. A response that is found becomes the most
+        recently used.
+        """
+        with self._lock:
+            response = self._cache.pop(key, None)
+            if response is None:
+                self._misses += 1
+                return None
+            self._cache[key] = response
+            self._hits += 1
+            return response
+
+    def put(self, key, responseString):
+        """
+        Stores the specified response for the specified key, evicting the
+        least recently used response if the cache is full, and returns it
+        as a SerializedResponse.
+        """
+        response = SerializedResponse(responseString)
+        with self._lock:
+            if self._maxCacheSize == 0:
+                return response
+            self._cache.pop(key, None)
+            self._cache[key] = response
+            if len(self._cache) > self._maxCacheSize:
+                self._cache.popitem(last=False)
+        return response
+
+    def clear(self):
+        """
+        Removes all the responses and resets the counters.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def getStatistics(self):
+        """
+        Returns a dict of the number of hits, misses and entries
+        """
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "size": len(self._cache)}
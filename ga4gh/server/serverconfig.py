@@ -37,6 +37,27 @@ class BaseConfig(object):
 
     FILE_HANDLE_CACHE_MAX_SIZE = 50
 
+    # Genotype-phenotype search results cache; a size of 0 disables it
+    G2P_QUERY_CACHE_MAX_SIZE = 256
+    G2P_QUERY_CACHE_TIME_TO_LIVE = 600  # seconds
+
+    # Serialized metadata responses cache; a size of 0 disables it
+    RESPONSE_CACHE_MAX_SIZE = 1024
+
+    # Content codings offered to clients, in order of preference; zstd
+    # needs the zstandard package. An empty list disables compression.
+    RESPONSE_COMPRESSION_ENCODINGS = ['zstd', 'gzip']
+    RESPONSE_COMPRESSION_MIN_SIZE = 1024  # bytes
+    GZIP_COMPRESSION_LEVEL = 6
+    ZSTD_COMPRESSION_LEVEL = 3
+
+    # Requests of the /batch endpoint
+    BATCH_MAX_REQUESTS = 100
+    BATCH_MAX_THREADS = 8
+
+    # Objects between the restart page tokens of the export endpoints
+    EXPORT_CHECKPOINT_INTERVAL = 1000
+
     LANDING_MESSAGE_HTML = "landing_message.html"
     INITIAL_PEERS = "ga4gh/server/templates/initial_peers.txt"
 
@@ -39,7 +39,8 @@ def limitsSql(startIndex=0, maxResults=0):
     if startIndex and maxResults:
         return " LIMIT {}, {}".format(startIndex, maxResults)
     elif startIndex:
-        raise Exception("startIndex was provided, but maxResults was not")
+        # A negative limit means no limit to SQLite
+        return " LIMIT {}, -1".format(startIndex)
     elif maxResults:
         return " LIMIT {}".format(maxResults)
     else:
@@ -0,0 +1,122 @@
+"""
+Stand-alone benchmark for the genotype-phenotype (G2P) searches of the
+GA4GH reference implementation.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+import argparse
+
+import glue
+
+glue.ga4ghImportGlue()
+import ga4gh.schemas.protocol as protocol  # noqa
+import ga4gh.server.backend as backend  # noqa
+import ga4gh.server.datarepo as datarepo  # noqa
+
+
+def _searchRequests(phenotypeAssociationSet, featureSet, pageSize):
+    """
+    Returns a list of (name, backend method name, request, response class)
+    tuples covering the G2P search endpoints.
+    """
+    associationsRequest = protocol.SearchGenotypePhenotypeRequest()
+    associationsRequest.phenotype_association_set_id = \
+        phenotypeAssociationSet.getId()
+    associationsRequest.page_size = pageSize
+
+    phenotypesRequest = protocol.SearchPhenotypesRequest()
+    phenotypesRequest.phenotype_association_set_id = \
+        phenotypeAssociationSet.getId()
+    phenotypesRequest.page_size = pageSize
+
+    featuresRequest = protocol.SearchFeaturesRequest()
+    featuresRequest.feature_set_id = featureSet.getId()
+    featuresRequest.name = ".*"
+    featuresRequest.page_size = pageSize
+    return [
+        ("featurephenotypeassociations", "runSearchGenotypePhenotypes",
+         associationsRequest, protocol.SearchGenotypePhenotypeResponse),
+        ("phenotypes", "runSearchPhenotypes",
+         phenotypesRequest, protocol.SearchPhenotypesResponse),
+        ("features", "runSearchFeatures",
+         featuresRequest, protocol.SearchFeaturesResponse),
+    ]
+
+
+def timeOneSearch(method, queryString):
+    """
+    Returns (search result as JSON string, time elapsed during search)
+    """
+    startTime = time.time()
+    resultString = method(queryString)
+    endTime = time.time()
+    return resultString, endTime - startTime
+
+
+def benchmarkOneQuery(method, request, responseClass, repeatLimit=3,
+                      pageLimit=3):
+    """
+    Repeats the query several times, following at most pageLimit pages,
+    and returns the minimum time taken.
+    """
+    times = []
+    for i in range(0, repeatLimit):
+        request.page_token = ""
+        accruedTime = 0
+        pageCount = 0
+        while pageCount < pageLimit:
+            resultString, elapsedTime = timeOneSearch(
+                method, protocol.toJson(request))
+            accruedTime += elapsedTime
+            pageCount += 1
+            token = protocol.fromJson(
+                resultString, responseClass).next_page_token
+            if not token:
+                break
+            request.page_token = token
+        times.append(accruedTime)
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="GA4GH reference server G2P benchmark")
+    parser.add_argument(
+        '--registryDb', default="tests/data/registry.db",
+        help='the data repository to run the queries against '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--datasetName', default="dataset1",
+        help='the dataset containing the phenotype association set '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--name', default="cgd",
+        help='the name of the phenotype association set and its feature '
+             'set (default: %(default)s)')
+    parser.add_argument(
+        '--pageSize', type=int, default=100, metavar='N',
+        help='the page size of the searches (default: %(default)s)')
+    parser.add_argument(
+        '--repeatLimit', type=int, default=3, metavar='N',
+        help='how many times to run each test case (default: %(default)s)')
+    parser.add_argument(
+        '--pageLimit', type=int, default=3, metavar='N',
+        help='how many pages (max) to load '
+             'from each test case (default: %(default)s)')
+    args = parser.parse_args()
+
+    repo = datarepo.SqlDataRepository(args.registryDb)
+    repo.open(datarepo.MODE_READ)
+    backend = backend.Backend(repo)
+    dataset = repo.getDatasetByName(args.datasetName)
+    requests = _searchRequests(
+        dataset.getPhenotypeAssociationSetByName(args.name),
+        dataset.getFeatureSetByName(args.name), args.pageSize)
+    for name, methodName, request, responseClass in requests:
+        minTime = benchmarkOneQuery(
+            getattr(backend, methodName), request, responseClass,
+            args.repeatLimit, args.pageLimit)
+        print("{}\t{:.4f}".format(name, minTime))
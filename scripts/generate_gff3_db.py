@@ -13,50 +13,19 @@ from __future__ import unicode_literals
 import argparse
 import os
 import sys
-import json
-import sqlite3
 
 import ga4gh.common.utils as utils
 import glue
 
 glue.ga4ghImportGlue()
-import ga4gh.server.gff3 as gff3  # NOQA
-
-# TODO: Shift this to use the Gff3DbBackend class.
-
-# The columns of the FEATURE table correspond to the columns of a GFF3,
-# with three additional columns prepended representing the ID of this feature,
-# the ID of its parent (if any), and a whitespace separated array
-# of its child IDs.
-
-_dbTableSQL = (
-    "CREATE TABLE FEATURE( "
-    "id INTEGER PRIMARY KEY NOT NULL, "
-    "parent_id INTEGER, "
-    "child_ids TEXT, "
-    "reference_name TEXT, "
-    "source TEXT, "
-    "type TEXT, "
-    "start INT, "
-    "end INT, "
-    "score REAL, "
-    "strand TEXT, "
-    "name TEXT,"
-    "gene_name TEXT,"
-    "transcript_name TEXT,"
-    "attributes TEXT);")
-
-
-def _db_serialize(pyData):
-    return json.dumps(pyData, separators=(',', ':'))
+import ga4gh.server.datamodel.sequence_annotations as sequence_annotations  # NOQA
 
 
 class Gff32Db(object):
     """
-    Represents a unit of work for this script: Parse a GFF3 file
-    using an external GFF3 parser, and create a corresponding SQLite DB file
-    by iterating through the resulting parsed dictionary object
-    (gff3Data.byfeatureName).
+    Represents a unit of work for this script: stream a GFF3 file into
+    a corresponding SQLite DB file using the same importer as the repo
+    manager's add-featureset command.
     """
     def __init__(self, inputFile, outputFile):
         """
@@ -65,64 +34,15 @@ class Gff32Db(object):
         """
         self.gff3File = inputFile
         self.dbFile = outputFile
-        self.valueList = []
-        self.batchSize = 100
         if os.path.exists(outputFile):
             print("DB output file already exists, please remove or rename.",
                   file=sys.stderr)
             exit()
 
-    def _batchInsertValues(self, values, dbcur, dbconn):
-        self.valueList.append(values)
-        if len(self.valueList) >= self.batchSize:
-            self._insertValues(dbcur, dbconn)
-
-    def _insertValues(self, dbcur, dbconn):
-        if len(self.valueList) > 0:
-            sql = "INSERT INTO Feature VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
-            dbcur.executemany(sql, self.valueList)
-            dbconn.commit()
-            self.valueList = []
-
     def run(self):
-        gff3Data = gff3.Gff3Parser(self.gff3File).parse()
-        dbconn = sqlite3.connect(self.dbFile)
-        dbcur = dbconn.cursor()
-        dbcur.execute(_dbTableSQL)  # create table
-        dbcur.execute("PRAGMA journal_mode=WAL")
-        dbconn.commit()
-
-        for i, featureName in enumerate(gff3Data.byFeatureName.keys()):
-            for feature in gff3Data.byFeatureName[featureName]:
-                # Ignores any parent IDs besides the first one.
-                parentIds = [parent.uniqueId for parent in feature.parents]
-                parentId = parentIds[0] if len(parentIds) > 0 else ''
-                # FIXME: No current code to ensure childIDs in correct order.
-                childIds = [child.uniqueId for child in feature.children]
-                values = (
-                    feature.uniqueId,
-                    parentId,
-                    _db_serialize(childIds),
-                    feature.seqname,
-                    feature.source,
-                    feature.type,
-                    feature.start,
-                    feature.end,
-                    feature.score,
-                    feature.strand,
-                    feature.featureName,
-                    feature.attributes.get("gene_name", [None])[0],
-                    feature.attributes.get("transcript_name", [None])[0],
-                    _db_serialize(feature.attributes))
-                self._batchInsertValues(values, dbcur, dbconn)
-        self._insertValues(dbcur, dbconn)
-        dbcur.execute((
-            "create INDEX idx1 "
-            "on feature(start, end, reference_name)"))
-        dbcur.execute("PRAGMA INDEX_LIST('feature')")
-
-        dbcur.close()
-        dbconn.close()
+        importer = sequence_annotations.Gff3DbImporter(
+            self.gff3File, self.dbFile)
+        importer.run()
 
 
 @utils.Timed()
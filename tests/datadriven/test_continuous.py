@@ -6,11 +6,15 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import unittest
 import math
+import os
+import shutil
+import tempfile
+import unittest
 
 from nose.tools import raises
 
+import ga4gh.server.datamodel as datamodel
 import ga4gh.server.datarepo as datarepo
 import ga4gh.server.datamodel.continuous as continuous
 import ga4gh.server.datamodel.datasets as datasets
@@ -37,6 +41,7 @@ class TestContinuous(unittest.TestCase):
     def setUp(self):
         dataDir = "tests/data/datasets/dataset1/continuous"
         self._wiggleFile = dataDir + "/wiggle_2.txt"
+        self._wiggleVariableFile = dataDir + "/wiggle.txt"
         self._bigWigFile = dataDir + "/bigwig_1.bw"
 
     def testReadWiggle(self):
@@ -48,7 +53,7 @@ class TestContinuous(unittest.TestCase):
         self.assertEqual(obj.values[300], 800)
         self.assertEqual(len(obj.values), 302)
 
-    def getTuples(self, generator):
+    def getTuples(self, generator, binSize=1):
         """
         Convert a generator of continuous objects into tuples of
         (position,value).
@@ -57,7 +62,7 @@ class TestContinuous(unittest.TestCase):
         for obj in generator:
             for i, value in enumerate(obj.values):
                 if not math.isnan(value):
-                    tuples.append((obj.start+i, value))
+                    tuples.append((obj.start+i*binSize, value))
         return tuples
 
     def testReadBigWig(self):
@@ -70,6 +75,201 @@ class TestContinuous(unittest.TestCase):
         self.assertEqual(tuples[9], (49306084, 17.5))
         self.assertEqual(len(tuples), 10)
 
+    def testReadBigWigChunks(self):
+        # Runs of values are split into objects of at most _MAX_VALUES,
+        # and continue across _INCREMENT boundaries.
+        expected = self.getTuples(continuous.BigWigDataSource(
+            self._bigWigFile).bigWigToProtocol("chr19", 49305897, 49306090))
+        continuousObj = continuous.BigWigDataSource(self._bigWigFile)
+        continuousObj._INCREMENT = 7
+        continuousObj._MAX_VALUES = 3
+        objs = list(continuousObj.bigWigToProtocol(
+            "chr19", 49305897, 49306090))
+        self.assertEqual(self.getTuples(objs), expected)
+        self.assertEqual([len(obj.values) for obj in objs], [3, 2, 3, 2])
+
+    def testReadBigWigSummary(self):
+        start, end = 49300000, 49310000
+        continuousObj = continuous.BigWigDataSource(self._bigWigFile)
+        values = dict(self.getTuples(
+            continuousObj.bigWigToProtocol("chr19", start, end)))
+        for binSize in [100, 333]:
+            bins = self.getTuples(continuousObj.bigWigSummaryToProtocol(
+                "chr19", start, end, binSize=binSize), binSize)
+            self.assertGreater(len(bins), 0)
+            for position, summary in bins:
+                self.assertEqual((position - start) % binSize, 0)
+                binValues = [
+                    values[i] for i in range(position, position + binSize)
+                    if i in values]
+                self.assertAlmostEqual(
+                    summary, sum(binValues) / len(binValues))
+        bins = self.getTuples(continuousObj.bigWigSummaryToProtocol(
+            "chr19", start, end, numBins=10, summaryType='max'), 1000)
+        self.assertEqual(
+            [position for position, _ in bins],
+            [49304000, 49305000, 49306000, 49307000])
+        for position, summary in bins:
+            self.assertEqual(summary, max(
+                values[i] for i in range(position, position + 1000)
+                if i in values))
+
+    def testReadBigWigResume(self):
+        continuousObj = continuous.BigWigDataSource(self._bigWigFile)
+        objs = list(continuousObj.bigWigToProtocol(
+            "chr19", 49305897, 49306090))
+        resumed = list(continuousObj.bigWigToProtocol(
+            "chr19", 49305897, 49306090, pageStart=objs[1].start))
+        self.assertEqual(objs[1:], resumed)
+        objs = list(continuousObj.bigWigSummaryToProtocol(
+            "chr19", 49300000, 49310000, binSize=100))
+        resumed = list(continuousObj.bigWigSummaryToProtocol(
+            "chr19", 49300000, 49310000, binSize=100,
+            pageStart=objs[1].start))
+        self.assertEqual(objs[1:], resumed)
+        with self.assertRaises(exceptions.BadPageTokenException):
+            next(continuousObj.bigWigSummaryToProtocol(
+                "chr19", 49300000, 49310000, binSize=100,
+                pageStart=objs[1].start + 1))
+
+    def testBigWigHandleIsCached(self):
+        for _ in range(2):
+            continuousObj = continuous.BigWigDataSource(self._bigWigFile)
+            list(continuousObj.bigWigToProtocol("chr19", 49305897, 49306090))
+        handles = [
+            handle for dataFile, handle
+            in datamodel.fileHandleCache.getThreadCache()._cache
+            if dataFile == self._bigWigFile]
+        self.assertEqual(len(handles), 1)
+
+    def _importTrack(self, sourceFile, referenceLengths=None):
+        trackFile = os.path.join(self._tempDir, "track.ctrack")
+        continuous.ContinuousTrackImporter(
+            sourceFile, trackFile, referenceLengths).run()
+        return continuous.ContinuousTrack(trackFile)
+
+    def testReadTrackMatchesBigWig(self):
+        # bigwig_1.bw was converted from wiggle.txt
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_continuous_test")
+        try:
+            # with the reference lengths of the bigWig file
+            track = self._importTrack(
+                self._wiggleVariableFile, {"chr19": 50000000})
+            bigWig = continuous.BigWigDataSource(self._bigWigFile)
+            start, end = 49300000, 49310000
+            self.assertEqual(
+                list(track.readValues("chr19", start, end)),
+                list(bigWig.bigWigToProtocol("chr19", start, end)))
+            for summaryType in continuous.SUMMARY_TYPES:
+                for binSize in [7, 333]:
+                    trackBins = self.getTuples(track.readSummaries(
+                        "chr19", start, end, binSize=binSize,
+                        summaryType=summaryType), binSize)
+                    bigWigBins = self.getTuples(
+                        bigWig.bigWigSummaryToProtocol(
+                            "chr19", start, end, binSize=binSize,
+                            summaryType=summaryType), binSize)
+                    self.assertEqual(len(trackBins), len(bigWigBins))
+                    for trackBin, bigWigBin in zip(trackBins, bigWigBins):
+                        self.assertEqual(trackBin[0], bigWigBin[0])
+                        self.assertAlmostEqual(trackBin[1], bigWigBin[1])
+            objs = list(track.readValues("chr19", start, end))
+            self.assertEqual(objs[1:], list(track.readValues(
+                "chr19", start, end, pageStart=objs[1].start)))
+        finally:
+            shutil.rmtree(self._tempDir)
+
+    def testReadTrackFromBedGraph(self):
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_continuous_test")
+        try:
+            bedGraphFile = os.path.join(self._tempDir, "signal.bedGraph")
+            with open(bedGraphFile, "w") as bedGraph:
+                bedGraph.write(
+                    "track type=bedGraph\n"
+                    "chr2\t5\t8\t1.5\n"
+                    "chr1\t10\t12\t2.5\n"
+                    "chr1\t0\t4\t0.5\n"
+                    "chr1\t4\t10\t0.5\n")
+            track = self._importTrack(bedGraphFile)
+            self.assertEqual(track.getReferenceNames(), ["chr1", "chr2"])
+            # adjacent runs of the same value are merged
+            starts, ends, values = track.getRuns("chr1")
+            self.assertEqual(list(starts), [0, 10])
+            self.assertEqual(list(ends), [10, 12])
+            self.assertEqual(list(values), [0.5, 2.5])
+            self.assertEqual(
+                self.getTuples(track.readValues("chr2", 0, 100)),
+                [(5, 1.5), (6, 1.5), (7, 1.5)])
+            with self.assertRaises(
+                    exceptions.ReferenceNameNotFoundException):
+                next(track.readValues("chr3", 0, 100))
+        finally:
+            shutil.rmtree(self._tempDir)
+
+    def testReadTrackRange(self):
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_continuous_test")
+        try:
+            bedGraphFile = os.path.join(self._tempDir, "signal.bedGraph")
+            with open(bedGraphFile, "w") as bedGraph:
+                bedGraph.write("chr1\t10\t12\t2.5\nchr2\t5\t8\t1.5\n")
+            track = self._importTrack(
+                bedGraphFile, {"chr1": 20, "chr3": 30})
+            self.assertEqual(
+                track.getReferenceNames(), ["chr1", "chr2", "chr3"])
+            # the end is clipped to the reference, so numBins divides
+            # the clipped range as it does for bigWig files
+            self.assertEqual(
+                self.getTuples(track.readSummaries(
+                    "chr1", -5, 1000, numBins=2, summaryType="coverage"),
+                    binSize=10),
+                [(10, 0.2)])
+            # without a known length a reference ends with its values
+            self.assertEqual(
+                self.getTuples(track.readValues("chr2", 0, 1000)),
+                [(5, 1.5), (6, 1.5), (7, 1.5)])
+            # a reference of the reference set without values
+            self.assertEqual(list(track.readValues("chr3", 0, 1000)), [])
+            for reference, start, end in [
+                    ("chr1", 12, 10), ("chr1", 5, 5), ("chr1", 20, 25),
+                    ("chr2", 8, 100)]:
+                with self.assertRaises(
+                        exceptions.ReferenceRangeErrorException):
+                    next(track.readValues(reference, start, end))
+                with self.assertRaises(
+                        exceptions.ReferenceRangeErrorException):
+                    next(track.readSummaries(
+                        reference, start, end, binSize=1))
+        finally:
+            shutil.rmtree(self._tempDir)
+
+    def testImportTrackPastReferenceEnd(self):
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_continuous_test")
+        try:
+            bedGraphFile = os.path.join(self._tempDir, "signal.bedGraph")
+            with open(bedGraphFile, "w") as bedGraph:
+                bedGraph.write("chr1\t10\t12\t2.5\n")
+            with self.assertRaises(
+                    exceptions.ContinuousFileFormatException):
+                self._importTrack(bedGraphFile, {"chr1": 11})
+            self.assertFalse(os.path.exists(
+                os.path.join(self._tempDir, "track.ctrack")))
+        finally:
+            shutil.rmtree(self._tempDir)
+
+    def testImportTrackOverlap(self):
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_continuous_test")
+        try:
+            bedGraphFile = os.path.join(self._tempDir, "signal.bedGraph")
+            with open(bedGraphFile, "w") as bedGraph:
+                bedGraph.write("chr1\t0\t10\t1\nchr1\t5\t15\t2\n")
+            with self.assertRaises(
+                    exceptions.ContinuousFileFormatException):
+                self._importTrack(bedGraphFile)
+            self.assertFalse(os.path.exists(
+                os.path.join(self._tempDir, "track.ctrack")))
+        finally:
+            shutil.rmtree(self._tempDir)
+
     def testReadBigWigAllNan(self):
         continuousObj = continuous.BigWigDataSource(self._bigWigFile)
         generator = continuousObj.bigWigToProtocol(
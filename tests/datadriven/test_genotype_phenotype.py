@@ -5,10 +5,17 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import functools
+import glob
 import os
 import rdflib
+import shutil
+import tempfile
 
 import ga4gh.server.datamodel.genotype_phenotype as genotype_phenotype
+import ga4gh.server.datamodel.genotype_phenotype_featureset as \
+    genotype_phenotype_featureset
+import ga4gh.server.datamodel.sequence_annotations as sequence_annotations
 import ga4gh.server.datamodel.datasets as datasets
 import tests.datadriven as datadriven
 import tests.paths as paths
@@ -102,31 +109,29 @@ class PhenotypeAssociationSetTest(datadriven.DataDrivenTest):
         }
         self.assertEqual(myDict, sampleDict)
 
-    def testGetDetails(self):
+    def testDetailsBySubject(self):
         uriRef = 'http://www.drugbank.ca/drugs/DB01268'
-        associations_details = [
-            {u'predicate': u'http://purl.obolibrary.org/obo/RO_0002606',
-             u'object': u'http://ohsu.edu/cgd/54039374',
-             u'subject': u'http://www.drugbank.ca/drugs/DB01268'},
-            {u'predicate': u'http://purl.obolibrary.org/obo/RO_0002606',
-             u'object': u'http://ohsu.edu/cgd/983a1528',
-             u'subject': u'http://www.drugbank.ca/drugs/DB01268'},
-            {u'predicate': u'http://purl.obolibrary.org/obo/RO_0002606',
-             u'object': u'http://ohsu.edu/cgd/71fe9f0f',
-             u'subject': u'http://www.drugbank.ca/drugs/DB01268'},
-            {u'predicate': u'http://www.w3.org/2000/01/rdf-schema#subClassOf',
-             u'object': u'http://purl.obolibrary.org/obo/CHEBI_23888',
-             u'subject': u'http://www.drugbank.ca/drugs/DB01268'}
-        ]
-        sample_details = {
-            u'http://purl.obolibrary.org/obo/RO_0002606':
-            u'http://ohsu.edu/cgd/71fe9f0f',
-            u'http://www.w3.org/2000/01/rdf-schema#subClassOf':
-            u'http://purl.obolibrary.org/obo/CHEBI_23888',
-            u'id': u'http://www.drugbank.ca/drugs/DB01268'}
-        details = self.phenotypeAssocationSet._getDetails(
-            uriRef, associations_details)
-        self.assertEqual(details, sample_details)
+        details = self.phenotypeAssocationSet._detailsBySubject(
+            [rdflib.term.URIRef(uriRef)])
+        self.assertEqual(details.keys(), [uriRef])
+        self.assertEqual(details[uriRef]['id'], uriRef)
+        self.assertEqual(
+            details[uriRef][
+                'http://www.w3.org/2000/01/rdf-schema#subClassOf'],
+            'http://purl.obolibrary.org/obo/CHEBI_23888')
+
+    def testIsLinkedFeatureSet(self):
+        associationSet = self.phenotypeAssocationSet
+        dataset = associationSet.getParentContainer()
+        localId = associationSet.getLocalId()
+        featureSetClass = genotype_phenotype_featureset.\
+            PhenotypeAssociationFeatureSet
+        self.assertTrue(associationSet._isLinkedFeatureSet(
+            featureSetClass(dataset, localId)))
+        self.assertFalse(associationSet._isLinkedFeatureSet(
+            featureSetClass(dataset, localId + "_other")))
+        self.assertFalse(associationSet._isLinkedFeatureSet(
+            sequence_annotations.Gff3DbFeatureSet(dataset, localId)))
 
     def testToNamespaceURL(self):
         sample_term = 'DrugBank:DB01268'
@@ -270,3 +275,93 @@ class PhenotypeAssociationSetTest(datadriven.DataDrivenTest):
         self.assertEqual(len(fpa_dict['featureIds']), 1)
         self.assertEqual(len(fpa_dict['evidence']), 1)
         self.assertEqual(len(fpa_dict['environmentalContexts']), 1)
+
+    def testCompiledStore(self):
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_g2p_test")
+        try:
+            for ttlFile in glob.glob(os.path.join(self._dataPath, "*.ttl")):
+                shutil.copy(ttlFile, tempDir)
+            genotype_phenotype.compileRdfStore(tempDir)
+            compiledSet = self.getDataModelInstance(self._localId, tempDir)
+            self.assertIsInstance(
+                compiledSet._rdfGraph.store,
+                genotype_phenotype.SqliteTripleStore)
+            self.assertEqual(
+                compiledSet._version, self.phenotypeAssocationSet._version)
+            parsedGraph = self.phenotypeAssocationSet._rdfGraph
+            self.assertEqual(
+                set(compiledSet._rdfGraph), set(parsedGraph))
+            self.assertEqual(
+                dict(compiledSet._rdfGraph.namespaces()),
+                dict(parsedGraph.namespaces()))
+            request = protocol.SearchPhenotypesRequest()
+            request.type.term_id = "http://purl.obolibrary.org/obo/DOID_3969"
+            # Grouped values are concatenated in store order, so compare
+            # the associations found rather than their serialisations.
+            expected = [
+                (fpa.id, fpa.phenotype.id, list(fpa.feature_ids))
+                for fpa in self.phenotypeAssocationSet.getAssociations(
+                    request)]
+            self.assertGreater(len(expected), 0)
+            self.assertEqual([
+                (fpa.id, fpa.phenotype.id, list(fpa.feature_ids))
+                for fpa in compiledSet.getAssociations(request)], expected)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testCompiledStoreTracksSourceFiles(self):
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_g2p_test")
+        try:
+            for ttlFile in glob.glob(os.path.join(self._dataPath, "*.ttl")):
+                shutil.copy(ttlFile, tempDir)
+                shutil.copy(ttlFile, os.path.join(tempDir, "extra.ttl"))
+            storePath = genotype_phenotype.compileRdfStore(tempDir)
+            isCurrent = functools.partial(
+                genotype_phenotype._isRdfStoreCurrent, tempDir, storePath)
+            self.assertTrue(isCurrent())
+            extraPath = os.path.join(tempDir, "extra.ttl")
+            renamedPath = os.path.join(tempDir, "renamed.ttl")
+            os.rename(extraPath, renamedPath)
+            self.assertFalse(isCurrent())
+            os.rename(renamedPath, extraPath)
+            self.assertTrue(isCurrent())
+            # an older file replacing a compiled one is noticed too
+            os.utime(extraPath, (0, 0))
+            self.assertFalse(isCurrent())
+            os.unlink(extraPath)
+            self.assertFalse(isCurrent())
+            genotype_phenotype.compileRdfStore(tempDir)
+            self.assertTrue(isCurrent())
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testClearRdfGraphs(self):
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_g2p_test")
+        try:
+            for ttlFile in glob.glob(os.path.join(self._dataPath, "*.ttl")):
+                shutil.copy(ttlFile, tempDir)
+            graph = genotype_phenotype.getRdfGraph(tempDir)
+            self.assertIs(genotype_phenotype.getRdfGraph(tempDir), graph)
+            genotype_phenotype.compileRdfStore(tempDir)
+            genotype_phenotype.clearRdfGraphs()
+            compiledGraph = genotype_phenotype.getRdfGraph(tempDir)
+            self.assertIsNot(compiledGraph, graph)
+            self.assertIsInstance(
+                compiledGraph.store, genotype_phenotype.SqliteTripleStore)
+        finally:
+            genotype_phenotype.clearRdfGraphs()
+            shutil.rmtree(tempDir)
+
+    def testAssociationsAreCached(self):
+        cache = genotype_phenotype.associationQueryCache
+        cache.clear()
+        request = protocol.SearchPhenotypesRequest()
+        request.type.term_id = "http://purl.obolibrary.org/obo/DOID_3969"
+        associations = self.phenotypeAssocationSet.getAssociations(request)
+        self.assertEqual(cache.getStatistics()["misses"], 1)
+        self.assertEqual(
+            self.phenotypeAssocationSet.getAssociations(request),
+            associations)
+        self.assertEqual(cache.getStatistics()["hits"], 1)
+        self.phenotypeAssocationSet.getAssociations(request, limit=1)
+        self.assertEqual(cache.getStatistics()["misses"], 2)
@@ -5,11 +5,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import math
+import sqlite3
 import tempfile
 import os
 import shutil
 
 import ga4gh.server.datarepo as datarepo
+import ga4gh.server.exceptions as exceptions
 import ga4gh.server.repo.rnaseq2ga as rnaseq2ga
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.datamodel.datasets as datasets
@@ -179,6 +182,108 @@ class RnaQuantificationTest(datadriven.DataDrivenTest):
             _expressionTestData["num_expression_entries"],
             len(expressionLevels))
 
+    def testGetExpressionMatrix(self):
+        names = list(_expressionTestData["names"]) + ["noSuchName"]
+        matrix = self._gaObject.getExpressionMatrix(names)
+        self.assertEqual(matrix.shape, (1, 3))
+        rnaQuantification = self._gaObject.getRnaQuantificationByIndex(0)
+        expressions = dict(
+            (expressionLevel.getName(), expressionLevel.getExpression())
+            for expressionLevel in rnaQuantification.getExpressionLevels())
+        self.assertEqual(
+            list(matrix[0, :2]), [expressions[name] for name in names[:2]])
+        self.assertTrue(math.isnan(matrix[0, 2]))
+        matrix = self._gaObject.getExpressionMatrix(names, threshold=100.0)
+        self.assertEqual(
+            [math.isnan(value) for value in matrix[0]], [False, True, True])
+
+    def testGetExpressionMatrixAcrossQuantifications(self):
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_rna_quant",
+                                   dir=tempfile.gettempdir())
+        try:
+            dbName = os.path.join(tempDir, "rnaQuantDB")
+            storeDb = rnaseq2ga.RnaSqliteStore(dbName)
+            storeDb.createTables()
+            names = ["gene{}".format(i) for i in range(600)]
+            for quant in range(3):
+                quantId = "quant{}".format(quant)
+                storeDb.addRNAQuantification(
+                    (quantId, "", "", quantId, "", "", ""))
+                for i, name in enumerate(names):
+                    # each quantification lacks a different third of names
+                    if i % 3 != quant:
+                        storeDb.addExpression((
+                            i, quantId, name, quant * 1000 + i, True, 0.0,
+                            0.0, 2, 0.0, 0.0))
+            storeDb.batchaddRNAQuantification()
+            storeDb.batchAddExpression()
+            rnaQuantSet = self.getDataModelInstance("multi", dbName)
+            # more names than are queried at once
+            matrix = rnaQuantSet.getExpressionMatrix(names)
+            self.assertEqual(matrix.shape, (3, len(names)))
+            for row, rnaQuantification in enumerate(
+                    rnaQuantSet.getRnaQuantifications()):
+                expected = [float("nan")] * len(names)
+                for expressionLevel in \
+                        rnaQuantification.getExpressionLevels():
+                    expected[names.index(expressionLevel.getName())] = \
+                        expressionLevel.getExpression()
+                self.assertEqual(
+                    [None if math.isnan(value) else value
+                     for value in matrix[row]],
+                    [None if math.isnan(value) else value
+                     for value in expected])
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testExpressionQueryPlans(self):
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_rna_quant",
+                                   dir=tempfile.gettempdir())
+        try:
+            dbName = os.path.join(tempDir, "rnaQuantDB")
+            storeDb = rnaseq2ga.RnaSqliteStore(dbName)
+            storeDb.createTables()
+            storeDb.beginBulkLoad()
+            names = ["gene{}".format(i) for i in range(1000)]
+            for quant in range(2):
+                quantId = "quant{}".format(quant)
+                storeDb.addRNAQuantification(
+                    (quantId, "", "", quantId, "", "", ""))
+                storeDb.addExpressions([
+                    (i, quantId, name, i, True, 0.0, 0.0, 2, 0.0, 0.0)
+                    for i, name in enumerate(names)])
+            storeDb.batchaddRNAQuantification()
+            storeDb.endBulkLoad()
+            # more names than are bound as parameters
+            manyNames = names[::3]
+            dataSource = rna_quantification.SqliteRnaBackend(dbName)
+            with dataSource:
+                for (sql, args), index in [
+                        (dataSource.expressionLevelsSql(
+                            "quant0", threshold=900.0),
+                         "INDEX quantification_expression_index"),
+                        (dataSource.expressionLevelsSql(
+                            "quant0", names=names[:2]),
+                         "INDEX quantification_name_index"),
+                        (dataSource.expressionLevelsSql(
+                            "quant0", names=manyNames),
+                         "INDEX quantification_name_index"),
+                        (dataSource.expressionMatrixSql(manyNames),
+                         "COVERING INDEX name_expression_index")]:
+                    plan = " ".join(
+                        row[-1] for row in dataSource._dbconn.execute(
+                            "EXPLAIN QUERY PLAN " + sql, args))
+                    self.assertIn("USING " + index, plan)
+                    self.assertNotIn("SCAN Expression", plan)
+                    self.assertNotIn("SCAN TABLE Expression", plan)
+                expressionLevels = list(dataSource.searchExpressionLevelsInDb(
+                    "quant1", names=manyNames, threshold=500.0))
+            self.assertEqual(
+                sorted(level["name"] for level in expressionLevels),
+                sorted(name for name in manyNames if int(name[4:]) > 500))
+        finally:
+            shutil.rmtree(tempDir)
+
     def testLoadRsemData(self):
         """
         Test ingest of rsem data.
@@ -197,3 +302,89 @@ class RnaQuantificationTest(datadriven.DataDrivenTest):
                             'rsem', featureType="gene")
 
         shutil.rmtree(tempDir)
+
+    def testBulkLoadRsemData(self):
+        """
+        Test that bulk ingest of rsem data stores what ingesting the
+        files one at a time does.
+        """
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_rna_quant",
+                                   dir=tempfile.gettempdir())
+        try:
+            names = ["rqs{}".format(i) for i in range(3)]
+            serialDb = os.path.join(tempDir, "serial.db")
+            rnaseq2ga.RnaSqliteStore(serialDb).createTables()
+            for name in names:
+                rnaseq2ga.rnaseq2ga(
+                    paths.rnaQuantificationRsemPath, serialDb, name, "rsem",
+                    description="bulk")
+            bulkDb = os.path.join(tempDir, "bulk.db")
+            rnaseq2ga.RnaSqliteStore(bulkDb).createTables()
+            progress = []
+            numRows = rnaseq2ga.bulkRnaseq2ga(
+                [(name, paths.rnaQuantificationRsemPath, "")
+                 for name in names],
+                bulkDb, "rsem", description="bulk", processes=1,
+                progress=lambda *args: progress.append(args))
+            self.assertEqual(numRows, 6)
+            self.assertEqual(
+                [args[:3] for args in progress],
+                [(1, 3, 2), (2, 3, 4), (3, 3, 6)])
+            for table in ["RnaQuantification", "Expression"]:
+                sql = "SELECT * FROM {} ORDER BY 1, 2".format(table)
+                with sqlite3.connect(serialDb) as serial:
+                    with sqlite3.connect(bulkDb) as bulk:
+                        self.assertEqual(
+                            serial.execute(sql).fetchall(),
+                            bulk.execute(sql).fetchall())
+        finally:
+            shutil.rmtree(tempDir)
+
+    def _testBulkLoadBadFile(self, processes):
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_rna_quant",
+                                   dir=tempfile.gettempdir())
+        try:
+            dbName = os.path.join(tempDir, "bulk.db")
+            rnaseq2ga.RnaSqliteStore(dbName).createTables()
+            rnaseq2ga.rnaseq2ga(
+                paths.rnaQuantificationRsemPath, dbName, "existing", "rsem")
+            badFile = os.path.join(tempDir, "bad.tsv")
+            with open(badFile, "w") as quantFile:
+                quantFile.write("no_such_column\n1\n")
+            quantifications = [
+                ("good", paths.rnaQuantificationRsemPath, ""),
+                ("bad", badFile, ""),
+                ("good2", paths.rnaQuantificationRsemPath, "")]
+            with self.assertRaises(exceptions.RepoManagerException):
+                rnaseq2ga.bulkRnaseq2ga(
+                    quantifications, dbName, "rsem", processes=processes)
+            with sqlite3.connect(dbName) as db:
+                self.assertEqual(
+                    db.execute("SELECT id FROM RnaQuantification").fetchall(),
+                    [("existing",)])
+                self.assertEqual(
+                    db.execute(
+                        "SELECT DISTINCT rna_quantification_id "
+                        "FROM Expression").fetchall(),
+                    [("existing",)])
+                self.assertEqual(
+                    db.execute("PRAGMA journal_mode").fetchone()[0],
+                    "delete")
+                indexNames = set(
+                    row[0] for row in db.execute(
+                        "SELECT name FROM sqlite_master WHERE type='index'"))
+                for indexName, _ in rnaseq2ga._EXPRESSION_INDICES:
+                    self.assertIn(indexName, indexNames)
+            self.assertFalse(os.path.exists(dbName + "-wal"))
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testBulkLoadBadFile(self):
+        """
+        Test that a bulk ingest with a file that cannot be parsed leaves
+        the database as it was, apart from its indices.
+        """
+        self._testBulkLoadBadFile(processes=1)
+
+    def testBulkLoadBadFileInPool(self):
+        self._testBulkLoadBadFile(processes=2)
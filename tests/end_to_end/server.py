@@ -227,6 +227,34 @@ DEBUG = True""".format(self.dataDir)
         return config
 
 
+class Ga4ghPreforkServerForTesting(Ga4ghServerForTestingDataSource):
+    """
+    A test server that serves a data source from forked workers
+    """
+    def __init__(self, dataDir, workers=2, threads=2, maxRequests=0,
+                 bulkThreads=0):
+        super(Ga4ghPreforkServerForTesting, self).__init__(dataDir)
+        self.workers = workers
+        self.threads = threads
+        self.maxRequests = maxRequests
+        self.bulkThreads = bulkThreads
+
+    def getCmdLine(self):
+        cmdLine = super(Ga4ghPreforkServerForTesting, self).getCmdLine()
+        cmdLine += (
+            "--workers {} --threads {} --max-requests {} "
+            "--bulk-threads {} ").format(
+            self.workers, self.threads, self.maxRequests, self.bulkThreads)
+        return cmdLine
+
+    def shutdown(self):
+        # Stop gracefully, so the master reaps its workers
+        if self.server is not None and self.server.poll() is None:
+            self.server.terminate()
+            self.server.wait()
+        super(Ga4ghPreforkServerForTesting, self).shutdown()
+
+
 class OidcOpServerForTesting(ServerForTesting):
     """
     Runs a test OP server on localhost
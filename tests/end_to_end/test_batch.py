@@ -0,0 +1,87 @@
+"""
+Tests the batch endpoint on the test data
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import logging
+import unittest
+
+import ga4gh.server.frontend as frontend
+import tests.paths as paths
+
+import ga4gh.schemas.protocol as protocol
+
+
+class TestBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        config = {
+            "DATA_SOURCE": paths.testDataRepo,
+            "DEBUG": False
+        }
+        logging.getLogger('ga4gh.frontend.cors').setLevel(logging.CRITICAL)
+        frontend.reset()
+        frontend.configure(
+            baseConfig="TestConfig", extraConfig=config)
+        cls.app = frontend.app.test_client()
+        repo = frontend.app.backend.getDataRepository()
+        dataset = repo.getDatasetByName("dataset1")
+        readGroupSet = dataset.getReadGroupSetByName("HG00533")
+        cls.readGroupId = readGroupSet.getReadGroups()[0].getId()
+        cls.referenceId = readGroupSet.getReferenceSet().getReferenceByName(
+            "1").getId()
+        cls.variantSetId = dataset.getVariantSetByName("vs_0").getId()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app = None
+
+    def sendJsonPostRequest(self, path, data):
+        return self.app.post(
+            path, headers={'Content-type': 'application/json'},
+            data=json.dumps(data))
+
+    def getSubRequests(self):
+        subRequests = []
+        for pageToken in ["", "10:0"]:
+            request = protocol.SearchReadsRequest()
+            request.read_group_ids.append(self.readGroupId)
+            request.reference_id = self.referenceId
+            request.page_size = 10
+            request.page_token = pageToken
+            subRequests.append({
+                'path': '/reads/search',
+                'body': json.loads(protocol.toJson(request))})
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.page_size = 10
+        subRequests.append({
+            'path': '/variants/search',
+            'body': json.loads(protocol.toJson(request))})
+        return subRequests
+
+    def testConcurrentSubRequestsMatchSerialResponses(self):
+        subRequests = self.getSubRequests()
+        expected = []
+        for subRequest in subRequests:
+            response = self.sendJsonPostRequest(
+                subRequest['path'], subRequest['body'])
+            self.assertEqual(200, response.status_code)
+            body = json.loads(response.data)
+            self.assertGreater(
+                len(body.get('alignments', body.get('variants'))), 0)
+            expected.append({'status': 200, 'body': body})
+        # Many sub-requests on the same files run on all the threads of
+        # the batch pool at once
+        numRepeats = 16
+        for _ in range(3):
+            response = self.sendJsonPostRequest(
+                '/batch', {'requests': subRequests * numRepeats})
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(
+                expected * numRepeats, json.loads(response.data)['responses'])
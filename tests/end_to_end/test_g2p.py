@@ -185,6 +185,75 @@ class TestG2P(unittest.TestCase):
         self.assertEqual(1, len(response.associations))
         self.assertEqual(1, len(response.associations[0].feature_ids))
 
+    def testFeaturesSearchByRegion(self):
+        """
+        Search for the features overlapping a region
+        """
+        datasetName, featureSet = self.getCGDDataSetFeatureSet()
+        request = protocol.SearchFeaturesRequest()
+        request.feature_set_id = featureSet.id
+        request.reference_name = "chr4"
+        request.start = 55950000
+        request.end = 55960000
+        response = self.sendSearchRequest(
+            "features/search", request, protocol.SearchFeaturesResponse)
+        self.assertEqual(
+            [feature.id for feature in response.features],
+            [self.getObfuscatedFeatureCompoundId(
+                datasetName, featureSet.name,
+                "http://cancer.sanger.ac.uk/cosmic/mutation/overview?id=736")])
+
+        request.start = 55955970
+        response = self.sendSearchRequest(
+            "features/search", request, protocol.SearchFeaturesResponse)
+        self.assertEqual(len(response.features), 0)
+
+        # the feature is located at 55955969; the region excludes its end
+        for start, end, count in [
+                (55955969, 55960000, 1),
+                (55950000, 55955969, 0),
+                (55950000, 55955970, 1)]:
+            request.start = start
+            request.end = end
+            response = self.sendSearchRequest(
+                "features/search", request,
+                protocol.SearchFeaturesResponse)
+            self.assertEqual(len(response.features), count)
+
+    def testGenotypePhenotypeSearchFeatureRegion(self):
+        """
+        Search for associations given a feature of another feature set
+        finds the g2p features whose locations overlap it
+        """
+        datasetName, featureSets = self.getAllFeatureSets()
+        request = protocol.SearchFeaturesRequest()
+        request.feature_set_id = [
+            featureSet.id for featureSet in featureSets
+            if featureSet.name == "gencodeV21Set1"][0]
+        request.reference_name = "chr1"
+        request.start = 0
+        request.end = 65536
+        request.page_size = 1
+        response = self.sendSearchRequest(
+            "features/search", request, protocol.SearchFeaturesResponse)
+
+        request = protocol.SearchGenotypePhenotypeRequest()
+        request.phenotype_association_set_id = \
+            self.getPhenotypeAssociationSetId()
+        request.feature_ids.append(response.features[0].id)
+        response = self.sendSearchRequest(
+            '/featurephenotypeassociations/search',
+            request,
+            protocol.SearchGenotypePhenotypeResponse)
+        featureIds = [
+            featureId for association in response.associations
+            for featureId in association.feature_ids]
+        # test-location-3 is labelled "foo", so only its location matches
+        self.assertIn(
+            self.getObfuscatedFeatureCompoundId(
+                datasetName, "cgd", "http://ohsu.edu/cgd/test-location-3"),
+            featureIds)
+
     def testFeaturesSearchById(self):
         datasetName, featureSet = self.getCGDDataSetFeatureSet()
         featureId = \
@@ -242,6 +311,29 @@ class TestG2P(unittest.TestCase):
             protocol.SearchFeaturesResponse)
         self.assertEqual(3, len(response.features))
 
+    def testGenotypesSearchByNamePrefix(self):
+        request = protocol.SearchFeaturesRequest()
+        datasetName, featureSet = self.getCGDDataSetFeatureSet()
+        request.feature_set_id = featureSet.id
+        request.name = "^KIT"
+        postUrl = "features/search"
+        response = self.sendSearchRequest(
+            postUrl,
+            request,
+            protocol.SearchFeaturesResponse)
+        self.assertEqual(10, len(response.features))
+        for feature in response.features:
+            self.assertTrue(any(
+                value.string_value.startswith("KIT")
+                for value in feature.attributes.attr[
+                    "http://www.w3.org/2000/01/rdf-schema#label"].values))
+        request.gene_symbol = "wild"
+        response = self.sendSearchRequest(
+            postUrl,
+            request,
+            protocol.SearchFeaturesResponse)
+        self.assertEqual(3, len(response.features))
+
     def testPhenotypesSearchById(self):
         request = protocol.SearchPhenotypesRequest()
         request.phenotype_association_set_id = \
@@ -527,6 +619,35 @@ class TestG2P(unittest.TestCase):
             pageCount += 1
         self.assertEqual(3, pageCount)
 
+    def testGenotypePhenotypeSearchPagingAll(self):
+        """
+        Paging through associations returns each association once, in
+        the same order as a single page
+        """
+        request = protocol.SearchGenotypePhenotypeRequest()
+        request.phenotype_association_set_id = \
+            self.getPhenotypeAssociationSetId()
+        postUrl = '/featurephenotypeassociations/search'
+        response = self.sendSearchRequest(
+            postUrl, request, protocol.SearchGenotypePhenotypeResponse)
+        self.assertEqual(response.next_page_token, '')
+        expectedIds = [
+            association.id for association in response.associations]
+        self.assertGreater(len(expectedIds), 3)
+
+        request.page_size = 3
+        associationIds = []
+        while True:
+            response = self.sendSearchRequest(
+                postUrl, request, protocol.SearchGenotypePhenotypeResponse)
+            self.assertLessEqual(len(response.associations), 3)
+            associationIds.extend(
+                association.id for association in response.associations)
+            if not response.next_page_token:
+                break
+            request.page_token = response.next_page_token
+        self.assertEqual(associationIds, expectedIds)
+
     def testGenotypesSearchByNameError(self):
         """
         Search for feature by name with a malformed regular expression.
@@ -0,0 +1,123 @@
+"""
+Tests the prefork production server mode
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import glob
+import signal
+import socket
+import time
+import unittest
+
+import requests
+
+import server as server
+
+import tests.paths as paths
+
+
+class TestPreforkServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = server.Ga4ghPreforkServerForTesting(
+            paths.testDataRepo, maxRequests=2)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def _getDatasets(self):
+        response = requests.post(
+            self.server.getUrl() + "/datasets/search", json={})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def testWorkersAreRecycled(self):
+        expected = self._getDatasets()
+        for _ in range(10):
+            self.assertEqual(self._getDatasets(), expected)
+
+    def testReload(self):
+        expected = self._getDatasets()
+        self.server.server.send_signal(signal.SIGHUP)
+        for _ in range(5):
+            self.assertEqual(self._getDatasets(), expected)
+
+    def testShutdown(self):
+        self.server.server.terminate()
+        self.assertEqual(self.server.server.wait(), 0)
+        self.assertFalse(self.server.isRunning())
+
+
+class TestPreforkServerBulkThreads(unittest.TestCase):
+
+    def setUp(self):
+        self.server = server.Ga4ghPreforkServerForTesting(
+            paths.testDataRepo, workers=1, threads=1, bulkThreads=1)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def _connect(self):
+        return socket.create_connection(("localhost", self.server.port))
+
+    def testStalledRequestsDoNotBlockMetadata(self):
+        # A client that has not sent its request line yet, and a bulk
+        # request whose body never arrives, which holds the only bulk
+        # thread
+        idle = self._connect()
+        stalled = self._connect()
+        stalled.sendall(
+            b"POST /reads/search HTTP/1.0\r\n"
+            b"Content-Type: application/json\r\n"
+            b"Content-Length: 100\r\n\r\n{")
+        try:
+            response = requests.post(
+                self.server.getUrl() + "/datasets/search", json={},
+                timeout=10)
+            self.assertEqual(response.status_code, 200)
+        finally:
+            idle.close()
+            stalled.close()
+
+    def _getWorkerCpuTicks(self):
+        ticks = 0
+        for statPath in glob.glob("/proc/[0-9]*/stat"):
+            try:
+                with open(statPath) as statFile:
+                    # The command name may contain spaces
+                    fields = statFile.read().rsplit(")", 1)[1].split()
+            except IOError:
+                continue
+            if int(fields[1]) == self.server.server.pid:
+                ticks += int(fields[11]) + int(fields[12])
+        return ticks
+
+    def testPartialRequestLine(self):
+        request = (
+            b"POST /datasets/search HTTP/1.0\r\n"
+            b"Content-Type: application/json\r\n"
+            b"Content-Length: 2\r\n\r\n{}")
+        connection = self._connect()
+        try:
+            connection.sendall(request[:9])
+            time.sleep(0.5)
+            ticks = self._getWorkerCpuTicks()
+            time.sleep(1)
+            # The worker waits for the rest of the line without spinning
+            self.assertLess(self._getWorkerCpuTicks() - ticks, 20)
+            connection.sendall(request[9:])
+            response = connection.makefile("rb").read()
+        finally:
+            connection.close()
+        self.assertTrue(response.startswith(b"HTTP/1.0 200"))
+        self.assertIn(b'"datasets"', response)
+
+    def testBulkRequest(self):
+        response = requests.post(
+            self.server.getUrl() + "/variants/search",
+            json={"variantSetId": "nonexistent"}, timeout=10)
+        self.assertEqual(response.status_code, 404)
@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import unittest
 import logging
 
@@ -143,6 +144,158 @@ class TestSequenceAnnotations(unittest.TestCase):
             for feature in responseData.features:
                 self.assertIn(feature.feature_type.term, request.feature_types)
 
+    def testSearchFeaturesByNamePrefix(self):
+        ran = False
+        geneSymbols = set()
+        for featureSet in self.getAllFeatureSets():
+            if featureSet.name == "cgd":
+                # the G2P feature set matches names as patterns
+                continue
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.id
+            request.name = "EXON:enstr0000507418"
+            self.assertEqual([], self.searchAllFeatures(request))
+            features = self.searchAllFeatures(request, prefix="true")
+            for feature in features:
+                ran = True
+                self.assertTrue(
+                    feature.name.lower().startswith(request.name.lower()))
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.id
+            request.gene_symbol = "ddx11"
+            for feature in self.searchAllFeatures(request, prefix="1"):
+                geneSymbols.add(feature.gene_symbol)
+        self.assertTrue(ran)
+        self.assertGreater(len(geneSymbols), 0)
+        for geneSymbol in geneSymbols:
+            self.assertTrue(geneSymbol.startswith("DDX11"))
+
+    def testSearchFeaturesBadPrefix(self):
+        featureSet = self.getAllFeatureSets()[0]
+        request = protocol.SearchFeaturesRequest()
+        request.feature_set_id = featureSet.id
+        response = self.sendJsonPostRequest(
+            "features/search?prefix=yes", protocol.toJson(request))
+        self.assertEqual(400, response.status_code)
+
+    def testSearchFeaturesByParentType(self):
+        # mRNA is_a transcript in the sequence ontology
+        featureTypes = set()
+        for featureSet in self.getAllFeatureSets():
+            if featureSet.name == "cgd":
+                # the G2P feature set does not filter on feature types
+                continue
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.id
+            request.feature_types.extend(["transcript"])
+            for feature in self.searchAllFeatures(request):
+                featureTypes.add(feature.feature_type.term)
+        self.assertEqual(featureTypes, set(["transcript", "mRNA"]))
+
+    def searchAllFeatures(self, request, depth=None, prefix=None):
+        """
+        Returns all features matching the request, following page tokens
+        and passing depth and prefix as query parameters when specified.
+        """
+        path = "features/search"
+        arguments = []
+        if depth is not None:
+            arguments.append("depth={}".format(depth))
+        if prefix is not None:
+            arguments.append("prefix={}".format(prefix))
+        if len(arguments) > 0:
+            path += "?" + "&".join(arguments)
+        features = []
+        while True:
+            responseData = self.sendSearchRequest(
+                path, request, protocol.SearchFeaturesResponse)
+            features.extend(responseData.features)
+            if not responseData.next_page_token:
+                break
+            request.page_token = responseData.next_page_token
+        return features
+
+    def testSearchFeatureSubtree(self):
+        ran = False
+        for featureSet in self.getAllFeatureSets():
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.id
+            request.feature_types.extend(["gene"])
+            genes = [
+                gene for gene in self.searchAllFeatures(request)
+                if len(gene.child_ids) > 0]
+            for gene in genes[:3]:
+                ran = True
+                # Collect the subtree one level at a time, as a client
+                # without depth support has to.
+                expected = []
+                levels = [[gene.id]]
+                while len(levels[-1]) > 0:
+                    level = []
+                    for parentId in levels[-1]:
+                        request = protocol.SearchFeaturesRequest()
+                        request.parent_id = parentId
+                        level.extend(self.searchAllFeatures(request))
+                    expected.extend(level)
+                    levels.append([feature.id for feature in level])
+                request = protocol.SearchFeaturesRequest()
+                request.parent_id = gene.id
+                request.page_size = 2
+                subtree = self.searchAllFeatures(request, depth=0)
+                self.assertEqual(
+                    sorted(feature.id for feature in subtree),
+                    sorted(feature.id for feature in expected))
+                request = protocol.SearchFeaturesRequest()
+                request.parent_id = gene.id
+                twoLevels = self.searchAllFeatures(request, depth=2)
+                self.assertEqual(
+                    sorted(feature.id for feature in twoLevels),
+                    sorted(levels[1] + levels[2]))
+        self.assertTrue(ran)
+
+    def exportFeatures(self, request):
+        response = self.sendJsonPostRequest(
+            "features/export", protocol.toJson(request))
+        self.assertEqual(200, response.status_code)
+        return [json.loads(line) for line in response.data.splitlines()]
+
+    def testExportFeatures(self):
+        ran = False
+        backend = frontend.app.backend
+        for featureSet in self.getAllFeatureSets():
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.id
+            request.feature_types.extend(["gene"])
+            features = self.searchAllFeatures(request)
+            request.page_token = ""
+            backend.setExportCheckpointInterval(3)
+            try:
+                lines = self.exportFeatures(request)
+            finally:
+                backend.setExportCheckpointInterval(
+                    frontend.app.config["EXPORT_CHECKPOINT_INTERVAL"])
+            self.assertEqual({"nextPageToken": ""}, lines[-1])
+            exported = [line for line in lines if "nextPageToken" not in line]
+            self.assertEqual(
+                [feature.id for feature in features],
+                [feature["id"] for feature in exported])
+            if len(features) > 3:
+                ran = True
+                request.page_token = lines[3]["nextPageToken"]
+                resumed = self.exportFeatures(request)
+                self.assertEqual(exported[3:], resumed[:-1])
+        self.assertTrue(ran)
+
+    def testSearchFeaturesBadDepth(self):
+        featureSet = self.getAllFeatureSets()[0]
+        request = protocol.SearchFeaturesRequest()
+        request.feature_set_id = featureSet.id
+        for depth in ["-1", "deep"]:
+            response = self.sendJsonPostRequest(
+                "features/search?depth={}".format(depth),
+                protocol.toJson(request))
+            self.assertEqual(400, response.status_code)
+
     def sendJsonPostRequest(self, path, data):
         """
         Sends a JSON request to the specified path with the specified data
@@ -174,3 +327,55 @@ class TestSequenceAnnotations(unittest.TestCase):
                 path, request, protocol.SearchContinuousResponse)
             for continuous in responseData.continuous:
                 self.assertGreater(len(continuous.values), 0)
+
+    def testSearchContinuousPaging(self):
+        for path in ["continuous/search", "continuous/search?binSize=7"]:
+            for continuousSet in self.getAllContinuousSets():
+                request = protocol.SearchContinuousRequest()
+                request.continuous_set_id = continuousSet.id
+                request.start = 49200000
+                request.end = 49308000
+                request.reference_name = "chr19"
+                expected = self.sendSearchRequest(
+                    path, request,
+                    protocol.SearchContinuousResponse).continuous
+                self.assertGreater(len(expected), 1)
+                request.page_size = 1
+                pages = []
+                while True:
+                    responseData = self.sendSearchRequest(
+                        path, request, protocol.SearchContinuousResponse)
+                    self.assertEqual(len(responseData.continuous), 1)
+                    pages.extend(responseData.continuous)
+                    if not responseData.next_page_token:
+                        break
+                    self.assertEqual(
+                        responseData.next_page_token,
+                        str(expected[len(pages)].start))
+                    request.page_token = responseData.next_page_token
+                self.assertEqual(list(expected), pages)
+                request.page_token = str(request.end)
+                response = self.sendJsonPostRequest(
+                    path, protocol.toJson(request))
+                self.assertEqual(400, response.status_code)
+
+    def testSearchContinuousSummary(self):
+        continuousSets = self.getAllContinuousSets()
+        for continuousSet in continuousSets:
+            request = protocol.SearchContinuousRequest()
+            request.continuous_set_id = continuousSet.id
+            request.start = 49200000
+            request.end = 49308000
+            request.reference_name = "chr19"
+            responseData = self.sendSearchRequest(
+                "continuous/search?bins=108&summary=max", request,
+                protocol.SearchContinuousResponse)
+            self.assertGreater(len(responseData.continuous), 0)
+            for continuous in responseData.continuous:
+                self.assertEqual(
+                    (continuous.start - request.start) % 1000, 0)
+            for query in ["bins=0", "bins=2&binSize=10",
+                          "bins=2&summary=median", "binSize=wide"]:
+                response = self.sendJsonPostRequest(
+                    "continuous/search?" + query, protocol.toJson(request))
+                self.assertEqual(400, response.status_code)
@@ -68,11 +68,13 @@ featureSetName = 'gencodeV21Set1'
 featuresDir = os.path.join(datasetDir, 'sequenceAnnotations')
 featuresPath = os.path.join(featuresDir, 'gencodeV21Set1.db')
 featuresPath2 = os.path.join(featuresDir, 'specialCasesTest.db')
+featuresGff3Path = os.path.join(featuresDir, 'gencodeV21Set1.gff3')
 
 # continuous
 continuousSetName = 'bigwig_1'
 continuousDir = os.path.join(datasetDir, 'continuous')
 continuousPath = os.path.join(continuousDir, 'bigwig_1.bw')
+continuousWigglePath = os.path.join(continuousDir, 'wiggle.txt')
 
 # g2p
 phenotypesDir = os.path.join(datasetDir, 'phenotypes')
@@ -82,6 +84,7 @@ phenotypeAssociationSetPath = os.path.join(phenotypesDir, 'cgd')
 rnaQuantDir = os.path.join(datasetDir, "rnaQuant")
 rnaQuantificationSetName = "ENCFF305LZB"
 rnaQuantificationSetDbPath = os.path.join(rnaQuantDir, "ENCFF305LZB.db")
+rnaQuantificationRsemPath = os.path.join(rnaQuantDir, "rsem_test_data.tsv")
 
 # misc.
 landingMessageHtml = os.path.join(testDataDir, "test.html")
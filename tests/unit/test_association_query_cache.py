@@ -0,0 +1,102 @@
+"""
+Tests the genotype-phenotype search results cache
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import ga4gh.server.datamodel.genotype_phenotype as genotype_phenotype
+
+import ga4gh.schemas.protocol as protocol
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+class TestAssociationQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self._timer = FakeTimer()
+        self._cache = genotype_phenotype.AssociationQueryCache(
+            maxCacheSize=2, timeToLive=10, timer=self._timer)
+
+    def testHitsAndMisses(self):
+        self.assertIsNone(self._cache.get("a"))
+        self._cache.put("a", [1])
+        self.assertEqual(self._cache.get("a"), [1])
+        self.assertEqual(self._cache.get("a"), [1])
+        self.assertEqual(
+            self._cache.getStatistics(), {"hits": 2, "misses": 1, "size": 1})
+
+    def testLeastRecentlyUsedIsEvicted(self):
+        self._cache.put("a", [1])
+        self._cache.put("b", [2])
+        self._cache.get("a")
+        self._cache.put("c", [3])
+        self.assertIsNone(self._cache.get("b"))
+        self.assertEqual(self._cache.get("a"), [1])
+        self.assertEqual(self._cache.get("c"), [3])
+
+    def testEntriesExpire(self):
+        self._cache.put("a", [1])
+        self._timer.time = 9
+        self.assertEqual(self._cache.get("a"), [1])
+        self._timer.time = 10
+        self.assertIsNone(self._cache.get("a"))
+        self.assertEqual(self._cache.getStatistics()["size"], 0)
+
+    def testClear(self):
+        self._cache.put("a", [1])
+        self._cache.get("a")
+        self._cache.clear()
+        self.assertEqual(
+            self._cache.getStatistics(), {"hits": 0, "misses": 0, "size": 0})
+
+    def testDisabled(self):
+        self._cache.setMaxCacheSize(0)
+        self._cache.put("a", [1])
+        self.assertIsNone(self._cache.get("a"))
+
+    def testSetters(self):
+        self._cache.put("a", [1])
+        self._cache.put("b", [2])
+        self._cache.setMaxCacheSize(1)
+        self.assertIsNone(self._cache.get("a"))
+        self.assertEqual(self._cache.get("b"), [2])
+        self.assertRaises(ValueError, self._cache.setMaxCacheSize, -1)
+        self.assertRaises(ValueError, self._cache.setTimeToLive, 0)
+
+    def testValuesAreCopied(self):
+        association = protocol.FeaturePhenotypeAssociation()
+        association.id = "a"
+        value = [association]
+        self._cache.put("a", value)
+        association.id = "b"
+        value.append(association)
+        cached = self._cache.get("a")
+        self.assertEqual([1, "a"], [len(cached), cached[0].id])
+        cached[0].id = "c"
+        self.assertEqual("a", self._cache.get("a")[0].id)
+
+    def testRequestCacheKey(self):
+        request1 = protocol.SearchGenotypePhenotypeRequest()
+        request1.phenotype_ids.extend(["a", "b"])
+        request1.page_size = 1
+        request2 = protocol.SearchGenotypePhenotypeRequest()
+        request2.phenotype_ids.extend(["b", "a"])
+        request2.page_token = "1"
+        self.assertEqual(
+            genotype_phenotype._requestCacheKey(request1),
+            genotype_phenotype._requestCacheKey(request2))
+        request2.phenotype_ids.append("c")
+        self.assertNotEqual(
+            genotype_phenotype._requestCacheKey(request1),
+            genotype_phenotype._requestCacheKey(request2))
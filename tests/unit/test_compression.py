@@ -0,0 +1,60 @@
+"""
+Tests the compression of responses
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import zlib
+
+import werkzeug.http
+
+import ga4gh.server.compression as compression
+
+
+class TestCompression(unittest.TestCase):
+
+    def _accept(self, header):
+        return werkzeug.http.parse_accept_header(header)
+
+    def testNegotiateEncoding(self):
+        encodings = [compression.ZSTD, compression.GZIP]
+        self.assertEqual(
+            compression.negotiateEncoding(
+                self._accept("deflate, gzip"), encodings),
+            compression.GZIP)
+        self.assertEqual(
+            compression.negotiateEncoding(self._accept("*"), [
+                compression.GZIP]),
+            compression.GZIP)
+        self.assertIsNone(
+            compression.negotiateEncoding(
+                self._accept("gzip;q=0, deflate"), encodings))
+        self.assertIsNone(
+            compression.negotiateEncoding(self._accept(""), encodings))
+        self.assertIsNone(
+            compression.negotiateEncoding(self._accept("gzip"), []))
+
+    @unittest.skipIf(
+        compression.zstandard is None, "zstandard is not installed")
+    def testNegotiateZstd(self):
+        self.assertEqual(
+            compression.negotiateEncoding(
+                self._accept("gzip, zstd"),
+                [compression.ZSTD, compression.GZIP]),
+            compression.ZSTD)
+
+    def testCompressChunks(self):
+        chunks = ["{}\n".format(i) * 100 for i in range(100)]
+        compressed = b"".join(compression.compressChunks(
+            iter(chunks), compression.GZIP, 6))
+        self.assertEqual(
+            zlib.decompress(compressed, zlib.MAX_WBITS | 16),
+            "".join(chunks))
+        self.assertEqual(
+            compression.compress(b"".join(chunks), compression.GZIP, 6),
+            compressed)
+        self.assertRaises(
+            ValueError, compression.compress, b"", "br", 6)
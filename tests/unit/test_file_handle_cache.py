@@ -9,6 +9,7 @@ from __future__ import unicode_literals
 import os
 import shutil
 import tempfile
+import threading
 import unittest
 import uuid
 
@@ -58,9 +59,57 @@ class TestFileHandleCache(datamodel.PysamFileHandleCache, unittest.TestCase):
         self.assertNotEqual(self._cache[topIndex][0], fileList[1])
         self.assertEquals(self._cache[0][0], fileList[1])
 
+    def testClear(self):
+        handles = [
+            self._getFileHandle(os.path.join(self._tempdir, str(i)))
+            for i in range(3)]
+        self.clear()
+        self.assertEquals(len(self._cache), 0)
+        self.assertEquals(len(self._memoTable), 0)
+        for handle in handles:
+            self.assertTrue(handle.closed)
+
     def testSetCacheMaxSize(self):
         self.assertRaises(ValueError, self.setMaxCacheSize, 0)
         self.assertRaises(ValueError, self.setMaxCacheSize, -1)
 
     def tearDown(self):
         shutil.rmtree(self._tempdir)
+
+
+class TestThreadLocalFileHandleCache(unittest.TestCase):
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp(prefix="ga4gh_file_cache",
+                                         dir=tempfile.gettempdir())
+        self._dataFile = os.path.join(self._tempdir, "data")
+        self._cache = datamodel.ThreadLocalFileHandleCache()
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def _getFileHandle(self):
+        def openMethod(dataFile):
+            return open(dataFile, 'w')
+        return self._cache.getFileHandle(self._dataFile, openMethod)
+
+    def testHandlesArePerThread(self):
+        handle = self._getFileHandle()
+        self.assertIs(handle, self._getFileHandle())
+        threadHandles = []
+
+        def getHandle():
+            threadHandles.append(self._getFileHandle())
+            threadHandles.append(self._getFileHandle())
+        thread = threading.Thread(target=getHandle)
+        thread.start()
+        thread.join()
+        self.assertIs(threadHandles[0], threadHandles[1])
+        self.assertIsNot(handle, threadHandles[0])
+
+    def testClear(self):
+        handle = self._getFileHandle()
+        self._cache.setMaxCacheSize(3)
+        self.assertRaises(ValueError, self._cache.setMaxCacheSize, 0)
+        self._cache.clear()
+        self.assertTrue(handle.closed)
+        self.assertIsNot(handle, self._getFileHandle())
@@ -101,3 +101,26 @@ class TestGff3ParserOnSpecialCasesFile(TestGff3ParserOnTypicalFile):
         testDataFile = _testDataDir + "specialCasesTest.gff3"
         self.gff3Parser = gff3.Gff3Parser(testDataFile)
         self.gff3Data = self.gff3Parser.parse()
+
+
+class TestGff3ParserStreaming(unittest.TestCase):
+    """
+    Tests that streaming iteration yields the same records as a full parse.
+    """
+    def setUp(self):
+        self.testDataFile = _testDataDir + "discontinuous.gff3"
+
+    def testIterFeaturesMatchesParse(self):
+        gff3Data = gff3.Gff3Parser(self.testDataFile).parse()
+        parsed = [
+            str(feat) for featList in gff3Data.byFeatureName.values()
+            for feat in featList]
+        streamed = [
+            str(feat) for feat in
+            gff3.Gff3Parser(self.testDataFile).iterFeatures()]
+        self.assertEqual(sorted(parsed), sorted(streamed))
+
+    def testIterFeaturesDoesNotLink(self):
+        for feat in gff3.Gff3Parser(self.testDataFile).iterFeatures():
+            self.assertEqual(len(feat.parents), 0)
+            self.assertEqual(len(feat.children), 0)
@@ -162,7 +162,9 @@ class ImportGraphLayerChecker(object):
             'ga4gh/server/client.py',
         ],
         'frontend': [
+            'ga4gh/server/compression.py',
             'ga4gh/server/frontend.py',
+            'ga4gh/server/prefork.py',
             'ga4gh/server/repo_manager.py',
         ],
         'backend': [
@@ -170,6 +172,7 @@ class ImportGraphLayerChecker(object):
             'ga4gh/server/datarepo.py',
             'ga4gh/server/paging.py',
             'ga4gh/server/response_builder.py',
+            'ga4gh/server/response_cache.py',
         ],
         'exceptions': [
             'ga4gh/server/exceptions.py',
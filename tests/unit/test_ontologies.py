@@ -0,0 +1,89 @@
+"""
+Unit tests for ontologies
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ga4gh.server.datamodel.ontologies as ontologies
+
+import tests.paths as paths
+
+
+class TestOntologyClosure(unittest.TestCase):
+    """
+    Tests the is_a closure index of an ontology.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.ontology = ontologies.Ontology(paths.ontologyName)
+        cls.ontology.populateFromFile(paths.ontologyPath)
+
+    def testIsA(self):
+        missenseVariant = "SO:0001583"
+        proteinAlteringVariant = "SO:0001818"
+        intronVariant = "SO:0001627"
+        self.assertTrue(
+            self.ontology.isA(missenseVariant, proteinAlteringVariant))
+        self.assertTrue(self.ontology.isA(missenseVariant, missenseVariant))
+        self.assertFalse(
+            self.ontology.isA(proteinAlteringVariant, missenseVariant))
+        self.assertFalse(
+            self.ontology.isA(intronVariant, proteinAlteringVariant))
+
+    def testIsAUnknownTerms(self):
+        self.assertTrue(self.ontology.isA("XX:1", "XX:1"))
+        self.assertFalse(self.ontology.isA("XX:1", "SO:0001818"))
+        self.assertFalse(self.ontology.isA("SO:0001583", "XX:1"))
+
+    def testDescendants(self):
+        transcript = "SO:0000673"
+        descendantIds = self.ontology.getDescendantIds(transcript)
+        self.assertIn(transcript, descendantIds)
+        self.assertIn("SO:0000234", descendantIds)  # mRNA
+        for descendantId in descendantIds:
+            self.assertTrue(self.ontology.isA(descendantId, transcript))
+        self.assertEqual(self.ontology.getDescendantIds("XX:1"), [])
+        descendantNames = self.ontology.getDescendantNames("transcript")
+        self.assertIn("mRNA", descendantNames)
+        self.assertEqual(
+            self.ontology.getDescendantNames("no_such_term"),
+            ["no_such_term"])
+
+
+class TestOntologyCache(unittest.TestCase):
+    """
+    Tests that an ontology read from its compiled cache answers closure
+    queries in the same way as one parsed from the OBO file.
+    """
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.cachePath = os.path.join(
+            self.tempDir, "so" + ontologies.CACHE_EXTENSION)
+        self.parsed = ontologies.Ontology(paths.ontologyName)
+        self.parsed.populateFromFile(paths.ontologyPath)
+        self.parsed.writeCache(self.cachePath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def testClosureRoundTrip(self):
+        cached = ontologies.Ontology(paths.ontologyName)
+        cached._dataUrl = paths.ontologyPath
+        self.assertTrue(cached._readCache(self.cachePath))
+        termIds = self.parsed._termIds
+        self.assertEqual(cached._termIds, termIds)
+        for termId in termIds:
+            self.assertEqual(
+                cached.getDescendantIds(termId),
+                self.parsed.getDescendantIds(termId))
+        for termId in termIds[::25]:
+            for ancestorId in termIds[::7]:
+                self.assertEqual(
+                    cached.isA(termId, ancestorId),
+                    self.parsed.isA(termId, ancestorId))
@@ -8,13 +8,21 @@ from __future__ import unicode_literals
 import os
 import glob
 import shutil
+import sqlite3
 import tempfile
 import unittest
 
+import mock
+
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.datarepo as datarepo
 import ga4gh.server.cli.repomanager as cli_repomanager
 import ga4gh.server.datamodel as datamodel
+import ga4gh.server.datamodel.continuous as continuous
+import ga4gh.server.datamodel.datasets as datasets
+import ga4gh.server.datamodel.genotype_phenotype as genotype_phenotype
+import ga4gh.server.datamodel.ontologies as ontologies
+import ga4gh.server.datamodel.rna_quantification as rna_quantification
 import tests.paths as paths
 
 
@@ -70,6 +78,7 @@ class AbstractRepoManagerTest(unittest.TestCase):
 
     def tearDown(self):
         os.unlink(self._repoPath)
+        shutil.rmtree(self._repoPath + ".ontologies", ignore_errors=True)
 
     def readRepo(self):
         repo = datarepo.SqlDataRepository(self._repoPath)
@@ -199,6 +208,60 @@ class TestAddRnaQuantificationSet(AbstractRepoManagerTest):
         self.assertEqual(rnaQuantificationSet.getLocalId(), name)
 
 
+class TestAddRnaQuantifications(AbstractRepoManagerTest):
+
+    def setUp(self):
+        super(TestAddRnaQuantifications, self).setUp()
+        self.init()
+        self.addDataset()
+        self.addReferenceSet()
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+        self._rnaDbPath = os.path.join(self._tempDir, "rnaseq.db")
+        self.runCommand("init-rnaquantificationset {} {}".format(
+            self._repoPath, self._rnaDbPath))
+        self._manifestPath = os.path.join(self._tempDir, "manifest.tsv")
+
+    def tearDown(self):
+        super(TestAddRnaQuantifications, self).tearDown()
+        shutil.rmtree(self._tempDir)
+
+    def addRnaQuantifications(self, names):
+        with open(self._manifestPath, "w") as manifest:
+            for name in names:
+                manifest.write("{}\t{}\n".format(
+                    name, os.path.abspath(paths.rnaQuantificationRsemPath)))
+        self.runCommand(
+            "add-rnaquantifications {} {} rsem {} {} --processes 2".format(
+                self._rnaDbPath, self._manifestPath, self._repoPath,
+                self._datasetName))
+
+    def testAddRnaQuantifications(self):
+        names = ["sample{}".format(i) for i in range(5)]
+        self.addRnaQuantifications(names)
+        rnaQuantificationSet = rna_quantification.SqliteRnaQuantificationSet(
+            datasets.Dataset(self._datasetName), "rnaseq")
+        rnaQuantificationSet.populateFromFile(self._rnaDbPath)
+        self.assertEqual(
+            sorted(rnaQuantification.getLocalId() for rnaQuantification in
+                   rnaQuantificationSet.getRnaQuantifications()), names)
+        for rnaQuantification in \
+                rnaQuantificationSet.getRnaQuantifications():
+            self.assertEqual(
+                len(rnaQuantification.getExpressionLevels()), 2)
+        # loading indexes the rows and leaves the default journal
+        with sqlite3.connect(self._rnaDbPath) as db:
+            self.assertEqual(
+                db.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+            indexes = [row[0] for row in db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'")]
+            self.assertIn("quantification_expression_index", indexes)
+
+    def testAddRnaQuantificationsDuplicateName(self):
+        self.assertRaises(
+            exceptions.DuplicateNameException,
+            self.addRnaQuantifications, ["sample", "sample"])
+
+
 class TestRemoveRnaQuantificationSet(AbstractRepoManagerTest):
 
     def setUp(self):
@@ -251,6 +314,28 @@ class TestAddFeatureSet(AbstractRepoManagerTest):
         # self.assertEqual(featureSet.getInfo(), "TODO")
         # self.assertEqual(featureSet.getSourceUrl(), "TODO")
 
+    def testAddFeatureSetFromGff3(self):
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+        try:
+            dbPath = os.path.join(tempDir, "gencode.db")
+            cmd = (
+                "add-featureset {} {} {} --referenceSetName={} "
+                "--ontologyName={} --featureDbPath={}").format(
+                self._repoPath, self._datasetName, paths.featuresGff3Path,
+                self._referenceSetName, self._ontologyName, dbPath)
+            self.runCommand(cmd)
+            self.assertTrue(os.path.exists(dbPath))
+            self._featureSetName = paths.featureSetName
+            featureSet = self.getFeatureSet()
+            self.assertEqual(featureSet.getDataUrl(), dbPath)
+            features = list(featureSet.getFeatures("chr1", 0, 2**32))
+            self.assertEqual(len(features), 543)
+            # A second import must not overwrite the database.
+            self.assertRaises(
+                exceptions.RepoManagerException, self.runCommand, cmd)
+        finally:
+            shutil.rmtree(tempDir)
+
     def testAddFeatureSetNoReferenceSet(self):
         featuresPath = paths.featuresPath
         cmd = "add-featureset {} {} {} --ontologyName={}".format(
@@ -326,6 +411,36 @@ class TestAddContinuousSet(AbstractRepoManagerTest):
         # self.assertEqual(
         #         continuousSet.getSourceUri(), self._sourceUri)
 
+    def testAddContinuousSetFromWiggle(self):
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+        try:
+            wigglePath = os.path.join(tempDir, "signal.wig")
+            shutil.copyfile(paths.continuousWigglePath, wigglePath)
+            cmd = "add-continuousset {} {} {} --referenceSetName={}".format(
+                self._repoPath, self._datasetName, wigglePath,
+                self._referenceSetName)
+            self.runCommand(cmd)
+            trackPath = os.path.join(tempDir, "signal.ctrack")
+            self.assertTrue(os.path.exists(trackPath))
+            # the references of the reference set are indexed too
+            self.assertEqual(
+                continuous.ContinuousTrack(trackPath).getReferenceNames(),
+                ["chr17", "chr19"])
+            self._continuousSetName = "signal"
+            continuousSet = self.getContinuousSet()
+            self.assertIsInstance(
+                continuousSet, continuous.TrackContinuousSet)
+            self.assertEqual(continuousSet.getDataUrl(), trackPath)
+            objs = list(continuousSet.getContinuous(
+                "chr19", 49304700, 49304705))
+            self.assertEqual(len(objs), 1)
+            self.assertEqual(list(objs[0].values), [10.0] * 5)
+            # A second import must not overwrite the track.
+            self.assertRaises(
+                exceptions.RepoManagerException, self.runCommand, cmd)
+        finally:
+            shutil.rmtree(tempDir)
+
     def testAddContinuousSetNoReferenceSet(self):
         continuousPath = paths.continuousPath
         cmd = "add-continuousset {} {} {}".format(
@@ -398,6 +513,29 @@ class TestAddPhenotypeAssociationSet(AbstractRepoManagerTest):
         with self.assertRaises(exceptions.RepoManagerException):
             self.addPhenotypeAssociationSet()
 
+    def testCompile(self):
+        self.addDataset()
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+        try:
+            for ttlFile in glob.glob(os.path.join(
+                    paths.phenotypeAssociationSetPath, "*.ttl")):
+                shutil.copy(ttlFile, tempDir)
+            self.runCommand(
+                "add-phenotypeassociationset {} {} {} -n compiled -c".format(
+                    self._repoPath, self._datasetName, tempDir))
+            storePath = genotype_phenotype.getRdfStorePath(tempDir)
+            self.assertTrue(os.path.exists(storePath))
+            graph = genotype_phenotype.getRdfGraph(tempDir)
+            self.assertIsInstance(
+                graph.store, genotype_phenotype.SqliteTripleStore)
+            repo = self.readRepo()
+            dataset = repo.getDatasetByName(self._datasetName)
+            phenotypeAssociationSet = \
+                dataset.getPhenotypeAssociationSetByName("compiled")
+            self.assertIs(phenotypeAssociationSet._rdfGraph, graph)
+        finally:
+            shutil.rmtree(tempDir)
+
 
 class TestRemovePhenotypeAssociationSet(AbstractRepoManagerTest):
 
@@ -494,6 +632,34 @@ class TestAddOntology(AbstractRepoManagerTest):
         self.assertEqual(ontology.getName(), name)
         self.assertEqual(ontology.getDataUrl(), os.path.abspath(ontologyFile))
 
+    def testCompiledCache(self):
+        ontologyFile = paths.ontologyPath
+        name = os.path.split(ontologyFile)[1].split(".")[0]
+        self.runCommand("add-ontology {} {}".format(
+            self._repoPath, ontologyFile))
+        repo = self.readRepo()
+        cachePath = repo.getOntologyCachePath(name)
+        self.assertTrue(os.path.exists(cachePath))
+        parsed = ontologies.Ontology(name)
+        parsed.populateFromFile(ontologyFile)
+        with mock.patch.object(ontologies.Ontology, "_readFile") as readFile:
+            repo = self.readRepo()
+            self.assertFalse(readFile.called)
+        cached = repo.getOntologyByName(name)
+        self.assertEqual(cached._nameIdMap, parsed._nameIdMap)
+        self.assertEqual(cached._idNameMap, parsed._idNameMap)
+        self.assertEqual(cached._parentIdsMap, parsed._parentIdsMap)
+        self.assertEqual(cached._sourceVersion, parsed._sourceVersion)
+        self.assertEqual(
+            cached.getOntologyPrefix(), parsed.getOntologyPrefix())
+        # a cache compiled from another version of the file is ignored
+        with mock.patch.object(
+                ontologies.Ontology, "_getSourceKey", return_value=[0, 0]):
+            self.assertFalse(ontologies.Ontology(name)._readCache(cachePath))
+        self.runCommand("remove-ontology {} {} -f".format(
+            self._repoPath, name))
+        self.assertFalse(os.path.exists(cachePath))
+
     def testWithName(self):
         ontologyFile = paths.ontologyPath
         name = "test_name"
@@ -1095,7 +1261,7 @@ class TestInvalidReadGroupSetIndexFile(AbstractRepoManagerTest):
         # index will not be opened during the test; without this line
         # the below tests will succeed when the test class is run but
         # fail when the file's tests are run
-        datamodel.fileHandleCache = datamodel.PysamFileHandleCache()
+        datamodel.fileHandleCache = datamodel.ThreadLocalFileHandleCache()
 
     def setUp(self):
         super(TestInvalidReadGroupSetIndexFile, self).setUp()
@@ -0,0 +1,54 @@
+"""
+Tests the serialized response cache
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import ga4gh.server.response_cache as response_cache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self._cache = response_cache.ResponseCache(maxCacheSize=2)
+
+    def testHitsAndMisses(self):
+        self.assertIsNone(self._cache.get("a"))
+        response = self._cache.put("a", "{}")
+        self.assertEqual(response, "{}")
+        self.assertIs(self._cache.get("a"), response)
+        self.assertEqual(
+            self._cache.getStatistics(), {"hits": 1, "misses": 1, "size": 1})
+
+    def testEtag(self):
+        response = self._cache.put("a", '{"id": "x"}')
+        self.assertEqual(
+            response.etag, response_cache.SerializedResponse(response).etag)
+        self.assertNotEqual(
+            response.etag, self._cache.put("b", '{"id": "y"}').etag)
+
+    def testLeastRecentlyUsedIsEvicted(self):
+        self._cache.put("a", "1")
+        self._cache.put("b", "2")
+        self._cache.get("a")
+        self._cache.put("c", "3")
+        self.assertIsNone(self._cache.get("b"))
+        self.assertEqual(self._cache.get("a"), "1")
+        self.assertEqual(self._cache.get("c"), "3")
+
+    def testDisabled(self):
+        self._cache.setMaxCacheSize(0)
+        self.assertIsNotNone(self._cache.put("a", "1").etag)
+        self.assertIsNone(self._cache.get("a"))
+        self.assertRaises(ValueError, self._cache.setMaxCacheSize, -1)
+
+    def testClear(self):
+        self._cache.put("a", "1")
+        self._cache.get("a")
+        self._cache.clear()
+        self.assertEqual(
+            self._cache.getStatistics(), {"hits": 0, "misses": 0, "size": 0})
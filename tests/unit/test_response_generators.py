@@ -167,6 +167,48 @@ class TestReadsGenerator(unittest.TestCase):
         self.request.read_group_ids.extend([readGroup.getId()])
 
 
+class MockFeatureSet(object):
+    """
+    Yields empty features, recording how many have been drawn.
+    """
+    def __init__(self, numFeatures):
+        self.numFeatures = numFeatures
+        self.numYielded = 0
+
+    def getFeatures(self, *args, **kwargs):
+        for _ in range(self.numFeatures):
+            self.numYielded += 1
+            yield protocol.Feature()
+
+
+class TestFeaturesIterator(unittest.TestCase):
+    """
+    Tests that feature pages are streamed from the feature set
+    """
+    def setUp(self):
+        self.request = protocol.SearchFeaturesRequest()
+        self.request.page_size = 100
+
+    def testPageTokens(self):
+        featureSet = MockFeatureSet(3)
+        iterator = paging.FeaturesIterator(self.request, featureSet, None)
+        tokens = [token for _, token in iterator]
+        self.assertEqual(tokens, ["1", "2", None])
+        self.request.page_size = 2
+        featureSet = MockFeatureSet(3)
+        iterator = paging.FeaturesIterator(self.request, featureSet, None)
+        tokens = [token for _, token in iterator]
+        self.assertEqual(tokens, ["1", "2"])
+
+    def testStopsReadingWhenConsumerStops(self):
+        featureSet = MockFeatureSet(1000)
+        iterator = paging.FeaturesIterator(self.request, featureSet, None)
+        for _ in range(3):
+            next(iterator)
+        # one feature of look-ahead beyond those consumed
+        self.assertEqual(featureSet.numYielded, 4)
+
+
 class TestVariantsIntervalIteratorClassMethods(unittest.TestCase):
     """
     Test the variants interval iterator class methods
@@ -7,10 +7,19 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
 import unittest
 
+import ga4gh.server.datamodel as datamodel
 import ga4gh.server.datamodel.sequence_annotations as sequence_annotations
 import ga4gh.server.datamodel.datasets as datasets
+import ga4gh.server.gff3 as gff3
+import ga4gh.server.sqlite_backend as sqlite_backend
+import tests.paths as paths
 
 
 class TestAbstractFeatureSet(unittest.TestCase):
@@ -26,3 +35,140 @@ class TestAbstractFeatureSet(unittest.TestCase):
     def testGetFeatureIdFailsWithNullInput(self):
         self.assertEqual("",
                          self._featureSet.getCompoundIdForFeatureId(None))
+
+    def testGetFeatureIdMatchesCompoundId(self):
+        for featureId in [1, 42, "abc"]:
+            compoundId = datamodel.FeatureCompoundId(
+                self._featureSet.getCompoundId(), str(featureId))
+            self.assertEqual(
+                str(compoundId),
+                self._featureSet.getCompoundIdForFeatureId(featureId))
+
+
+class TestGff3DbImporter(unittest.TestCase):
+    """
+    Tests the streaming conversion of GFF3 files into feature databases.
+    """
+    def setUp(self):
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_gff3_test")
+        self._dbPath = os.path.join(self._tempDir, "features.db")
+
+    def tearDown(self):
+        shutil.rmtree(self._tempDir)
+
+    def _import(self, gff3Path, batchSize=10000):
+        importer = sequence_annotations.Gff3DbImporter(
+            gff3Path, self._dbPath, batchSize)
+        return importer.run()
+
+    def _getRows(self):
+        dbconn = sqlite3.connect(self._dbPath)
+        dbconn.row_factory = sqlite3.Row
+        rows = sqlite_backend.sqliteRowsToDicts(
+            dbconn.execute("SELECT * FROM FEATURE").fetchall())
+        dbconn.close()
+        return dict((row['id'], row) for row in rows)
+
+    def testImportMatchesParsedLinks(self):
+        gff3Data = gff3.Gff3Parser(paths.featuresGff3Path).parse()
+        numFeatures = self._import(paths.featuresGff3Path, batchSize=7)
+        rows = self._getRows()
+        self.assertEqual(numFeatures, len(rows))
+        namesById = dict((id_, row['name']) for id_, row in rows.items())
+        for row in rows.values():
+            features = gff3Data.byFeatureName[row['name']]
+            self.assertGreater(len(features), 0)
+            feature = features[0]
+            childNames = sorted(
+                namesById[childId]
+                for childId in json.loads(row['child_ids']))
+            self.assertEqual(
+                childNames,
+                sorted(child.featureName for child in feature.children))
+            if len(feature.parents) == 0:
+                self.assertEqual(row['parent_id'], '')
+            else:
+                self.assertIn(
+                    namesById[row['parent_id']],
+                    [parent.featureName for parent in feature.parents])
+
+    def testMissingParentRaises(self):
+        gff3Path = os.path.join(self._tempDir, "orphan.gff3")
+        with open(gff3Path, "w") as gff3File:
+            gff3File.write(gff3.GFF3_HEADER + "\n")
+            gff3File.write(
+                "chr1\ttest\texon\t1\t10\t.\t+\t.\t"
+                "ID=exon1;Parent=missing\n")
+        with self.assertRaises(gff3.GFF3Exception):
+            self._import(gff3Path)
+        self.assertFalse(os.path.exists(self._dbPath))
+
+    def testImportedDbIsServed(self):
+        self._import(paths.featuresGff3Path)
+        backend = sequence_annotations.Gff3DbBackend(self._dbPath)
+        with backend as dataSource:
+            features = dataSource.searchFeaturesInDb(
+                referenceName="chr1", start=0, end=2**32)
+            self.assertEqual(len(features), 543)
+            indexes = [
+                row[1] for row in dataSource._dbconn.execute(
+                    "PRAGMA INDEX_LIST('FEATURE')")]
+            self.assertIn("idx1", indexes)
+
+    def testPrefixSearch(self):
+        self._import(paths.featuresGff3Path)
+        rows = self._getRows().values()
+        backend = sequence_annotations.Gff3DbBackend(self._dbPath)
+        with backend as dataSource:
+            features = dataSource.searchFeaturesInDb(
+                geneSymbol="ddx11", prefix=True)
+            self.assertGreater(len(features), 0)
+            self.assertEqual(
+                sorted(feature['id'] for feature in features),
+                sorted(
+                    row['id'] for row in rows
+                    if (row['gene_name'] or '').lower().startswith('ddx11')))
+            self.assertEqual(
+                [], dataSource.searchFeaturesInDb(geneSymbol="ddx11"))
+            # name prefixes do not match transcript names
+            features = dataSource.searchFeaturesInDb(
+                name="EnsT00000456", prefix=True)
+            self.assertEqual(
+                sorted(feature['id'] for feature in features),
+                sorted(
+                    row['id'] for row in rows
+                    if row['name'].lower().startswith('enst00000456')))
+            sql, args = dataSource.featuresQuery(
+                geneSymbol="ddx11", prefix=True)
+            plan = " ".join(
+                row[-1] for row in dataSource._dbconn.execute(
+                    "EXPLAIN QUERY PLAN " + sql, args))
+            self.assertIn("gene_name_lower_index", plan)
+
+    def testPrefixSearchLiteralNames(self):
+        self._import(paths.featuresGff3Path)
+        featureId = min(self._getRows())
+        dbconn = sqlite3.connect(self._dbPath)
+        dbconn.execute(
+            "UPDATE FEATURE SET name = ? WHERE id = ?",
+            ("\u00c9mile*", featureId))
+        dbconn.commit()
+        dbconn.close()
+        backend = sequence_annotations.Gff3DbBackend(self._dbPath)
+        with backend as dataSource:
+            # a trailing '*' is part of the name unless prefix is set
+            for name in ["\u00c9mile*", "\u00c9MILE", "\u00c9mile**"]:
+                features = dataSource.searchFeaturesInDb(name=name)
+                self.assertEqual(
+                    [feature['id'] for feature in features],
+                    [featureId] if name == "\u00c9mile*" else [])
+            # only ASCII letters are folded, as by SQLite's lower()
+            for name in ["\u00c9MI", "\u00c9mile*", ""]:
+                features = dataSource.searchFeaturesInDb(
+                    name=name, prefix=True)
+                self.assertIn(featureId, [
+                    feature['id'] for feature in features])
+            for name in ["\u00e9mi", "\u00c9mile**"]:
+                features = dataSource.searchFeaturesInDb(
+                    name=name, prefix=True)
+                self.assertEqual([], features)
@@ -59,8 +59,8 @@ class TestSqlBackend(unittest.TestCase):
         zeroArgs = sqlite_backend.limitsSql(0, 0)
         self.assertEqual(noArgs, zeroArgs)
 
-        with self.assertRaises(Exception):
-            sqlite_backend.limitsSql(startIndex=5)
+        limit = sqlite_backend.limitsSql(startIndex=5)
+        self.assertEqual(limit, " LIMIT 5, -1")
 
         limit = sqlite_backend.limitsSql(startIndex=1, maxResults=2)
         self.assertEqual(limit, " LIMIT 1, 2")
@@ -10,6 +10,7 @@ import hashlib
 import unittest
 
 import ga4gh.server.datarepo as datarepo
+import ga4gh.server.paging as paging
 import ga4gh.server.datamodel.variants as variants
 import ga4gh.server.datamodel.datasets as datasets
 
@@ -103,3 +104,16 @@ class TestHtslibVariantAnnotationSet(unittest.TestCase):
         expected = hashlib.md5("\t\t[]\t").hexdigest()
         hashed = self._variantAnnotationSet.getTranscriptEffectId(effect)
         self.assertEqual(hashed, expected)
+
+    def testFilterEffectByParentTerm(self):
+        request = protocol.SearchVariantAnnotationsRequest()
+        # a reference without annotations, so only the filter is exercised
+        request.reference_name = "2"
+        request.effects.add().term_id = "SO:0001818"  # protein_altering
+        iterator = paging.VariantAnnotationsIntervalIterator(
+            request, self._variantAnnotationSet)
+        transcriptEffect = protocol.TranscriptEffect()
+        transcriptEffect.effects.add().term_id = "SO:0001627"  # intron
+        self.assertFalse(iterator.filterEffect(transcriptEffect))
+        transcriptEffect.effects.add().term_id = "SO:0001583"  # missense
+        self.assertTrue(iterator.filterEffect(transcriptEffect))
@@ -5,8 +5,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
+import math
 import unittest
 import logging
+import zlib
 
 import tests.paths as paths
 
@@ -322,6 +325,16 @@ class TestFrontend(unittest.TestCase):
         self.verifySearchRouting('/variantsets/search', True)
         self.verifySearchRouting('/variants/search', False)
 
+    def testIsBulkDataPath(self):
+        for path in [
+                "/reads/search", "/variants/search/", "/features/search?x=1",
+                "/rnaquantificationsets/abc/expressionmatrix"]:
+            self.assertTrue(frontend.isBulkDataPath(path))
+        for path in ["/", "/datasets/search", "/variantsets/abc", ""]:
+            self.assertFalse(frontend.isBulkDataPath(path))
+        for path in frontend.BULK_DATA_PATHS:
+            self.assertIn(("POST", path), frontend.app.urls)
+
     def testRouteIndex(self):
         path = "/"
         response = self.app.get(path)
@@ -359,6 +372,187 @@ class TestFrontend(unittest.TestCase):
         response = self.sendGetDataset(str(compoundId))
         self.assertEqual(404, response.status_code)
 
+    def testGetNotModified(self):
+        path = "/datasets/{}".format(self.datasetId)
+        response = self.sendGetRequest(path)
+        self.assertEqual(200, response.status_code)
+        etag = response.headers["ETag"]
+        response = self.app.get(path, headers={"If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual("", response.data)
+        self.assertEqual(etag, response.headers["ETag"])
+        response = self.app.get(path, headers={"If-None-Match": '"other"'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(etag, response.headers["ETag"])
+
+    def testSearchNotModified(self):
+        response = self.sendDatasetsSearch()
+        self.assertEqual(200, response.status_code)
+        etag = response.headers["ETag"]
+        response = self.app.post(
+            "/datasets/search", data="{}",
+            headers={"Content-type": "application/json",
+                     "If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+        # Bulk data searches are neither cached nor tagged
+        response = self.sendVariantsSearch()
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn("ETag", response.headers)
+
+    def testCompression(self):
+        path = "/datasets/{}".format(self.datasetId)
+        identity = self.sendGetRequest(path)
+        self.assertNotIn("Content-Encoding", identity.headers)
+        self.assertEqual("Accept-Encoding", identity.headers["Vary"])
+        minSize = frontend.app.config["RESPONSE_COMPRESSION_MIN_SIZE"]
+        frontend.app.config["RESPONSE_COMPRESSION_MIN_SIZE"] = 0
+        try:
+            response = self.app.get(
+                path, headers={"Accept-Encoding": "gzip;q=0.5, br"})
+            self.assertEqual("gzip", response.headers["Content-Encoding"])
+            self.assertEqual(
+                zlib.decompress(response.data, zlib.MAX_WBITS | 16),
+                identity.data)
+            etag = response.headers["ETag"]
+            self.assertEqual(etag, identity.headers["ETag"][:-1] + '-gzip"')
+            response = self.app.get(path, headers={"If-None-Match": etag})
+            self.assertEqual(304, response.status_code)
+            # gzip is refused
+            response = self.app.get(
+                path, headers={"Accept-Encoding": "gzip;q=0, br"})
+            self.assertNotIn("Content-Encoding", response.headers)
+        finally:
+            frontend.app.config["RESPONSE_COMPRESSION_MIN_SIZE"] = minSize
+
+    def sendBatchRequest(self, batch):
+        return self.app.post(
+            '/batch', data=json.dumps(batch),
+            headers={'Content-type': 'application/json'})
+
+    def testBatch(self):
+        variantsRequest = {
+            'variantSetId': self.variantSetId, 'referenceName': '1',
+            'start': 0, 'end': 1}
+        datasetPath = "/datasets/{}".format(self.datasetId)
+        response = self.sendBatchRequest({'requests': [
+            {'path': '/variants/search', 'body': variantsRequest},
+            {'method': 'GET', 'path': datasetPath},
+            {'method': 'GET', 'path': '/datasets/notAnId'},
+            {'method': 'POST', 'path': datasetPath},
+            {'path': '/doesNotExist'},
+            {'method': 'GET', 'path': '/'},
+            {'path': '/batch', 'body': {'requests': []}},
+        ]})
+        self.assertEqual(200, response.status_code)
+        responses = json.loads(response.data)['responses']
+        self.assertEqual(
+            [200, 200, 404, 405, 404, 404, 404],
+            [subResponse['status'] for subResponse in responses])
+        self.assertEqual(
+            json.loads(self.sendVariantsSearch().data), responses[0]['body'])
+        self.assertEqual(
+            json.loads(self.sendGetRequest(datasetPath).data),
+            responses[1]['body'])
+        for subResponse in responses[2:]:
+            protocol.fromJson(
+                json.dumps(subResponse['body']), protocol.GAException)
+
+    def testBadBatch(self):
+        response = self.sendBatchRequest({'requests': []})
+        self.assertEqual({'responses': []}, json.loads(response.data))
+        maxRequests = frontend.app.config['BATCH_MAX_REQUESTS']
+        for batch in [
+                [], {}, {'requests': [{'method': 'GET'}]},
+                {'requests': [{'method': 'PUT', 'path': '/datasets/a'}]},
+                {'requests': [{'path': '/datasets/search'}] * (
+                    maxRequests + 1)}]:
+            response = self.sendBatchRequest(batch)
+            self.assertEqual(400, response.status_code)
+        response = self.app.post('/batch', data='{',
+                                 content_type='application/json')
+        self.assertEqual(400, response.status_code)
+
+    def sendVariantsExport(self, pageToken=""):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 100
+        request.page_token = pageToken
+        return self.sendPostRequest('/variants/export', request)
+
+    def testExport(self):
+        # The export holds the same variants as the search pages
+        variants = []
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 100
+        request.page_size = 7
+        while True:
+            response = self.sendPostRequest('/variants/search', request)
+            page = protocol.fromJson(
+                response.data, protocol.SearchVariantsResponse)
+            variants.extend(page.variants)
+            if not page.next_page_token:
+                break
+            request.page_token = page.next_page_token
+        self.assertGreater(len(variants), 7)
+        response = self.sendVariantsExport()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(frontend.EXPORT_MIMETYPE, response.mimetype)
+        lines = response.data.splitlines()
+        self.assertEqual({"nextPageToken": ""}, json.loads(lines[-1]))
+        self.assertEqual(
+            variants, [
+                protocol.fromJson(line, protocol.Variant)
+                for line in lines[:-1]])
+
+    def testExportResumes(self):
+        self.backend.setExportCheckpointInterval(5)
+        try:
+            lines = self.sendVariantsExport().data.splitlines()
+        finally:
+            self.backend.setExportCheckpointInterval(
+                frontend.app.config["EXPORT_CHECKPOINT_INTERVAL"])
+        checkpoint = json.loads(lines[5])
+        self.assertEqual(["nextPageToken"], checkpoint.keys())
+        resumed = self.sendVariantsExport(checkpoint["nextPageToken"])
+        self.assertEqual(
+            [line for line in lines[6:] if "nextPageToken" not in line],
+            resumed.data.splitlines()[:-1])
+
+    def testExportErrors(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = "notAnId"
+        response = self.sendPostRequest('/variants/export', request)
+        self.assertEqual(404, response.status_code)
+        protocol.fromJson(response.data, protocol.GAException)
+        response = self.app.get('/variants/export')
+        self.assertEqual(405, response.status_code)
+        response = self.sendBatchRequest({'requests': [{
+            'path': '/variants/export',
+            'body': {'variantSetId': self.variantSetId}}]})
+        self.assertEqual(
+            404, json.loads(response.data)['responses'][0]['status'])
+
+    def testExportCompression(self):
+        identity = self.sendVariantsExport()
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 100
+        response = self.app.post(
+            '/variants/export', data=protocol.toJson(request),
+            headers={"Content-type": "application/json",
+                     "Accept-Encoding": "gzip"})
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertEqual(
+            identity.data,
+            zlib.decompress(response.data, zlib.MAX_WBITS | 16))
+
     def testGetVariantSet(self):
         response = self.sendVariantSetsSearch()
         responseData = protocol.fromJson(
@@ -464,6 +658,27 @@ class TestFrontend(unittest.TestCase):
             protocol.RnaQuantificationSet,
             self.rnaQuantificationSetId)
 
+    def testGetExpressionMatrix(self):
+        names = [self.expressionLevel.getName(), "noSuchName"]
+        path = "/rnaquantificationsets/{}/expressionmatrix?{}".format(
+            self.rnaQuantificationSetId,
+            "&".join("name=" + name for name in names))
+        response = self.sendGetRequest(path)
+        self.assertEqual(200, response.status_code)
+        matrix = json.loads(response.data)
+        rnaQuantifications = \
+            self.rnaQuantificationSet.getRnaQuantifications()
+        self.assertEqual(
+            matrix["rnaQuantificationIds"],
+            [rnaQuantification.getId()
+             for rnaQuantification in rnaQuantifications])
+        self.assertEqual(matrix["names"], names)
+        self.assertEqual(
+            matrix["values"],
+            [[None if math.isnan(value) else value for value in row]
+             for row in self.rnaQuantificationSet.getExpressionMatrix(
+                names).tolist()])
+
     def searchObjectTest(
             self, responseMethod, responseClass, attributeName, objectId):
         response = responseMethod()